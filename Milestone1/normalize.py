@@ -9,13 +9,19 @@ Outputs (written to milestone1_output/):
  - borrower.csv       (card_no,ssn,bname,address,phone)
  - bad_books_rows.csv (original book rows missing both isbn10 and isbn13)
  - normalization_log.txt
+
+Input is streamed in chunks; pass --workers N to normalize the chunks across
+N processes (output is byte-identical to the default in-process run).
 """
 
+import argparse
 import csv
 import os
 import re
 import unicodedata
-from collections import OrderedDict
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain, islice
 
 # ---------- Config ----------
 INPUT_BOOKS = "books.csv"
@@ -23,6 +29,20 @@ INPUT_BORROWERS = "borrowers.csv"
 OUTPUT_DIR = "milestone1_output"
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
+# Rows per work unit in streaming mode (--workers)
+DEFAULT_CHUNK_SIZE = 5000
+
+# ---------- Precompiled patterns ----------
+ZERO_WIDTH_RE = re.compile(r'[\u200b\u200c\u200d]')
+WHITESPACE_RE = re.compile(r'\s+')
+BY_PREFIX_RE = re.compile(r'^(by\s+)', flags=re.I)
+NON_DIGIT_RE = re.compile(r'\D')
+NON_ISBN_RE = re.compile(r'[^0-9Xx]')
+AMPERSAND_RE = re.compile(r'\s+&\s+')
+AND_RE = re.compile(r'\s+and\s+', flags=re.I)
+URL_RE = re.compile(r'http[s]?://')
+NUMERIC_NOISE_RE = re.compile(r'^\d{3,}$')
+
 # ---------- Text normalization helpers ----------
 def normalize_text(value):
     """Trim, normalize, remove common invisible chars, collapse whitespace."""
@@ -31,9 +51,11 @@ def normalize_text(value):
     if not isinstance(value, str):
         value = str(value)
     v = value.strip()
-    v = unicodedata.normalize("NFC", v)
-    v = re.sub(r'[\u200b\u200c\u200d]', '', v)
-    v = re.sub(r'\s+', ' ', v)
+    # ASCII text is already NFC and cannot contain zero-width characters
+    if not v.isascii():
+        v = unicodedata.normalize("NFC", v)
+        v = ZERO_WIDTH_RE.sub('', v)
+    v = WHITESPACE_RE.sub(' ', v)
     return v
 
 def normalize_title(raw):
@@ -46,7 +68,7 @@ def normalize_person_name(raw):
     raw = normalize_text(raw)
     if raw == "":
         return ""
-    raw = re.sub(r'^(by\s+)', '', raw, flags=re.I)
+    raw = BY_PREFIX_RE.sub('', raw)
     raw = raw.strip(", ")
     s = raw.title()
     parts = s.split()
@@ -57,7 +79,7 @@ def normalize_person_name(raw):
 
 def normalize_ssn(raw):
     raw = normalize_text(raw)
-    digits = re.sub(r'\D', '', raw)
+    digits = NON_DIGIT_RE.sub('', raw)
     if len(digits) == 9:
         return f"{digits[0:3]}-{digits[3:5]}-{digits[5:9]}"
     return ""
@@ -68,7 +90,7 @@ def clean_isbn(raw):
     if raw is None:
         return ""
     s = normalize_text(raw)
-    s = re.sub(r'[^0-9Xx]', '', s)
+    s = NON_ISBN_RE.sub('', s)
     return s
 
 def split_author_field(raw):
@@ -80,15 +102,15 @@ def split_author_field(raw):
     raw = normalize_text(raw)
     if raw == "":
         return []
-    raw = re.sub(r'\s+&\s+', ',', raw)
-    raw = re.sub(r'\s+and\s+', ',', raw, flags=re.I)
+    raw = AMPERSAND_RE.sub(',', raw)
+    raw = AND_RE.sub(',', raw)
     raw = raw.replace(';', ',')
     parts = [p.strip() for p in raw.split(',') if p.strip()]
     out = []
     for p in parts:
-        if re.search(r'http[s]?://', p):
+        if URL_RE.search(p):
             continue
-        if re.match(r'^\d{3,}$', re.sub(r'\D', '', p)):
+        if NUMERIC_NOISE_RE.match(NON_DIGIT_RE.sub('', p)):
             continue
         out.append(p)
     return out
@@ -107,17 +129,6 @@ def detect_delimiter(path, sample_lines=20):
     # return the delimiter with max count (tie favors comma)
     return max(counts, key=counts.get)
 
-def read_csv_rows(path):
-    """Return (headers_list, rows_as_dicts, detected_delimiter)."""
-    if not os.path.exists(path):
-        raise FileNotFoundError(path)
-    delim = detect_delimiter(path)
-    with open(path, "r", encoding="utf-8", errors="replace", newline='') as f:
-        reader = csv.DictReader(f, delimiter=delim)
-        headers = reader.fieldnames or []
-        rows = [r for r in reader]
-    return headers, rows, delim
-
 # ---------- Column detection  ----------
 def detect_book_columns(headers, rows):
     """
@@ -212,17 +223,169 @@ def detect_borrower_mapping(headers):
 
     return mapping
 
+# ---------- Per-row normalization ----------
+def normalize_book_row(r, book_headers, book_cols):
+    """
+    Normalize one raw book row.
+    Returns ((isbn_primary, isbn10, isbn13, title), author_names), or None when
+    no ISBN can be found anywhere in the row. author_names are normalized, in
+    field order, and empty when the row has no usable author.
+    """
+    isbn10_col, isbn13_col, title_col, authors_col = book_cols
+
+    raw10 = r.get(isbn10_col, "") if isbn10_col else ""
+    raw13 = r.get(isbn13_col, "") if isbn13_col else ""
+    clean10 = clean_isbn(raw10)
+    clean13 = clean_isbn(raw13)
+
+    valid10 = (len(clean10) == 10)
+    valid13 = (len(clean13) == 13)
+
+    # attempt to find isbn in other columns if necessary
+    if not valid10 and not valid13:
+        found = False
+        for h in book_headers:
+            cand = clean_isbn(r.get(h, ""))
+            if len(cand) in (10, 13):
+                if len(cand) == 13:
+                    clean13 = cand; valid13 = True
+                else:
+                    clean10 = cand; valid10 = True
+                found = True
+                break
+        if not found:
+            return None
+
+    # primary selection: prefer isbn13 when valid
+    if valid13:
+        primary_isbn = clean13
+    elif valid10:
+        primary_isbn = clean10
+    else:
+        primary_isbn = clean13 or clean10 or ""
+
+    # Title
+    title_raw = r.get(title_col, "") if title_col else ""
+    if title_raw == "":
+        for h in book_headers:
+            if h not in (isbn10_col, isbn13_col) and r.get(h, "").strip():
+                title_raw = r.get(h, "")
+                break
+    title = normalize_title(title_raw)
+
+    # Authors
+    authors_field = r.get(authors_col, "") if authors_col else ""
+    if not authors_field:
+        for h in book_headers:
+            v = r.get(h, "")
+            if ',' in v and len(v) < 200:
+                authors_field = v
+                break
+
+    author_names = [normalize_person_name(a) for a in split_author_field(authors_field)]
+    return (primary_isbn, clean10, clean13, title), author_names
+
+def normalize_borrower_row(r, borrower_map):
+    """Return (card, ssn, bname, address, phone), or None if the row is unusable."""
+    card = normalize_text(r.get(borrower_map['card_id'], ""))
+    ssn = normalize_ssn(r.get(borrower_map['ssn'], ""))
+    if 'first_name' in r and 'last_name' in r:
+        bname = normalize_person_name((r.get('first_name','') + " " + r.get('last_name','')).strip())
+    else:
+        bname = normalize_person_name(r.get(borrower_map['bname'], "")) if borrower_map['bname'] else ""
+    addr = normalize_text(r.get(borrower_map['address'], "")) if borrower_map['address'] else ""
+    phone = normalize_text(r.get(borrower_map['phone'], "")) if borrower_map['phone'] else ""
+    if card == "" and bname == "":
+        return None
+    if not ssn or not bname or not addr:
+        return None
+    return (card, ssn, bname, addr, phone)
+
+# ---------- Chunked (optionally parallel) processing ----------
+def normalize_book_chunk(task):
+    """Worker: normalize a chunk of book rows.
+    Returns a list with (book_tuple, author_names) per good row and
+    (None, original_values) per row without an ISBN, in input order."""
+    rows, book_headers, book_cols = task
+    out = []
+    for r in rows:
+        result = normalize_book_row(r, book_headers, book_cols)
+        if result is None:
+            out.append((None, [r.get(h, "") for h in book_headers]))
+        else:
+            out.append(result)
+    return out
+
+def normalize_borrower_chunk(task):
+    """Worker: normalize a chunk of borrower rows, dropping unusable ones."""
+    rows, borrower_map = task
+    out = []
+    for r in rows:
+        result = normalize_borrower_row(r, borrower_map)
+        if result is not None:
+            out.append(result)
+    return out
+
+def open_csv_stream(f, path, sample_size=200):
+    """
+    Start streaming an already-opened CSV file.
+    Returns (headers, sample_rows, all_rows_iterator, delimiter); the iterator
+    yields the sample rows first, then the rest of the file.
+    """
+    delim = detect_delimiter(path)
+    reader = csv.DictReader(f, delimiter=delim)
+    headers = reader.fieldnames or []
+    sample = list(islice(reader, sample_size))
+    return headers, sample, chain(sample, reader), delim
+
+def iter_chunks(rows, chunk_size):
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+def map_in_order(fn, tasks, pool, max_pending):
+    """Like map(fn, tasks), optionally on a process pool, yielding results in
+    task order with at most max_pending tasks (and their rows) in flight."""
+    if pool is None:
+        for task in tasks:
+            yield fn(task)
+        return
+    pending = deque()
+    for task in tasks:
+        pending.append(pool.submit(fn, task))
+        if len(pending) >= max_pending:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
 # ---------- Main normalization logic ----------
-def normalize_and_write():
-    book_headers, book_rows, books_delim = read_csv_rows(INPUT_BOOKS)
-    borrower_headers, borrower_rows, borrowers_delim = read_csv_rows(INPUT_BORROWERS)
+def normalize_and_write(workers=0, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Normalize INPUT_BOOKS and INPUT_BORROWERS into OUTPUT_DIR.
 
-    isbn10_col, isbn13_col, title_col, authors_col = detect_book_columns(book_headers, book_rows)
+    Input is streamed in chunks of chunk_size rows and outputs are written as
+    each chunk completes. With workers > 0 the chunks are normalized across a
+    process pool; author IDs are still assigned in the parent in input order,
+    so the output is byte-identical to a serial run.
+    """
+    for path in (INPUT_BOOKS, INPUT_BORROWERS):
+        if not os.path.exists(path):
+            raise FileNotFoundError(path)
+
+    book_path = os.path.join(OUTPUT_DIR, "book.csv")
+    authors_path = os.path.join(OUTPUT_DIR, "authors.csv")
+    book_authors_path = os.path.join(OUTPUT_DIR, "book_authors.csv")
+    borrower_path = os.path.join(OUTPUT_DIR, "borrower.csv")
+    bad_books_path = os.path.join(OUTPUT_DIR, "bad_books_rows.csv")
+    log_path = os.path.join(OUTPUT_DIR, "normalization_log.txt")
 
-    books_out = []              # (isbn_primary, isbn10, isbn13, title)
     authors_map = OrderedDict() # name -> author_id (string)
-    book_authors_out = []       # (isbn_primary, author_id_or_empty)
-    bad_book_rows = []
+    book_row_count = 0
+    books_out_count = 0
+    book_authors_count = 0
+    bad_book_count = 0
 
     next_author_id = 1
     def get_author_id(name):
@@ -234,126 +397,67 @@ def normalize_and_write():
         next_author_id += 1
         return aid
 
-    # Process book rows
-    for r in book_rows:
-        raw10 = r.get(isbn10_col, "") if isbn10_col else ""
-        raw13 = r.get(isbn13_col, "") if isbn13_col else ""
-        clean10 = clean_isbn(raw10)
-        clean13 = clean_isbn(raw13)
-
-        valid10 = (len(clean10) == 10)
-        valid13 = (len(clean13) == 13)
-
-        # attempt to find isbn in other columns if necessary
-        if not valid10 and not valid13:
-            found = False
-            for h in book_headers:
-                cand = clean_isbn(r.get(h, ""))
-                if len(cand) in (10, 13):
-                    if len(cand) == 13:
-                        clean13 = cand; valid13 = True
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 0 else None
+    max_pending = max(1, workers) * 2
+    try:
+        # ---------- Books ----------
+        with open(INPUT_BOOKS, "r", encoding="utf-8", errors="replace", newline='') as books_in, \
+             open(book_path, "w", encoding="utf-8", newline='') as book_f, \
+             open(book_authors_path, "w", encoding="utf-8", newline='') as book_authors_f, \
+             open(bad_books_path, "w", encoding="utf-8", newline='') as bad_books_f:
+            book_headers, book_sample, book_rows, books_delim = open_csv_stream(books_in, INPUT_BOOKS)
+            book_cols = detect_book_columns(book_headers, book_sample)
+
+            book_w = csv.writer(book_f)
+            book_w.writerow(["isbn_primary", "isbn10", "isbn13", "title"])
+            book_authors_w = csv.writer(book_authors_f)
+            book_authors_w.writerow(["isbn_primary", "author_id"])
+            bad_books_w = csv.writer(bad_books_f)
+            bad_books_w.writerow(book_headers)
+
+            tasks = ((chunk, book_headers, book_cols) for chunk in iter_chunks(book_rows, chunk_size))
+            for results in map_in_order(normalize_book_chunk, tasks, pool, max_pending):
+                for book, authors in results:
+                    book_row_count += 1
+                    if book is None:
+                        bad_books_w.writerow(authors)
+                        bad_book_count += 1
+                        continue
+                    book_w.writerow(book)
+                    books_out_count += 1
+                    primary_isbn = book[0]
+                    if not authors:
+                        # preserve missing-author state explicitly using an empty author_id
+                        book_authors_w.writerow((primary_isbn, ""))
+                        book_authors_count += 1
                     else:
-                        clean10 = cand; valid10 = True
-                    found = True
-                    break
-            if not found:
-                bad_book_rows.append([r.get(h, "") for h in book_headers])
-                continue
-
-        # primary selection: prefer isbn13 when valid
-        if valid13:
-            primary_isbn = clean13
-        elif valid10:
-            primary_isbn = clean10
-        else:
-            primary_isbn = clean13 or clean10 or ""
-
-        # Title
-        title_raw = r.get(title_col, "") if title_col else ""
-        if title_raw == "":
-            for h in book_headers:
-                if h not in (isbn10_col, isbn13_col) and r.get(h, "").strip():
-                    title_raw = r.get(h, "")
-                    break
-        title = normalize_title(title_raw)
-
-        books_out.append((primary_isbn, clean10, clean13, title))
-
-        # Authors
-        authors_field = r.get(authors_col, "") if authors_col else ""
-        if not authors_field:
-            for h in book_headers:
-                v = r.get(h, "")
-                if ',' in v and len(v) < 200:
-                    authors_field = v
-                    break
+                        for a_norm in authors:
+                            book_authors_w.writerow((primary_isbn, get_author_id(a_norm)))
+                            book_authors_count += 1
+
+        # ---------- Borrowers ----------
+        with open(INPUT_BORROWERS, "r", encoding="utf-8", errors="replace", newline='') as borrowers_in, \
+             open(borrower_path, "w", encoding="utf-8", newline='') as borrower_f:
+            borrower_headers, _, borrower_rows, borrowers_delim = open_csv_stream(borrowers_in, INPUT_BORROWERS)
+            borrower_map = detect_borrower_mapping(borrower_headers)
+
+            borrower_w = csv.writer(borrower_f)
+            borrower_w.writerow(["card_no", "ssn", "bname", "address", "phone"])
+            tasks = ((chunk, borrower_map) for chunk in iter_chunks(borrower_rows, chunk_size))
+            for results in map_in_order(normalize_borrower_chunk, tasks, pool, max_pending):
+                for row in results:
+                    borrower_w.writerow(row)
+    finally:
+        if pool is not None:
+            pool.shutdown()
 
-        parsed_authors = split_author_field(authors_field)
-        if not parsed_authors:
-            # preserve missing-author state explicitly using an empty author_id
-            book_authors_out.append((primary_isbn, ""))
-        else:
-            for a in parsed_authors:
-                a_norm = normalize_person_name(a)
-                aid = get_author_id(a_norm)
-                book_authors_out.append((primary_isbn, aid))
-
-    # Process borrowers
-    borrower_map = detect_borrower_mapping(borrower_headers)
-    borrowers_out = []
-    for r in borrower_rows:
-        card = normalize_text(r.get(borrower_map['card_id'], ""))
-        ssn = normalize_ssn(r.get(borrower_map['ssn'], ""))
-        if 'first_name' in r and 'last_name' in r:
-            bname = normalize_person_name((r.get('first_name','') + " " + r.get('last_name','')).strip())
-        else:
-            bname = normalize_person_name(r.get(borrower_map['bname'], "")) if borrower_map['bname'] else ""
-        addr = normalize_text(r.get(borrower_map['address'], "")) if borrower_map['address'] else ""
-        phone = normalize_text(r.get(borrower_map['phone'], "")) if borrower_map['phone'] else ""
-        if card == "" and bname == "":
-            continue
-        if not ssn or not bname or not addr:
-            continue
-
-        borrowers_out.append((card, ssn, bname, addr, phone))
     # ---------- Write CSV outputs ----------
-    book_path = os.path.join(OUTPUT_DIR, "book.csv")
-    authors_path = os.path.join(OUTPUT_DIR, "authors.csv")
-    book_authors_path = os.path.join(OUTPUT_DIR, "book_authors.csv")
-    borrower_path = os.path.join(OUTPUT_DIR, "borrower.csv")
-    bad_books_path = os.path.join(OUTPUT_DIR, "bad_books_rows.csv")
-    log_path = os.path.join(OUTPUT_DIR, "normalization_log.txt")
-
-    with open(book_path, "w", encoding="utf-8", newline='') as f:
-        w = csv.writer(f)
-        w.writerow(["isbn_primary", "isbn10", "isbn13", "title"])
-        for row in books_out:
-            w.writerow(row)
-
     with open(authors_path, "w", encoding="utf-8", newline='') as f:
         w = csv.writer(f)
         w.writerow(["author_id", "name"])
         for name, aid in sorted(authors_map.items(), key=lambda kv: int(kv[1])):
             w.writerow([aid, name])
 
-    with open(book_authors_path, "w", encoding="utf-8", newline='') as f:
-        w = csv.writer(f)
-        w.writerow(["isbn_primary", "author_id"])
-        for row in book_authors_out:
-            w.writerow(row)
-
-    with open(borrower_path, "w", encoding="utf-8", newline='') as f:
-        w = csv.writer(f)
-        w.writerow(["card_no", "ssn", "bname", "address", "phone"])
-        for row in borrowers_out:
-            w.writerow(row)
-
-    with open(bad_books_path, "w", encoding="utf-8", newline='') as f:
-        w = csv.writer(f)
-        w.writerow(book_headers)
-        for r in bad_book_rows:
-            w.writerow(r)
-
     # ---------- Write a brief log ----------
     with open(log_path, "w", encoding="utf-8") as f:
         f.write("Normalization log\n")
@@ -368,13 +472,19 @@ def normalize_and_write():
         f.write(f" - books file: {INPUT_BOOKS}\n - detected delimiter: {books_delim}\n")
         f.write(f" - borrowers file: {INPUT_BORROWERS}\n - detected delimiter: {borrowers_delim}\n\n")
         f.write("Output statistics:\n")
-        f.write(f" - input book rows: {len(book_rows)}\n")
-        f.write(f" - normalized book rows: {len(books_out)}\n")
+        f.write(f" - input book rows: {book_row_count}\n")
+        f.write(f" - normalized book rows: {books_out_count}\n")
         f.write(f" - unique author names: {len(authors_map)}\n")
-        f.write(f" - book-author links: {len(book_authors_out)}\n")
-        f.write(f" - bad book rows (no isbn): {len(bad_book_rows)}\n")
+        f.write(f" - book-author links: {book_authors_count}\n")
+        f.write(f" - bad book rows (no isbn): {bad_book_count}\n")
 
     print("Normalization finished. Files in:", OUTPUT_DIR)
 
 if __name__ == "__main__":
-    normalize_and_write()
+    parser = argparse.ArgumentParser(description="Normalize books.csv and borrowers.csv.")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="worker processes for normalization (default: 0 = in-process)")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE,
+                        help="rows per work unit (default %(default)s)")
+    args = parser.parse_args()
+    normalize_and_write(workers=args.workers, chunk_size=args.chunk_size)
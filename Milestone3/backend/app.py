@@ -1,7 +1,30 @@
-from flask import Flask, send_from_directory, send_file
+import time
+from flask import Flask, Response, g, request, send_from_directory, send_file
+from flask.json.provider import DefaultJSONProvider
 from pathlib import Path
+from db import pool_stats, snapshot_stats
+from migrations import migrate_database
+import metrics
+import profiling
+import worker_status
+
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """Adds JSON encode time to the request profile."""
+
+    def dumps(self, obj, **kwargs):
+        started = time.perf_counter()
+        try:
+            return super().dumps(obj, **kwargs)
+        finally:
+            profiling.add_json_time(time.perf_counter() - started)
+
 
 app = Flask(__name__)
+app.json = TimedJSONProvider(app)
+
+# Bring an existing library.db up to the current schema version
+migrate_database()
 
 # Register blueprints for each task area first
 # CRITICAL: Register ALL blueprints BEFORE any catch-all routes
@@ -76,13 +99,80 @@ def serve_frontend(path):
     return send_file(str(FRONTEND_DIR / "landingpage.html"))
 
 
+@app.before_request
+def start_request_metrics():
+    g.metrics_started = metrics.request_started()
+
+
+@app.teardown_request
+def finish_request_metrics(exc):
+    started = g.pop("metrics_started", None)
+    if started is None:
+        return
+    status = "500" if exc is not None else str(g.pop("status_code", 500))
+    metrics.request_finished(
+        started,
+        request.blueprint or "app",
+        request.endpoint or "(unmatched)",
+        request.method,
+        status,
+    )
+
+
+@app.before_request
+def start_profile():
+    if request.path.startswith("/api/"):
+        rule = request.url_rule.rule if request.url_rule else "(unmatched)"
+        g.profile = profiling.start_request(f"{request.method} {rule}")
+
+
+@app.after_request
+def add_server_timing(response):
+    g.status_code = response.status_code
+    profile = g.pop("profile", None)
+    if profile is None:
+        return response
+    if response.is_streamed:
+        # The body (and its queries) is produced after the headers are sent,
+        # so count it towards the route's metrics but send no Server-Timing
+        response.call_on_close(lambda: profiling.finish_request(profile))
+        return response
+    total = profiling.finish_request(profile)
+    response.headers["Server-Timing"] = profile.server_timing(total)
+    return response
+
+
+@app.get("/metrics")
+def prometheus_metrics():
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+
 @app.get("/api/health")
 def health():
-    return {"status": "ok"}
+    return {
+        "status": "ok",
+        "db_pool": pool_stats(),
+        "read_snapshot": snapshot_stats(),
+        "worker": worker_status.current_worker(),
+    }
+
+
+@app.get("/api/health/workers")
+def workers_health():
+    """Last heartbeat of every prefork.py worker (just this process otherwise)."""
+    if worker_status.STATUS_DIR:
+        workers = worker_status.read_statuses(worker_status.STATUS_DIR)
+    else:
+        workers = [dict(worker_status.current_worker(), **metrics.request_summary(),
+                        db_pool=pool_stats(), healthy=True)]
+    healthy = bool(workers) and all(w["healthy"] for w in workers)
+    return {"status": "ok" if healthy else "degraded", "workers": workers}, 200 if healthy else 503
 
 
 if __name__ == "__main__":
     # Run with: python app.py
     # Add debug=True for development if desired.
+    import suggest_index
+    suggest_index.warm_up()
     app.run(host="127.0.0.1", port=5000)
 
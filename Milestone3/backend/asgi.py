@@ -0,0 +1,219 @@
+"""ASGI entry point: serves the Flask app from an async server.
+
+Connections are handled on the event loop; each request runs the Flask app
+(and its SQLite work) on a bounded thread pool, and the response body is
+sent chunk by chunk as the app yields it, so a slow admin report only
+holds one worker thread while checkouts keep being served by the others.
+SQLite in WAL mode lets those threads read concurrently.
+
+Run with: python asgi.py [--host H] [--port P] [--threads N]
+      or: uvicorn asgi:application --host 127.0.0.1 --port 5000
+
+LIBRARY_ASGI_THREADS sets the pool size (default: LIBRARY_DB_POOL_SIZE, so
+every worker thread can reuse a pooled connection). On shutdown the server
+stops accepting connections, in-flight requests finish, the loan writer
+thread is stopped and idle database connections are closed.
+"""
+import argparse
+import asyncio
+import contextvars
+import io
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import db
+import suggest_index
+import write_queue
+from app import app
+
+THREADS = int(os.environ.get("LIBRARY_ASGI_THREADS", str(db.POOL_SIZE)))
+# Seconds uvicorn waits for in-flight requests after SIGINT/SIGTERM
+GRACEFUL_SHUTDOWN_SECONDS = 30
+
+
+def build_environ(scope, body):
+    """Translate an ASGI HTTP scope and request body into a WSGI environ."""
+    server = scope.get("server") or ("127.0.0.1", 80)
+    client = scope.get("client") or ("", 0)
+    root_path = scope.get("root_path", "")
+    path = scope["path"]
+    if root_path and path.startswith(root_path):
+        path = path[len(root_path):]
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": root_path.encode("utf-8").decode("latin-1"),
+        # WSGI carries the path as latin-1-decoded bytes
+        "PATH_INFO": path.encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": client[0],
+        "REMOTE_PORT": str(client[1]),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+    }
+    for raw_name, raw_value in scope.get("headers", []):
+        name = raw_name.decode("latin-1").upper().replace("-", "_")
+        value = raw_value.decode("latin-1")
+        if name == "CONTENT_TYPE":
+            environ["CONTENT_TYPE"] = value
+        elif name == "CONTENT_LENGTH":
+            environ["CONTENT_LENGTH"] = value
+        else:
+            key = f"HTTP_{name}"
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+def start_wsgi(wsgi_app, environ):
+    """Call the WSGI app up to its first body chunk.
+
+    Returns (status, headers, result, chunks, first): result is the app's
+    iterable (to close() when done), chunks an iterator over it and first
+    its first chunk, or None if the body is empty.
+    """
+    response = {}
+
+    def start_response(status, headers, exc_info=None):
+        if exc_info and response:
+            raise exc_info[1].with_traceback(exc_info[2])
+        response["status"] = int(status.split(" ", 1)[0])
+        response["headers"] = [
+            (name.lower().encode("latin-1"), value.encode("latin-1"))
+            for name, value in headers
+        ]
+
+    result = wsgi_app(environ, start_response)
+    try:
+        chunks = iter(result)
+        # A lazy app may only call start_response once iterated
+        first = next(chunks, None)
+    except BaseException:
+        close_wsgi(result)
+        raise
+    return response["status"], response["headers"], result, chunks, first
+
+
+def next_chunk(chunks):
+    return next(chunks, None)
+
+
+def close_wsgi(result):
+    if hasattr(result, "close"):
+        result.close()
+
+
+class WSGIToASGI:
+    """Minimal ASGI adapter running a WSGI app on a bounded thread pool."""
+
+    def __init__(self, wsgi_app, threads=THREADS):
+        self.wsgi_app = wsgi_app
+        self.threads = threads
+        self.executor = None
+
+    def _executor(self):
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(
+                max_workers=self.threads, thread_name_prefix="library-asgi"
+            )
+        return self.executor
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self.lifespan(receive, send)
+        elif scope["type"] == "http":
+            await self.http(scope, receive, send)
+        else:
+            raise RuntimeError(f"Unsupported ASGI scope type: {scope['type']}")
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                self._executor()
+                suggest_index.warm_up()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                # The server has already drained in-flight requests
+                write_queue.stop()
+                if self.executor is not None:
+                    await asyncio.get_running_loop().run_in_executor(
+                        None, self.executor.shutdown, True
+                    )
+                    self.executor = None
+                db.close_idle_connections()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def http(self, scope, receive, send):
+        chunks = []
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body", False):
+                break
+        environ = build_environ(scope, b"".join(chunks))
+
+        # A fresh context per request keeps profiling's ContextVar from
+        # leaking between requests served by the same thread; every step of
+        # the request (including reading a streamed body) runs inside it
+        loop = asyncio.get_running_loop()
+        context = contextvars.Context()
+
+        def in_worker(fn, *args):
+            return loop.run_in_executor(self._executor(), context.run, fn, *args)
+
+        status, headers, result, chunks, chunk = await in_worker(
+            start_wsgi, self.wsgi_app, environ
+        )
+        try:
+            await send({"type": "http.response.start", "status": status, "headers": headers})
+            # Forward each chunk as it is produced so streamed responses
+            # (e.g. ?stream=ndjson) are never held in memory whole
+            while chunk is not None:
+                if chunk:
+                    await send({"type": "http.response.body", "body": chunk, "more_body": True})
+                chunk = await in_worker(next_chunk, chunks)
+            await send({"type": "http.response.body", "body": b""})
+        finally:
+            await in_worker(close_wsgi, result)
+
+
+application = WSGIToASGI(app)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the library API over ASGI")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--threads", type=int, default=THREADS,
+                        help="worker threads running requests (default %(default)s)")
+    args = parser.parse_args()
+
+    try:
+        import uvicorn
+    except ImportError:
+        sys.exit("uvicorn is required for the ASGI server: pip install -r requirements.txt")
+
+    application.threads = args.threads
+    print(f"Serving on http://{args.host}:{args.port} with {args.threads} worker threads")
+    uvicorn.run(
+        application,
+        host=args.host,
+        port=args.port,
+        lifespan="on",
+        timeout_graceful_shutdown=GRACEFUL_SHUTDOWN_SECONDS,
+    )
+
+
+if __name__ == "__main__":
+    main()
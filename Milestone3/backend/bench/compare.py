@@ -0,0 +1,59 @@
+"""Compare two bench/run.py result files route by route.
+
+Run with: python -m bench.compare BASELINE.json CANDIDATE.json [--threshold 10]
+Exits with status 1 if any route's p95 regressed by more than the threshold.
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+
+
+def load(path):
+    return json.loads(Path(path).read_text(encoding="utf-8"))
+
+
+def change(before, after):
+    if not before:
+        return None
+    return (after - before) / before * 100.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files.")
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--threshold", type=float, default=10.0,
+                        help="p95 regression (%%) that fails the comparison")
+    args = parser.parse_args()
+
+    base, cand = load(args.baseline), load(args.candidate)
+    print(f"baseline  {base['meta']['revision']}  {base['meta']['scale']}")
+    print(f"candidate {cand['meta']['revision']}  {cand['meta']['scale']}\n")
+    print(f"{'route':28s} {'p50 ms':>18s} {'p95 ms':>18s} {'p95 %':>8s}")
+
+    regressions = []
+    for name in sorted(set(base["routes"]) | set(cand["routes"])):
+        b, c = base["routes"].get(name), cand["routes"].get(name)
+        if not b or not c:
+            print(f"{name:28s} {'(only in ' + ('candidate' if c else 'baseline') + ')':>18s}")
+            continue
+        pct = change(b["p95_ms"], c["p95_ms"])
+        flag = ""
+        if pct is not None and pct > args.threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:28s} {b['p50_ms']:8.2f} -> {c['p50_ms']:7.2f} "
+              f"{b['p95_ms']:8.2f} -> {c['p95_ms']:7.2f} "
+              f"{pct if pct is not None else 0:+7.1f}%{flag}")
+
+    if regressions:
+        print(f"\n{len(regressions)} route(s) regressed beyond {args.threshold:.0f}%: "
+              f"{', '.join(regressions)}")
+        return 1
+    print("\nNo p95 regressions beyond the threshold")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
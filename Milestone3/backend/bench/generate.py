@@ -0,0 +1,194 @@
+"""Generate a synthetic library database for benchmarking.
+
+Builds a fresh database from schema.sql and the migrations, then fills it with
+a reproducible (seeded) catalog, borrower base and loan history. Loan history
+respects the business rules: at most one open loan per book and at most three
+per borrower. Fines are computed with the regular refresh statement.
+
+Run from Milestone3/backend:
+    python -m bench.generate --books 100000 --borrowers 10000 --out bench/bench.db
+"""
+import argparse
+import random
+import sqlite3
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+from borrower_summary import rebuild_borrower_summary
+from migrations import apply_migrations
+from routes.fines import refresh_fines
+from search_index import rebuild_search_index
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+SCHEMA_PATH = BACKEND_DIR / "schema.sql"
+
+CHUNK = 50000
+
+WORDS = (
+    "the a of and night river house garden war peace history secret life "
+    "world city stone winter summer shadow light dark king queen love death "
+    "journey island ocean mountain empire star dream code machine science "
+    "guide art kitchen music letters children ghost wolf fire glass silver"
+).split()
+FIRST_NAMES = (
+    "James Mary John Patricia Robert Jennifer Michael Linda William Elizabeth "
+    "David Barbara Richard Susan Joseph Jessica Thomas Sarah Charles Karen "
+    "Ana Wei Fatima Olga Kenji Priya Diego Amara Lars Noor"
+).split()
+LAST_NAMES = (
+    "Smith Johnson Williams Brown Jones Garcia Miller Davis Rodriguez Martinez "
+    "Hernandez Lopez Gonzalez Wilson Anderson Thomas Taylor Moore Jackson Martin "
+    "Lee Perez Thompson White Harris Sanchez Clark Ramirez Lewis Robinson"
+).split()
+
+
+def isbn13_check_digit(first12):
+    total = sum(int(d) * (1 if i % 2 == 0 else 3) for i, d in enumerate(first12))
+    return str((10 - total % 10) % 10)
+
+
+def isbn10_check_digit(first9):
+    total = sum(int(d) * (10 - i) for i, d in enumerate(first9))
+    check = (11 - total % 11) % 11
+    return "X" if check == 10 else str(check)
+
+
+def make_isbns(n):
+    """Return n distinct (isbn10, isbn13) pairs for the same book."""
+    core = 10000000 + n  # keeps the 9-digit body unique per book
+    body = f"{core:09d}"[-9:]
+    isbn10 = body + isbn10_check_digit(body)
+    isbn13 = "978" + body + isbn13_check_digit("978" + body)
+    return isbn10, isbn13
+
+
+def chunked(rows, size=CHUNK):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def insert_all(conn, sql, rows):
+    count = 0
+    for batch in chunked(rows):
+        conn.executemany(sql, batch)
+        count += len(batch)
+    return count
+
+
+def generate_database(path, books, borrowers, loans=None, authors=None, seed=42,
+                      today=None):
+    """Create a populated database at path; returns a dict of row counts."""
+    rng = random.Random(seed)
+    today = today or date.today()
+    authors = authors or max(1, int(books * 0.6))
+    loans = loans if loans is not None else borrowers * 20
+    path = Path(path)
+    if path.exists():
+        path.unlink()
+
+    started = time.perf_counter()
+    conn = sqlite3.connect(str(path))
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode = OFF")
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.executescript(SCHEMA_PATH.read_text(encoding="utf-8"))
+    apply_migrations(conn)
+
+    def book_rows():
+        for i in range(books):
+            isbn10, isbn13 = make_isbns(i)
+            words = rng.sample(WORDS, rng.randint(1, 5))
+            yield (isbn13, isbn10, isbn13, " ".join(words).title())
+
+    def author_rows():
+        for i in range(1, authors + 1):
+            yield (i, f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {i}")
+
+    def book_author_rows():
+        for i in range(books):
+            isbn13 = make_isbns(i)[1]
+            for author_id in set(rng.randint(1, authors) for _ in range(rng.choice((1, 1, 1, 2, 3)))):
+                yield (isbn13, author_id)
+
+    def borrower_rows():
+        for i in range(1, borrowers + 1):
+            yield (
+                f"ID{i:06d}",
+                f"{i // 1000000:03d}-{(i // 10000) % 100:02d}-{i % 10000:04d}",
+                f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+                f"{rng.randint(1, 9999)} {rng.choice(LAST_NAMES)} St",
+                f"555-{rng.randint(0, 9999):04d}",
+            )
+
+    def loan_rows():
+        # Returned history first, then up to three open loans for some borrowers
+        open_isbns = set()
+        open_per_card = {}
+        for _ in range(loans):
+            isbn = make_isbns(rng.randrange(books))[1]
+            card = f"ID{rng.randint(1, borrowers):06d}"
+            date_out = today - timedelta(days=rng.randint(1, 3 * 365))
+            due = date_out + timedelta(days=14)
+            if (rng.random() < 0.05 and isbn not in open_isbns
+                    and open_per_card.get(card, 0) < 3):
+                open_isbns.add(isbn)
+                open_per_card[card] = open_per_card.get(card, 0) + 1
+                date_out = today - timedelta(days=rng.randint(0, 40))
+                yield (isbn, card, date_out.isoformat(), (date_out + timedelta(days=14)).isoformat(), None)
+                continue
+            date_in = date_out + timedelta(days=rng.choice((3, 7, 10, 13, 14, 15, 20, 30)))
+            if date_in > today:
+                date_in = today
+            yield (isbn, card, date_out.isoformat(), due.isoformat(), date_in.isoformat())
+
+    counts = {}
+    with conn:
+        counts["books"] = insert_all(conn, "INSERT INTO BOOK VALUES (?, ?, ?, ?)", book_rows())
+        counts["authors"] = insert_all(conn, "INSERT INTO AUTHORS VALUES (?, ?)", author_rows())
+        counts["book_authors"] = insert_all(
+            conn, "INSERT OR IGNORE INTO BOOK_AUTHORS VALUES (?, ?)", book_author_rows())
+        counts["borrowers"] = insert_all(
+            conn, "INSERT INTO BORROWER VALUES (?, ?, ?, ?, ?)", borrower_rows())
+        counts["loans"] = insert_all(
+            conn,
+            "INSERT INTO BOOK_LOANS (isbn, card_id, date_out, due_date, date_in) VALUES (?, ?, ?, ?, ?)",
+            loan_rows(),
+        )
+        cursor = conn.cursor()
+        refresh_fines(cursor, today.isoformat())
+        # Most historical fines have been paid
+        conn.execute("UPDATE FINES SET paid = 1 WHERE loan_id % 4 <> 0 AND loan_id IN "
+                     "(SELECT loan_id FROM BOOK_LOANS WHERE date_in IS NOT NULL)")
+        counts["fines"] = conn.execute("SELECT COUNT(*) FROM FINES").fetchone()[0]
+
+    rebuild_search_index(conn)
+    rebuild_borrower_summary(conn)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("ANALYZE")
+    conn.close()
+    counts["seconds"] = round(time.perf_counter() - started, 2)
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic library database.")
+    parser.add_argument("--books", type=int, default=10000)
+    parser.add_argument("--borrowers", type=int, default=1000)
+    parser.add_argument("--loans", type=int, default=None,
+                        help="loan history rows (default: 20 per borrower)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", default=str(BACKEND_DIR / "bench" / "bench.db"))
+    args = parser.parse_args()
+    counts = generate_database(args.out, args.books, args.borrowers, args.loans, seed=args.seed)
+    print(f"Generated {args.out}: {counts}")
+
+
+if __name__ == "__main__":
+    main()
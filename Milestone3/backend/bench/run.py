@@ -0,0 +1,244 @@
+"""Benchmark every API route through Flask's test client.
+
+Generates (or reuses) a synthetic database, copies it to a scratch file so
+write routes never accumulate across runs, then times each scenario and
+reports p50/p95/p99 latency and throughput. Results are written as JSON so
+runs can be compared across commits with bench/compare.py.
+
+Run from Milestone3/backend:
+    python -m bench.run --scale small
+    python -m bench.run --books 50000 --borrowers 5000 --requests 500
+"""
+import argparse
+import json
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import db
+from bench.generate import BACKEND_DIR, generate_database
+
+RESULTS_DIR = BACKEND_DIR / "bench" / "results"
+
+# name -> (books, borrowers)
+SCALES = {
+    "tiny": (10000, 1000),
+    "small": (100000, 10000),
+    "medium": (1000000, 100000),
+    "large": (10000000, 1000000),
+}
+
+SEARCH_TERMS = ["the", "river", "night garden", "Smith", "king", "ab", "zz", "Jennifer Lee"]
+NAME_TERMS = ["mar", "Diego", "lee", "Jennifer Lee", "an", "zz"]
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    k = (len(sorted_values) - 1) * pct / 100.0
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+class Fixtures:
+    """Random keys drawn from the benchmark database."""
+
+    def __init__(self, path, seed):
+        self.rng = random.Random(seed)
+        conn = sqlite3.connect(str(path))
+        self.isbns = [r[0] for r in conn.execute(
+            "SELECT isbn_primary FROM BOOK ORDER BY RANDOM() LIMIT 5000")]
+        self.cards = [r[0] for r in conn.execute(
+            "SELECT card_id FROM BORROWER ORDER BY RANDOM() LIMIT 2000")]
+        self.clean_cards = [r[0] for r in conn.execute(
+            "SELECT card_id FROM BORROWER_SUMMARY "
+            "WHERE unpaid_fines = 0 AND active_loans = 0 LIMIT 2000")]
+        self.open_loans = [r[0] for r in conn.execute(
+            "SELECT loan_id FROM BOOK_LOANS WHERE date_in IS NULL")]
+        self.loans = [r[0] for r in conn.execute(
+            "SELECT loan_id FROM BOOK_LOANS ORDER BY RANDOM() LIMIT 2000")]
+        conn.close()
+        self.next_ssn = 900000000
+
+    def isbn(self):
+        return self.rng.choice(self.isbns)
+
+    def card(self):
+        return self.rng.choice(self.cards)
+
+    def clean_card(self):
+        return self.rng.choice(self.clean_cards or self.cards)
+
+    def open_loan(self):
+        return self.open_loans.pop() if self.open_loans else self.rng.choice(self.loans)
+
+    def ssn(self):
+        self.next_ssn += 1
+        return str(self.next_ssn)
+
+
+def scenarios(fx):
+    """(name, method, path factory, body factory) for every route."""
+    return [
+        ("health", "GET", lambda: "/api/health", None),
+        ("search", "GET", lambda: f"/api/search?q={fx.rng.choice(SEARCH_TERMS)}", None),
+        ("search_isbn", "GET", lambda: f"/api/search?q={fx.isbn()}", None),
+        ("search_paged", "GET", lambda: f"/api/search?q={fx.rng.choice(SEARCH_TERMS)}&limit=50", None),
+        ("search_suggest", "GET",
+         lambda: f"/api/search/suggest?prefix={fx.rng.choice(SEARCH_TERMS)[:fx.rng.randint(1, 5)]}", None),
+        ("checkout", "POST", lambda: "/api/checkout",
+         lambda: {"isbn": fx.isbn(), "card_id": fx.clean_card()}),
+        ("checkout_batch", "POST", lambda: "/api/checkout/batch",
+         lambda: {"isbns": [fx.isbn() for _ in range(3)], "card_id": fx.clean_card()}),
+        ("checkin", "POST", lambda: "/api/checkin", lambda: {"loan_id": fx.open_loan()}),
+        ("checkin_batch", "POST", lambda: "/api/checkin/batch",
+         lambda: {"loan_ids": [fx.open_loan() for _ in range(20)], "compute_fines": True}),
+        ("checkin_search", "GET", lambda: f"/api/checkin/search?card_no={fx.card()}", None),
+        ("checkin_search_name", "GET",
+         lambda: f"/api/checkin/search?borrower_name={fx.rng.choice(NAME_TERMS)}", None),
+        ("borrower_create", "POST", lambda: "/api/borrowers",
+         lambda: {"ssn": fx.ssn(), "bname": "Bench Borrower", "address": "1 Bench St"}),
+        ("borrower_delete", "DELETE", lambda: f"/api/borrowers/{fx.card()}", None),
+        ("fines_list", "GET", lambda: f"/api/fines?card_no={fx.card()}", None),
+        ("fines_list_all", "GET", lambda: "/api/fines", None),
+        ("fines_refresh", "POST", lambda: "/api/fines/refresh", None),
+        ("fines_refresh_incremental", "POST", lambda: "/api/fines/refresh?incremental=true", None),
+        ("fines_pay", "POST", lambda: "/api/fines/pay", lambda: {"card_no": fx.card()}),
+        ("admin_borrowers", "GET", lambda: "/api/admin/borrowers", None),
+        ("admin_borrowers_page", "GET", lambda: "/api/admin/borrowers?limit=100", None),
+        ("admin_loans", "GET", lambda: "/api/admin/loans", None),
+        ("admin_loans_page", "GET", lambda: "/api/admin/loans?limit=100", None),
+        ("admin_fines", "GET", lambda: "/api/admin/fines", None),
+        ("admin_stats", "GET", lambda: "/api/admin/stats", None),
+        ("admin_metrics", "GET", lambda: "/api/admin/metrics", None),
+        ("admin_fine_apply", "POST", lambda: "/api/admin/fines/apply",
+         lambda: {"loan_id": fx.rng.choice(fx.loans), "days_late": 3}),
+    ]
+
+
+# Whole-table routes get fewer iterations so a large scale stays practical
+HEAVY = {"fines_list_all", "fines_refresh", "admin_borrowers", "admin_loans", "admin_fines"}
+
+
+def run_scenario(client, method, path_fn, body_fn, requests, warmup):
+    for _ in range(warmup):
+        client.open(path_fn(), method=method, json=body_fn() if body_fn else None)
+    latencies = []
+    statuses = {}
+    started = time.perf_counter()
+    for _ in range(requests):
+        path = path_fn()
+        body = body_fn() if body_fn else None
+        t0 = time.perf_counter()
+        response = client.open(path, method=method, json=body)
+        response.get_data()
+        latencies.append((time.perf_counter() - t0) * 1000.0)
+        statuses[str(response.status_code)] = statuses.get(str(response.status_code), 0) + 1
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "requests": requests,
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p95_ms": round(percentile(latencies, 95), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+        "mean_ms": round(statistics.fmean(latencies), 3),
+        "max_ms": round(latencies[-1], 3),
+        "throughput_rps": round(requests / elapsed, 1) if elapsed > 0 else None,
+        "status_codes": statuses,
+    }
+
+
+def git_revision():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR,
+                             capture_output=True, text=True, check=True)
+        return out.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the library API routes.")
+    parser.add_argument("--scale", choices=sorted(SCALES), default="tiny")
+    parser.add_argument("--books", type=int, help="override the scale's book count")
+    parser.add_argument("--borrowers", type=int, help="override the scale's borrower count")
+    parser.add_argument("--loans", type=int, help="loan history rows (default 20 per borrower)")
+    parser.add_argument("--requests", type=int, default=200, help="timed requests per route")
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--only", help="comma-separated scenario names to run")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--db", help="reuse this generated database instead of generating one")
+    parser.add_argument("--out", help="results file (default bench/results/<time>-<rev>.json)")
+    args = parser.parse_args()
+
+    books, borrowers = SCALES[args.scale]
+    books = args.books or books
+    borrowers = args.borrowers or borrowers
+
+    with tempfile.TemporaryDirectory() as tmp:
+        source = Path(args.db) if args.db else Path(tmp) / "source.db"
+        if not args.db:
+            counts = generate_database(source, books, borrowers, args.loans, seed=args.seed)
+            print(f"Generated synthetic data: {counts}")
+
+        # Run against a scratch copy so write routes start from the same state
+        scratch = Path(tmp) / "bench.db"
+        src, dst = sqlite3.connect(str(source)), sqlite3.connect(str(scratch))
+        src.backup(dst)
+        src.close()
+        dst.close()
+        db.DB_PATH = scratch
+
+        from app import app  # noqa: E402  (imported after repointing DB_PATH)
+
+        client = app.test_client()
+        fx = Fixtures(scratch, args.seed)
+        only = set(args.only.split(",")) if args.only else None
+
+        results = {}
+        for name, method, path_fn, body_fn in scenarios(fx):
+            if only and name not in only:
+                continue
+            requests = max(5, args.requests // 20) if name in HEAVY else args.requests
+            warmup = min(args.warmup, requests)
+            results[name] = run_scenario(client, method, path_fn, body_fn, requests, warmup)
+            r = results[name]
+            print(f"{name:28s} p50 {r['p50_ms']:9.2f}ms  p95 {r['p95_ms']:9.2f}ms  "
+                  f"p99 {r['p99_ms']:9.2f}ms  {r['throughput_rps']:8.1f} req/s  {r['status_codes']}")
+        db.close_idle_connections()
+
+    revision = git_revision()
+    report = {
+        "meta": {
+            "revision": revision,
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "scale": {"books": books, "borrowers": borrowers, "loans": args.loans},
+            "requests": args.requests,
+            "seed": args.seed,
+        },
+        "routes": results,
+    }
+    if args.out:
+        out = Path(args.out)
+    else:
+        RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        out = RESULTS_DIR / f"{stamp}-{revision}.json"
+    out.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print(f"\nResults written to {out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,96 @@
+"""Rebuild and verify BORROWER_SUMMARY (per-borrower active loans and unpaid fines).
+
+The table is kept current by triggers on BORROWER, BOOK_LOANS and FINES
+(see migration 4). This script recomputes it from the base tables.
+
+Run with:
+    python borrower_summary.py          # rebuild, then verify
+    python borrower_summary.py --check  # verify only
+"""
+import sys
+from db import get_db
+from migrations import migrate_database
+
+# Per-borrower figures computed directly from the base tables
+EXPECTED_SUMMARY_SQL = """
+    SELECT
+        b.card_id,
+        COALESCE(loan_counts.active_loans, 0) AS active_loans,
+        COALESCE(fine_totals.unpaid_fines, 0) AS unpaid_fines
+    FROM BORROWER b
+    LEFT JOIN (
+        SELECT card_id, COUNT(*) AS active_loans
+        FROM BOOK_LOANS
+        WHERE date_in IS NULL
+        GROUP BY card_id
+    ) loan_counts ON b.card_id = loan_counts.card_id
+    LEFT JOIN (
+        SELECT bl.card_id, SUM(f.fine_amt) AS unpaid_fines
+        FROM FINES f
+        JOIN BOOK_LOANS bl ON f.loan_id = bl.loan_id
+        WHERE f.paid = 0
+        GROUP BY bl.card_id
+    ) fine_totals ON b.card_id = fine_totals.card_id
+"""
+
+
+def rebuild_borrower_summary(conn):
+    """Replace BORROWER_SUMMARY with figures recomputed from scratch."""
+    with conn:
+        conn.execute("DELETE FROM BORROWER_SUMMARY")
+        conn.execute(f"""
+            INSERT INTO BORROWER_SUMMARY (card_id, active_loans, unpaid_fines)
+            {EXPECTED_SUMMARY_SQL}
+        """)
+    count = conn.execute("SELECT COUNT(*) FROM BORROWER_SUMMARY").fetchone()[0]
+    print(f"Rebuilt BORROWER_SUMMARY for {count} borrowers")
+    return count
+
+
+def verify_borrower_summary(conn):
+    """Return a list of (card_id, stored, expected) rows that disagree."""
+    cursor = conn.execute(f"""
+        SELECT
+            e.card_id,
+            s.active_loans AS stored_loans,
+            s.unpaid_fines AS stored_fines,
+            e.active_loans AS expected_loans,
+            e.unpaid_fines AS expected_fines
+        FROM ({EXPECTED_SUMMARY_SQL}) e
+        LEFT JOIN BORROWER_SUMMARY s ON s.card_id = e.card_id
+        WHERE s.card_id IS NULL
+           OR s.active_loans <> e.active_loans
+           OR ABS(s.unpaid_fines - e.unpaid_fines) >= 0.005
+        UNION ALL
+        SELECT s.card_id, s.active_loans, s.unpaid_fines, NULL, NULL
+        FROM BORROWER_SUMMARY s
+        WHERE s.card_id NOT IN (SELECT card_id FROM BORROWER)
+    """)
+    mismatches = []
+    for row in cursor.fetchall():
+        stored = (row["stored_loans"], row["stored_fines"])
+        expected = (row["expected_loans"], row["expected_fines"])
+        mismatches.append((row["card_id"], stored, expected))
+    return mismatches
+
+
+def main(check_only=False):
+    migrate_database()
+    conn = get_db()
+    try:
+        if not check_only:
+            rebuild_borrower_summary(conn)
+        mismatches = verify_borrower_summary(conn)
+        if mismatches:
+            print(f"WARNING: {len(mismatches)} BORROWER_SUMMARY rows do not match")
+            for card_id, stored, expected in mismatches[:20]:
+                print(f"  {card_id}: stored (loans, fines) = {stored}, expected = {expected}")
+            return False
+        print("[OK] BORROWER_SUMMARY matches BOOK_LOANS and FINES")
+        return True
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main(check_only="--check" in sys.argv[1:]) else 1)
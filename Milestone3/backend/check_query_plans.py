@@ -0,0 +1,173 @@
+"""Regression check: hot route queries must not fall back to full table scans.
+
+Drives the API routes against a scratch copy of library.db, captures every SQL
+statement they issue and inspects its EXPLAIN QUERY PLAN. Exits with status 1
+if a statement issued by a STRICT request scans a whole table.
+
+Run with: python check_query_plans.py
+"""
+import sqlite3
+import sys
+import tempfile
+from pathlib import Path
+
+import db
+
+captured = []
+
+
+def capture_statements(conn):
+    conn.set_trace_callback(captured.append)
+
+
+def copy_database(target):
+    """Copy library.db to target with the online backup API."""
+    src = sqlite3.connect(str(db.DB_PATH))
+    dst = sqlite3.connect(str(target))
+    try:
+        src.backup(dst)
+    finally:
+        src.close()
+        dst.close()
+
+
+def is_plannable(sql):
+    # FTS5 reads its shadow tables with internal statements like
+    # SELECT k, v FROM 'main'.'BOOK_SEARCH_config'; skip those.
+    if sql.startswith("--") or "'main'." in sql:
+        return False
+    head = sql.lstrip().split(None, 1)[0].upper() if sql.strip() else ""
+    return head in ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH", "REPLACE")
+
+
+def partial_indexes(plan_conn):
+    """Names of partial indexes; scanning one only visits the rows it covers."""
+    return {
+        name for name, sql in plan_conn.execute(
+            "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL"
+        )
+        if " WHERE " in sql.upper()
+    }
+
+
+def full_scans(plan_conn, sql):
+    """Return the plan lines that scan a table rather than search an index."""
+    rows = plan_conn.execute(f"EXPLAIN QUERY PLAN {sql}").fetchall()
+    partial = partial_indexes(plan_conn)
+    # Materialized subqueries and CTEs show up as SCAN <name>; those are fine
+    derived = set()
+    for row in rows:
+        detail = row[3]
+        for prefix in ("MATERIALIZE ", "CO-ROUTINE "):
+            if detail.startswith(prefix):
+                derived.add(detail[len(prefix):].strip())
+    scans = []
+    for row in rows:
+        detail = row[3]
+        if not detail.startswith("SCAN "):
+            continue
+        name = detail.split()[1]
+        if name in derived or "VIRTUAL TABLE" in detail or name == "CONSTANT":
+            continue
+        if " INDEX " in detail and detail.rsplit(" INDEX ", 1)[1].split()[0] in partial:
+            continue
+        scans.append(detail)
+    return scans
+
+
+def build_requests(conn):
+    """Return (strict, report_only) request lists using real keys from the copy."""
+    isbns = [r[0] for r in conn.execute("SELECT isbn_primary FROM BOOK ORDER BY isbn_primary LIMIT 3")]
+    cards = [r[0] for r in conn.execute("SELECT card_id FROM BORROWER ORDER BY card_id LIMIT 2")]
+    card, spare_card = cards[0], cards[1]
+    name = conn.execute("SELECT bname FROM BORROWER WHERE card_id = ?", (card,)).fetchone()[0].split()[0][:3]
+    # Give the incremental fines refresh a previous run to start from
+    conn.execute("INSERT INTO FINES_REFRESH_LOG (run_on, mode, refreshed) VALUES (date('now'), 'full', 0)")
+    conn.commit()
+
+    strict = [
+        ("GET", "/api/search?q=harry", None),
+        ("GET", f"/api/search?q={isbns[2]}", None),
+        ("POST", "/api/checkout", {"isbn": isbns[0], "card_id": card}),
+        ("POST", "/api/checkout/batch", {"isbns": isbns[1:], "card_id": card}),
+        ("GET", f"/api/fines?card_no={card}", None),
+        ("POST", "/api/admin/fines/apply", {"loan_id": "<loan>", "days_late": 2}),
+        ("POST", "/api/fines/pay", {"card_no": card}),
+        ("POST", "/api/checkin", {"loan_id": "<loan>"}),
+        ("POST", "/api/checkin/batch", {"isbns": isbns[1:], "compute_fines": True}),
+        ("POST", "/api/fines/refresh?incremental=true", None),
+        ("DELETE", f"/api/borrowers/{spare_card}", None),
+        ("GET", f"/api/checkin/search?card_no={card[-3:]}", None),
+        ("GET", f"/api/checkin/search?card_no={card[:4]}", None),
+        ("GET", f"/api/checkin/search?isbn={isbns[2]}", None),
+        ("GET", f"/api/checkin/search?isbn={isbns[2][:6]}", None),
+        ("GET", f"/api/checkin/search?borrower_name={name}", None),
+        ("GET", "/api/checkin/search", None),
+    ]
+    # These return or rewrite whole tables by design, or use leading-wildcard
+    # LIKE (substring check-in search); their plans are printed for reference but never fail the check.
+    report_only = [
+        ("GET", "/api/search?q=ab", None),
+        ("GET", f"/api/checkin/search?card_no={card[-3:]}&match=substring", None),
+        ("POST", "/api/fines/refresh", None),
+        ("POST", "/api/borrowers", {"ssn": "999-99-9999", "bname": "Plan Check", "address": "1 Main St"}),
+        ("GET", "/api/fines", None),
+        ("GET", "/api/admin/borrowers", None),
+        ("GET", "/api/admin/loans", None),
+        ("GET", "/api/admin/fines", None),
+        ("GET", "/api/admin/stats", None),
+    ]
+    return strict, report_only
+
+
+def run_request(client, method, path, body, loan_id):
+    if isinstance(body, dict):
+        body = {k: (loan_id if v == "<loan>" else v) for k, v in body.items()}
+    del captured[:]
+    response = client.open(path, method=method, json=body)
+    return response, [sql for sql in captured if is_plannable(sql)]
+
+
+def check_plans():
+    with tempfile.TemporaryDirectory() as tmp:
+        scratch = Path(tmp) / "library.db"
+        copy_database(scratch)
+        db.DB_PATH = scratch
+        db.add_connection_hook(capture_statements)
+
+        from app import app  # noqa: E402  (imported after repointing DB_PATH)
+
+        plan_conn = sqlite3.connect(str(scratch))
+        client = app.test_client()
+        strict, report_only = build_requests(plan_conn)
+        failures = 0
+        loan_id = None
+
+        for label, requests, enforce in (("STRICT", strict, True), ("REPORT", report_only, False)):
+            for method, path, body in requests:
+                response, statements = run_request(client, method, path, body, loan_id)
+                data = response.get_json(silent=True)
+                if isinstance(data, dict) and "loan_id" in data and loan_id is None:
+                    loan_id = data["loan_id"]
+                for sql in statements:
+                    scans = full_scans(plan_conn, sql)
+                    if not scans:
+                        continue
+                    tag = "FAIL" if enforce else "note"
+                    failures += 1 if enforce else 0
+                    print(f"[{tag}] {method} {path}: {'; '.join(scans)}")
+                    print(f"       {' '.join(sql.split())[:160]}")
+                print(f"[{label}] {method} {path} -> {response.status_code} ({len(statements)} statements)")
+
+        plan_conn.close()
+        db.close_idle_connections()
+
+    if failures:
+        print(f"\n{failures} hot-path statement(s) fall back to a full table scan")
+        return False
+    print("\n[OK] No hot-path statement scans a full table")
+    return True
+
+
+if __name__ == "__main__":
+    sys.exit(0 if check_plans() else 1)
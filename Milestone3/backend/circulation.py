@@ -0,0 +1,281 @@
+"""In-memory circulation state: open loans, loans per borrower, unpaid fines.
+
+Holds isbn -> (loan_id, card_id) for every open loan, the number of open
+loans per card_id and the set of card_ids with unpaid fines, so search can
+overlay availability and checkout can refuse ineligible borrowers without
+querying the database. Only borrowers with open loans or unpaid fines take
+up memory.
+
+Loaded from BOOK_LOANS and FINES on first use and updated by the loan, fine
+and borrower routes after each commit. Changes made by other processes
+(server workers, scripts) are merged in every SYNC_SECONDS: loans above the
+highest loan_id seen and loans returned since the last sync (two indexed
+queries), and the unpaid-fine set whenever its signature changes. Every
+RELOAD_SECONDS the state is rebuilt from scratch and compared with what was
+held; any difference is logged and counted as drift in circulation_stats().
+"""
+import logging
+import threading
+import time
+from datetime import date
+
+from db import get_db
+
+RELOAD_SECONDS = 60
+SYNC_SECONDS = 1
+
+drift_log = logging.getLogger("library.circulation")
+
+ACTIVE_LOANS_SQL = """
+SELECT loan_id, isbn, card_id
+FROM BOOK_LOANS
+WHERE date_in IS NULL
+"""
+
+NEW_LOANS_SQL = """
+SELECT loan_id, isbn, card_id, date_in
+FROM BOOK_LOANS
+WHERE loan_id > ?
+"""
+
+# date_in is a day, so this re-reads the day's returns; only loans still
+# held in the map are acted on
+RETURNED_LOANS_SQL = """
+SELECT loan_id, isbn
+FROM BOOK_LOANS
+WHERE date_in >= ?
+"""
+
+FINED_CARDS_SQL = """
+SELECT DISTINCT bl.card_id
+FROM FINES f
+JOIN BOOK_LOANS bl ON f.loan_id = bl.loan_id
+WHERE f.paid = 0
+"""
+
+# Covered by idx_fines_paid; changes whenever a fine is added, paid or removed
+FINES_SIGNATURE_SQL = """
+SELECT COUNT(*), TOTAL(loan_id)
+FROM FINES
+WHERE paid = 0
+"""
+
+_active = {}  # isbn -> (loan_id, card_id)
+_loans_per_card = {}  # card_id -> open loans, only for card_ids with any
+_fined = set()  # card_ids with unpaid fines
+_fines_signature = None
+_loaded_at = None
+_synced_at = None
+_synced_on = None  # date of the last sync, for RETURNED_LOANS_SQL
+_max_loan_id = 0
+_stats = {"checks": 0, "checks_with_drift": 0, "last_check": None, "last_drift": None}
+_lock = threading.Lock()
+
+
+def _add(active, loans_per_card, loan_id, isbn, card_id):
+    # Keep the oldest open loan per ISBN, like the search SQL's LIMIT 1
+    seen = active.get(isbn)
+    if seen is not None:
+        if seen[0] == loan_id or loan_id > seen[0]:
+            return
+        _remove(active, loans_per_card, isbn)
+    active[isbn] = (loan_id, card_id)
+    loans_per_card[card_id] = loans_per_card.get(card_id, 0) + 1
+
+
+def _remove(active, loans_per_card, isbn):
+    held = active.pop(isbn, None)
+    if held is None:
+        return
+    card_id = held[1]
+    count = loans_per_card.get(card_id, 0) - 1
+    if count > 0:
+        loans_per_card[card_id] = count
+    else:
+        loans_per_card.pop(card_id, None)
+
+
+def _load(conn):
+    """Read the full state; returns (active, loans_per_card, fined, signature, max_loan_id)."""
+    active, loans_per_card = {}, {}
+    max_loan_id = conn.execute("SELECT COALESCE(MAX(loan_id), 0) FROM BOOK_LOANS").fetchone()[0]
+    for row in conn.execute(ACTIVE_LOANS_SQL):
+        _add(active, loans_per_card, row["loan_id"], row["isbn"], row["card_id"])
+    signature = tuple(conn.execute(FINES_SIGNATURE_SQL).fetchone())
+    fined = {row["card_id"] for row in conn.execute(FINED_CARDS_SQL)}
+    return active, loans_per_card, fined, signature, max_loan_id
+
+
+def _drift(active, loans_per_card, fined):
+    """Count differences between the held state and a fresh load."""
+    return {
+        "loans": sum(1 for isbn in active.keys() | _active.keys()
+                     if active.get(isbn) != _active.get(isbn)),
+        "loans_per_card": sum(1 for card_id in loans_per_card.keys() | _loans_per_card.keys()
+                              if loans_per_card.get(card_id) != _loans_per_card.get(card_id)),
+        "fined": len(fined ^ _fined),
+    }
+
+
+def _reload():
+    global _active, _loans_per_card, _fined, _fines_signature
+    global _loaded_at, _synced_at, _synced_on, _max_loan_id
+    if _loaded_at is not None:
+        # Merge other processes' changes first so only real drift shows up
+        _sync()
+    now, today = time.monotonic(), date.today().isoformat()
+    conn = get_db()
+    try:
+        active, loans_per_card, fined, signature, max_loan_id = _load(conn)
+    finally:
+        conn.close()
+    if _loaded_at is not None:
+        drift = _drift(active, loans_per_card, fined)
+        _stats["checks"] += 1
+        _stats["last_check"] = round(time.time(), 3)
+        if any(drift.values()):
+            _stats["checks_with_drift"] += 1
+            _stats["last_drift"] = dict(drift, at=_stats["last_check"])
+            drift_log.warning("circulation state drifted from the database: %s", drift)
+    _active, _loans_per_card, _fined = active, loans_per_card, fined
+    _fines_signature = signature
+    _max_loan_id = max_loan_id
+    _loaded_at = _synced_at = now
+    _synced_on = today
+
+
+def _sync():
+    global _synced_at, _synced_on, _max_loan_id, _fined, _fines_signature
+    now, today = time.monotonic(), date.today().isoformat()
+    conn = get_db()
+    try:
+        new_loans = conn.execute(NEW_LOANS_SQL, (_max_loan_id,)).fetchall()
+        returned = conn.execute(RETURNED_LOANS_SQL, (_synced_on,)).fetchall()
+        signature = tuple(conn.execute(FINES_SIGNATURE_SQL).fetchone())
+        fined = None
+        if signature != _fines_signature:
+            fined = {row["card_id"] for row in conn.execute(FINED_CARDS_SQL)}
+    finally:
+        conn.close()
+    for row in new_loans:
+        if row["date_in"] is None:
+            _add(_active, _loans_per_card, row["loan_id"], row["isbn"], row["card_id"])
+        _max_loan_id = max(_max_loan_id, row["loan_id"])
+    for row in returned:
+        held = _active.get(row["isbn"])
+        if held is not None and held[0] == row["loan_id"]:
+            _remove(_active, _loans_per_card, row["isbn"])
+    if fined is not None:
+        _fined, _fines_signature = fined, signature
+    _synced_at = now
+    _synced_on = today
+
+
+def _ensure_loaded():
+    now = time.monotonic()
+    if _loaded_at is None or now - _loaded_at >= RELOAD_SECONDS:
+        with _lock:
+            if _loaded_at is None or time.monotonic() - _loaded_at >= RELOAD_SECONDS:
+                _reload()
+    elif now - _synced_at >= SYNC_SECONDS:
+        with _lock:
+            if time.monotonic() - _synced_at >= SYNC_SECONDS:
+                _sync()
+
+
+def borrowers_for(isbns):
+    """Map each ISBN in isbns to the card_id holding it, or None if available."""
+    _ensure_loaded()
+    active = _active
+    result = {}
+    for isbn in isbns:
+        held = active.get(isbn)
+        result[isbn] = held[1] if held is not None else None
+    return result
+
+
+def holder(isbn):
+    """card_id holding isbn, or None if it is available."""
+    _ensure_loaded()
+    held = _active.get(isbn)
+    return held[1] if held is not None else None
+
+
+def card_state(card_id):
+    """(open loans, has unpaid fines) for card_id, or None if it has neither.
+
+    None also covers card numbers that do not exist.
+    """
+    _ensure_loaded()
+    loans = _loans_per_card.get(card_id, 0)
+    fined = card_id in _fined
+    if not loans and not fined:
+        return None
+    return loans, fined
+
+
+def mark_checked_out(isbn, card_id, loan_id):
+    """Record a committed checkout."""
+    with _lock:
+        if _loaded_at is not None:
+            _add(_active, _loans_per_card, loan_id, isbn, card_id)
+
+
+def mark_checked_in(isbn):
+    """Record a committed checkin."""
+    with _lock:
+        if _loaded_at is not None:
+            _remove(_active, _loans_per_card, isbn)
+
+
+def mark_fined(card_id):
+    """Record a committed unpaid fine for card_id."""
+    with _lock:
+        if _loaded_at is not None:
+            _fined.add(card_id)
+
+
+def mark_fines_paid(card_id):
+    """Record that all of card_id's fines were paid."""
+    with _lock:
+        if _loaded_at is not None:
+            _fined.discard(card_id)
+
+
+def mark_fines_refreshed():
+    """Re-read the unpaid-fine set on next use, after a fines refresh."""
+    global _fines_signature, _synced_at
+    with _lock:
+        if _loaded_at is not None:
+            _fines_signature = None
+            _synced_at = _loaded_at - SYNC_SECONDS
+
+
+def forget_borrower(card_id):
+    """Drop a deleted borrower; their loans and fines are gone with them."""
+    with _lock:
+        if _loaded_at is None:
+            return
+        if card_id in _loans_per_card:
+            for isbn in [isbn for isbn, held in _active.items() if held[1] == card_id]:
+                _remove(_active, _loans_per_card, isbn)
+        _fined.discard(card_id)
+
+
+def active_count():
+    _ensure_loaded()
+    return len(_active)
+
+
+def circulation_stats():
+    _ensure_loaded()
+    with _lock:
+        return {
+            "open_loans": len(_active),
+            "borrowers_with_loans": len(_loans_per_card),
+            "borrowers_with_fines": len(_fined),
+            "drift_checks": _stats["checks"],
+            "drift_checks_with_drift": _stats["checks_with_drift"],
+            "last_drift_check": _stats["last_check"],
+            "last_drift": _stats["last_drift"],
+        }
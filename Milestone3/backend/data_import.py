@@ -1,63 +1,208 @@
+"""Bulk-load the catalog and borrower CSVs into library.db.
+
+Each CSV is streamed in chunks into its own staging database (in parallel
+worker processes by default), then merged into the library with one
+INSERT OR IGNORE ... SELECT DISTINCT per table. Memory use stays bounded by
+the chunk size regardless of file size.
+
+Run with: python data_import.py [--serial] [--chunk-size N]
+"""
+import argparse
 import csv
+import sqlite3
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
 from pathlib import Path
-from db import get_db
+
+import db
+from search_index import rebuild_search_index
 
 BASE_DIR = Path(__file__).resolve().parent
 DATA_DIR = BASE_DIR.parent / "data"
 
-def load_table_from_csv(conn, table, columns, csv_name, clear_first=False):
-    path = DATA_DIR / csv_name
-    with path.open("r", encoding="utf-8", newline="") as f:
-        reader = csv.DictReader(f)
-        rows = []
-        seen = set()
-        for r in reader:
-            row_tuple = tuple(r[col] if r[col] != "" else None for col in columns)
-            if row_tuple not in seen:
-                rows.append(row_tuple)
-                seen.add(row_tuple)
-    placeholders = ",".join(["?"] * len(columns))
+DEFAULT_CHUNK_SIZE = 50000
+
+# (table, columns, csv file) in load order
+IMPORT_TABLES = [
+    ("BOOK", ["isbn_primary", "isbn10", "isbn13", "title"], "book.csv"),
+    ("AUTHORS", ["author_id", "name"], "authors.csv"),
+    ("BOOK_AUTHORS", ["isbn_primary", "author_id"], "book_authors.csv"),
+    ("BORROWER", ["card_id", "ssn", "bname", "address", "phone"], "borrower.csv"),
+]
+
+# Durability is pointless while filling an empty database: a crash just
+# means running the import again.
+FRESH_LOAD_PRAGMAS = (
+    "PRAGMA journal_mode = OFF",
+    "PRAGMA synchronous = OFF",
+    "PRAGMA cache_size = -262144",
+)
+NORMAL_PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+)
+
+
+def stage_csv(csv_path, columns, staging_path, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Stream csv_path into a STAGING table in its own database file.
+
+    Runs in a worker process. Returns (rows_read, seconds).
+    """
+    started = time.perf_counter()
+    conn = sqlite3.connect(str(staging_path))
+    try:
+        conn.execute("PRAGMA journal_mode = OFF")
+        conn.execute("PRAGMA synchronous = OFF")
+        conn.execute(f"CREATE TABLE STAGING ({', '.join(columns)})")
+        insert_sql = f"INSERT INTO STAGING VALUES ({','.join(['?'] * len(columns))})"
+        rows_read = 0
+        with Path(csv_path).open("r", encoding="utf-8", newline="") as f:
+            reader = csv.DictReader(f)
+            rows = (tuple(r[col] if r[col] != "" else None for col in columns) for r in reader)
+            while True:
+                chunk = list(islice(rows, chunk_size))
+                if not chunk:
+                    break
+                with conn:
+                    conn.executemany(insert_sql, chunk)
+                rows_read += len(chunk)
+                if rows_read % (chunk_size * 10) == 0:
+                    print(f"  {Path(csv_path).name}: {rows_read:,} rows staged", flush=True)
+    finally:
+        conn.close()
+    return rows_read, time.perf_counter() - started
+
+
+def table_is_empty(conn, table):
+    return conn.execute(f"SELECT 1 FROM {table} LIMIT 1").fetchone() is None
+
+
+def secondary_indexes(conn, table):
+    """(name, CREATE statement) of each secondary index on table."""
+    return conn.execute(
+        "SELECT name, sql FROM sqlite_master "
+        "WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL",
+        (table,),
+    ).fetchall()
+
+
+def restore_indexes(conn, indexes):
+    """Recreate any of indexes that a failed merge left dropped."""
+    for name, sql in indexes:
+        exists = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = ?", (name,)
+        ).fetchone()
+        if not exists:
+            conn.execute(sql)
+    conn.commit()
+
+
+def merge_staged(conn, table, columns, staging_path, clear_first=False):
+    """Copy the distinct staged rows into table; returns rows inserted.
+
+    The table's indexes are dropped for the insert and rebuilt afterwards,
+    all in one transaction, so a failed merge leaves them in place.
+    """
     col_list = ",".join(columns)
-    
-    with conn:
-        if clear_first:
-            conn.execute(f"DELETE FROM {table}")
-        sql = f"INSERT OR IGNORE INTO {table} ({col_list}) VALUES ({placeholders})"
-        conn.executemany(sql, rows)
-    print(f"Loaded {len(rows)} rows into {table} from {csv_name}")
-
-def main():
-    conn = get_db()
-
-    load_table_from_csv(
-        conn,
-        "BOOK",
-        ["isbn_primary", "isbn10", "isbn13", "title"],
-        "book.csv",
-    )
-
-    load_table_from_csv(
-        conn,
-        "AUTHORS",
-        ["author_id", "name"],
-        "authors.csv",
-    )
-
-    load_table_from_csv(
-        conn,
-        "BOOK_AUTHORS",
-        ["isbn_primary", "author_id"],
-        "book_authors.csv",
-    )
-
-    load_table_from_csv(
-        conn,
-        "BORROWER",
-        ["card_id", "ssn", "bname", "address", "phone"],
-        "borrower.csv",
-    )
-
-    conn.close()
+    indexes = secondary_indexes(conn, table)
+    conn.execute("ATTACH DATABASE ? AS stage", (str(staging_path),))
+    try:
+        with conn:
+            # sqlite3 only opens a transaction before DML; without this the
+            # DROP INDEXes would each commit on their own
+            conn.execute("BEGIN")
+            if clear_first:
+                conn.execute(f"DELETE FROM {table}")
+            for name, _ in indexes:
+                conn.execute(f"DROP INDEX {name}")
+            cursor = conn.execute(
+                f"INSERT OR IGNORE INTO {table} ({col_list}) "
+                f"SELECT DISTINCT {col_list} FROM stage.STAGING"
+            )
+            inserted = cursor.rowcount
+            for _, sql in indexes:
+                conn.execute(sql)
+    except BaseException:
+        # With journal_mode = OFF (fresh load) the rollback restores nothing
+        restore_indexes(conn, indexes)
+        raise
+    finally:
+        conn.execute("DETACH DATABASE stage")
+    return inserted
+
+
+def report(table, csv_name, inserted, rows_read, seconds):
+    rate = rows_read / seconds if seconds > 0 else float("inf")
+    print(f"Loaded {inserted} rows into {table} from {csv_name} "
+          f"({rows_read:,} read, {rate:,.0f} rows/sec)")
+
+
+def load_table_from_csv(conn, table, columns, csv_name, clear_first=False,
+                        chunk_size=DEFAULT_CHUNK_SIZE):
+    """Stage one CSV and merge it into table (serial path)."""
+    with tempfile.TemporaryDirectory() as tmp:
+        staging_path = Path(tmp) / f"{table}.db"
+        rows_read, seconds = stage_csv(DATA_DIR / csv_name, columns, staging_path, chunk_size)
+        started = time.perf_counter()
+        inserted = merge_staged(conn, table, columns, staging_path, clear_first)
+        report(table, csv_name, inserted, rows_read, seconds + time.perf_counter() - started)
+    return inserted
+
+
+def main(parallel=True, chunk_size=DEFAULT_CHUNK_SIZE):
+    started = time.perf_counter()
+    # A dedicated connection: the import changes journal mode, which pooled
+    # connections must not see half-way.
+    db.close_idle_connections()
+    conn = sqlite3.connect(str(db.DB_PATH))
+    conn.row_factory = sqlite3.Row
+    fresh = all(table_is_empty(conn, table) for table, _, _ in IMPORT_TABLES)
+    try:
+        for pragma in FRESH_LOAD_PRAGMAS if fresh else NORMAL_PRAGMAS:
+            conn.execute(pragma)
+    except sqlite3.OperationalError as e:
+        # Another process (e.g. the server) has the database open
+        print(f"Note: keeping normal journaling ({e})")
+        fresh = False
+    if fresh:
+        print("Empty database: loading with journaling and fsync disabled")
+
+    try:
+        if not parallel:
+            for table, columns, csv_name in IMPORT_TABLES:
+                load_table_from_csv(conn, table, columns, csv_name, chunk_size=chunk_size)
+        else:
+            with tempfile.TemporaryDirectory() as tmp, ProcessPoolExecutor() as pool:
+                futures = []
+                for table, columns, csv_name in IMPORT_TABLES:
+                    staging_path = Path(tmp) / f"{table}.db"
+                    futures.append(pool.submit(
+                        stage_csv, DATA_DIR / csv_name, columns, staging_path, chunk_size
+                    ))
+                # Merge in load order as each staging file becomes ready
+                for (table, columns, csv_name), future in zip(IMPORT_TABLES, futures):
+                    rows_read, seconds = future.result()
+                    merge_started = time.perf_counter()
+                    inserted = merge_staged(conn, table, columns, Path(tmp) / f"{table}.db")
+                    report(table, csv_name, inserted, rows_read,
+                           seconds + time.perf_counter() - merge_started)
+
+        rebuild_search_index(conn)
+    finally:
+        if fresh:
+            for pragma in NORMAL_PRAGMAS:
+                conn.execute(pragma)
+        conn.close()
+    print(f"Import finished in {time.perf_counter() - started:.1f}s")
+
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--serial", action="store_true",
+                        help="stage the CSV files one at a time in this process")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE,
+                        help="rows read and inserted per batch (default %(default)s)")
+    args = parser.parse_args()
+    main(parallel=not args.serial, chunk_size=args.chunk_size)
@@ -1,13 +1,329 @@
+import logging
+import os
+import queue
 import sqlite3
+import threading
+import time
 from pathlib import Path
 
+import metrics
+from profiling import ProfiledCursor
+
 DATA_DIR = Path(__file__).resolve().parent.parent / "data"
 DB_PATH = Path(__file__).resolve().parent / "library.db"
 
+# Maximum number of idle connections kept for reuse
+POOL_SIZE = int(os.environ.get("LIBRARY_DB_POOL_SIZE", "8"))
+
+# Read snapshot (see get_read_db): maximum age in seconds of the copy that
+# read-only routes query; it is refreshed after half that. 0 disables it.
+SNAPSHOT_MAX_AGE = float(os.environ.get("LIBRARY_READ_SNAPSHOT_MAX_AGE", "0"))
+# A refresh lock older than this was left by a crashed process
+SNAPSHOT_LOCK_TIMEOUT = 600
+
+logger = logging.getLogger("library.db")
+
+# Applied once when a pooled connection is opened
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA mmap_size = 268435456",
+    "PRAGMA cache_size = -65536",
+    "PRAGMA temp_store = MEMORY",
+)
+
+# Callables run with every newly opened connection (see add_connection_hook)
+_connection_hooks = []
+
+
+class PooledConnection(sqlite3.Connection):
+    """SQLite connection whose close() hands it back to the pool."""
+
+    def __init__(self, database, *args, **kwargs):
+        super().__init__(database, *args, **kwargs)
+        self.path = database
+        self.had_error = False
+
+    def cursor(self, factory=ProfiledCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        # Go through cursor() so shortcut calls are profiled too
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def rollback(self):
+        # Routes only roll back on failure; recycle this connection afterwards
+        self.had_error = True
+        super().rollback()
+
+    def close(self):
+        self.pool.release(self)
+
+    def really_close(self):
+        super().close()
+
+
+class ConnectionPool:
+    """Bounded LIFO pool of SQLite connections shared across request threads."""
+
+    def __init__(self, size):
+        self.size = size
+        self._idle = queue.LifoQueue(maxsize=size)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.recycled = 0
+
+    def _open(self, database, pragmas, **kwargs):
+        conn = sqlite3.connect(
+            database, factory=PooledConnection, check_same_thread=False, **kwargs
+        )
+        conn.pool = self
+        conn.row_factory = sqlite3.Row
+        for pragma in pragmas:
+            conn.execute(pragma)
+        for hook in _connection_hooks:
+            hook(conn)
+        return conn
+
+    def _connect(self):
+        return self._open(str(DB_PATH), CONNECTION_PRAGMAS)
+
+    def _is_current(self, conn):
+        # DB_PATH can be repointed (scripts, checks)
+        return conn.path == str(DB_PATH)
+
+    def acquire(self):
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                with self._lock:
+                    self.misses += 1
+                return self._connect()
+            if not self._is_current(conn):
+                conn.really_close()
+                continue
+            with self._lock:
+                self.hits += 1
+            return conn
+
+    def release(self, conn):
+        try:
+            if conn.in_transaction:
+                # Early return inside a transaction: discard it, keep the connection
+                sqlite3.Connection.rollback(conn)
+        except sqlite3.Error:
+            conn.had_error = True
+        if conn.had_error or self.size <= 0:
+            self._discard(conn)
+            return
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.really_close()
+
+    def _discard(self, conn):
+        with self._lock:
+            self.recycled += 1
+        try:
+            conn.really_close()
+        except sqlite3.Error:
+            pass
+
+    def clear(self):
+        """Close every idle connection."""
+        while True:
+            try:
+                self._idle.get_nowait().really_close()
+            except queue.Empty:
+                return
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": self.size,
+                "idle": self._idle.qsize(),
+                "hits": self.hits,
+                "misses": self.misses,
+                "recycled": self.recycled,
+            }
+
+
+class SnapshotPool(ConnectionPool):
+    """Pool of read-only connections to the current read snapshot file.
+
+    Snapshots are opened immutable, so queries on them take no locks at all;
+    a connection to a snapshot that has since been replaced is discarded.
+    """
+
+    def __init__(self, size):
+        super().__init__(size)
+        self.refreshes = 0
+        self.refresh_failures = 0
+        self._refreshing = False
+
+    def _connect(self):
+        path = snapshot_path()
+        identity = _file_identity(path)
+        conn = self._open(
+            f"file:{path.as_posix()}?immutable=1",
+            [p for p in CONNECTION_PRAGMAS if "journal_mode" not in p and "synchronous" not in p],
+            uri=True,
+        )
+        conn.snapshot = identity
+        return conn
+
+    def _is_current(self, conn):
+        return conn.snapshot == _file_identity(snapshot_path())
+
+    def refresh_in_background(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def run():
+            try:
+                refresh_snapshot()
+            except Exception:
+                with self._lock:
+                    self.refresh_failures += 1
+                logger.exception("read snapshot refresh failed")
+            finally:
+                self._refreshing = False
+
+        threading.Thread(target=run, name="snapshot-refresh", daemon=True).start()
+
+    def stats(self):
+        stats = super().stats()
+        age = snapshot_age()
+        stats.update(
+            max_age=SNAPSHOT_MAX_AGE,
+            age=round(age, 3) if age is not None else None,
+            refreshes=self.refreshes,
+            refresh_failures=self.refresh_failures,
+        )
+        return stats
+
+
+_pool = ConnectionPool(POOL_SIZE)
+_snapshot_pool = SnapshotPool(POOL_SIZE)
+
+
+def snapshot_path():
+    return DB_PATH.with_name(f"{DB_PATH.stem}-snapshot.db")
+
+
+def _file_identity(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+def snapshot_age():
+    """Seconds since the read snapshot was written, or None if there is none."""
+    try:
+        return time.time() - os.path.getmtime(snapshot_path())
+    except OSError:
+        return None
+
 
 def get_db():
-    """Return a new SQLite connection with row factory for dict-like access."""
-    conn = sqlite3.connect(str(DB_PATH))
-    conn.row_factory = sqlite3.Row
+    """Return a pooled SQLite connection with row factory for dict-like access.
+
+    Calling close() on the connection returns it to the pool.
+    """
+    started = time.perf_counter()
+    conn = _pool.acquire()
+    metrics.observe_db_wait(time.perf_counter() - started)
     return conn
 
+
+def get_read_db(consistent=False):
+    """Return a connection for read-only queries that tolerate some staleness.
+
+    With LIBRARY_READ_SNAPSHOT_MAX_AGE set this reads from a copy of the
+    database at most that many seconds old, so long reports never hold a
+    read transaction on library.db (which would stall WAL checkpoints) or
+    compete with checkouts. Falls back to get_db() when snapshots are off,
+    consistent is true, or no fresh enough snapshot exists yet.
+    """
+    if SNAPSHOT_MAX_AGE <= 0 or consistent:
+        return get_db()
+    age = snapshot_age()
+    if age is None or age >= SNAPSHOT_MAX_AGE / 2:
+        _snapshot_pool.refresh_in_background()
+    if age is None or age >= SNAPSHOT_MAX_AGE:
+        return get_db()
+    started = time.perf_counter()
+    conn = _snapshot_pool.acquire()
+    metrics.observe_db_wait(time.perf_counter() - started)
+    return conn
+
+
+def refresh_snapshot():
+    """Write a new read snapshot with the online backup API.
+
+    The copy is built beside the snapshot and renamed over it, so readers
+    always see a complete file. A lock file keeps server workers from
+    copying at the same time; returns False if another process holds it.
+    """
+    path = snapshot_path()
+    lock = path.with_name(path.name + ".lock")
+    try:
+        fd = os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        try:
+            if time.time() - os.path.getmtime(lock) < SNAPSHOT_LOCK_TIMEOUT:
+                return False
+            os.unlink(lock)
+        except OSError:
+            pass
+        return False
+    try:
+        tmp = path.with_name(path.name + ".tmp")
+        if tmp.exists():
+            tmp.unlink()
+        source = get_db()
+        dest = sqlite3.connect(str(tmp))
+        try:
+            # One step: a single short read transaction on library.db
+            source.backup(dest)
+            dest.execute("PRAGMA journal_mode = DELETE")
+        finally:
+            dest.close()
+            source.close()
+        os.replace(tmp, path)
+        with _snapshot_pool._lock:
+            _snapshot_pool.refreshes += 1
+        return True
+    finally:
+        os.close(fd)
+        os.unlink(lock)
+
+
+def add_connection_hook(hook):
+    """Call hook(conn) on each connection the pool opens from now on."""
+    _connection_hooks.append(hook)
+
+
+def close_idle_connections():
+    """Close every idle pooled connection (e.g. before removing a database file)."""
+    _pool.clear()
+    _snapshot_pool.clear()
+
+
+def pool_stats():
+    """Return hit/miss/recycle counters for the connection pool."""
+    return _pool.stats()
+
+
+def snapshot_stats():
+    """Return pool counters and age of the read snapshot."""
+    return _snapshot_pool.stats()
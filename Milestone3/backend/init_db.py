@@ -1,5 +1,6 @@
 """Initialize database schema from schema.sql"""
 from db import get_db
+from migrations import apply_migrations
 
 def init_schema():
     conn = get_db()
@@ -10,6 +11,7 @@ def init_schema():
         conn.executescript(schema_sql)
         conn.commit()
         print("Database schema created successfully")
+        apply_migrations(conn)
     except Exception as e:
         print(f"Error creating schema: {e}")
         conn.rollback()
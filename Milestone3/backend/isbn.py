@@ -0,0 +1,78 @@
+"""ISBN cleaning, checksum validation and ISBN-10 <-> ISBN-13 conversion.
+
+clean_isbn applies the same rule as Milestone1/normalize.py (keep only
+digits and X), which is how the isbn10/isbn13 columns were produced, so a
+scanned or typed ISBN cleans to the stored form. X is upper-cased here so
+keys in ISBN_LOOKUP have one spelling.
+"""
+import re
+
+NON_ISBN_RE = re.compile(r"[^0-9Xx]")
+# Characters a typed or scanned ISBN may contain besides digits and X
+ISBN_INPUT_RE = re.compile(r"^[0-9Xx\s-]+$")
+
+
+def clean_isbn(raw):
+    """Remove everything except digits and X; preserve leading zeros."""
+    if raw is None:
+        return ""
+    return NON_ISBN_RE.sub("", str(raw).strip()).upper()
+
+
+def isbn10_check_digit(first9):
+    total = sum((10 - i) * int(d) for i, d in enumerate(first9))
+    check = (11 - total % 11) % 11
+    return "X" if check == 10 else str(check)
+
+
+def isbn13_check_digit(first12):
+    total = sum((3 if i % 2 else 1) * int(d) for i, d in enumerate(first12))
+    return str((10 - total % 10) % 10)
+
+
+def is_valid_isbn10(isbn):
+    return (
+        len(isbn) == 10
+        and isbn[:9].isdigit()
+        and isbn[9] == isbn10_check_digit(isbn[:9])
+    )
+
+
+def is_valid_isbn13(isbn):
+    return len(isbn) == 13 and isbn.isdigit() and isbn[12] == isbn13_check_digit(isbn[:12])
+
+
+def to_isbn13(isbn10):
+    body = "978" + isbn10[:9]
+    return body + isbn13_check_digit(body)
+
+
+def to_isbn10(isbn13):
+    """ISBN-10 form of a 978- ISBN-13, or None (979- ISBNs have no ISBN-10)."""
+    if not isbn13.startswith("978"):
+        return None
+    body = isbn13[3:12]
+    return body + isbn10_check_digit(body)
+
+
+def isbn_forms(raw):
+    """Every spelling of raw to look up in ISBN_LOOKUP, or [] if raw isn't ISBN-shaped.
+
+    Input counts as an ISBN when it holds only digits, X, spaces and hyphens
+    and cleans to 10 or 13 characters. The cleaned form is always included
+    (stored ISBNs don't all have valid checksums); the other length is
+    added only when the checksum is valid.
+    """
+    if not raw or not ISBN_INPUT_RE.match(raw):
+        return []
+    isbn = clean_isbn(raw)
+    forms = [isbn]
+    if is_valid_isbn10(isbn):
+        forms.append(to_isbn13(isbn))
+    elif is_valid_isbn13(isbn):
+        converted = to_isbn10(isbn)
+        if converted:
+            forms.append(converted)
+    elif len(isbn) not in (10, 13):
+        return []
+    return forms
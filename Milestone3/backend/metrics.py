@@ -0,0 +1,226 @@
+"""Prometheus text-format metrics for /metrics.
+
+Counters live in per-thread shards of pre-allocated bucket arrays, so the
+request path never takes a lock: each thread only ever writes its own shard
+and a scrape sums them. When a thread exits its shard is folded into the
+retired totals.
+"""
+import os
+import threading
+import time
+import weakref
+from bisect import bisect_left
+
+import db
+import search_cache
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+DB_WAIT_BUCKETS = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _new_histogram(buckets):
+    # One slot per bucket, one for +Inf, then the running sum
+    return [0] * (len(buckets) + 1) + [0.0]
+
+
+class _Shard:
+    __slots__ = ("requests", "in_flight", "db_wait", "__weakref__")
+
+    def __init__(self):
+        self.requests = {}  # (blueprint, endpoint, method, status) -> histogram
+        self.in_flight = 0
+        self.db_wait = _new_histogram(DB_WAIT_BUCKETS)
+
+
+class _ShardOwner:
+    """Lives in the thread-local; retires the thread's shard when the thread ends."""
+
+    def __init__(self, shard):
+        self.shard = shard
+        weakref.finalize(self, _retire, shard)
+
+
+_local = threading.local()
+_shards = []
+_retired = _Shard()
+_shards_lock = threading.Lock()  # only taken on thread start/exit and scrapes
+
+
+def _shard():
+    owner = getattr(_local, "owner", None)
+    if owner is None:
+        shard = _Shard()
+        with _shards_lock:
+            _shards.append(shard)
+        owner = _local.owner = _ShardOwner(shard)
+    return owner.shard
+
+
+def _merge(into, shard):
+    for key, hist in shard.requests.items():
+        target = into.requests.get(key)
+        if target is None:
+            into.requests[key] = list(hist)
+        else:
+            for i, value in enumerate(hist):
+                target[i] += value
+    into.in_flight += shard.in_flight
+    for i, value in enumerate(shard.db_wait):
+        into.db_wait[i] += value
+
+
+def _retire(shard):
+    with _shards_lock:
+        if shard in _shards:
+            _shards.remove(shard)
+            _merge(_retired, shard)
+
+
+def _observe(hist, buckets, value):
+    hist[bisect_left(buckets, value)] += 1
+    hist[-1] += value
+
+
+def request_started():
+    _shard().in_flight += 1
+    return time.perf_counter()
+
+
+def request_finished(started, blueprint, endpoint, method, status):
+    shard = _shard()
+    shard.in_flight -= 1
+    key = (blueprint, endpoint, method, status)
+    hist = shard.requests.get(key)
+    if hist is None:
+        hist = shard.requests[key] = _new_histogram(LATENCY_BUCKETS)
+    _observe(hist, LATENCY_BUCKETS, time.perf_counter() - started)
+
+
+def observe_db_wait(seconds):
+    """Record the time get_db() spent handing out a connection."""
+    _observe(_shard().db_wait, DB_WAIT_BUCKETS, seconds)
+
+
+def _collect():
+    total = _Shard()
+    with _shards_lock:
+        _merge(total, _retired)
+        for shard in _shards:
+            _merge(total, shard)
+    return total
+
+
+def request_summary():
+    """Requests finished and in flight in this process (for worker health)."""
+    total = _collect()
+    finished = sum(sum(hist[:-1]) for hist in total.requests.values())
+    return {"requests": finished, "in_flight": total.in_flight}
+
+
+def _labels(**labels):
+    return ",".join(f'{k}="{v}"' for k, v in labels.items())
+
+
+def _histogram_lines(name, buckets, hist, labels=""):
+    sep = "," if labels else ""
+    lines = []
+    cumulative = 0
+    for bound, count in zip(buckets, hist):
+        cumulative += count
+        lines.append(f'{name}_bucket{{{labels}{sep}le="{bound}"}} {cumulative}')
+    cumulative += hist[len(buckets)]
+    lines.append(f'{name}_bucket{{{labels}{sep}le="+Inf"}} {cumulative}')
+    suffix = f"{{{labels}}}" if labels else ""
+    lines.append(f"{name}_sum{suffix} {hist[-1]:.6f}")
+    lines.append(f"{name}_count{suffix} {cumulative}")
+    return lines
+
+
+def _file_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def _sqlite_settings():
+    conn = db.get_db()
+    try:
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+        page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+        cache_size = conn.execute("PRAGMA cache_size").fetchone()[0]
+    finally:
+        conn.close()
+    # Negative cache_size is in KiB, positive in pages
+    cache_bytes = -cache_size * 1024 if cache_size < 0 else cache_size * page_size
+    return page_size, page_count, cache_bytes
+
+
+def render():
+    """Return all metrics in the Prometheus text exposition format."""
+    total = _collect()
+    lines = [
+        "# HELP library_http_request_duration_seconds Request latency by blueprint and endpoint.",
+        "# TYPE library_http_request_duration_seconds histogram",
+    ]
+    for (blueprint, endpoint, method, status), hist in sorted(total.requests.items()):
+        labels = _labels(blueprint=blueprint, endpoint=endpoint, method=method, status=status)
+        lines += _histogram_lines("library_http_request_duration_seconds", LATENCY_BUCKETS, hist, labels)
+
+    lines += [
+        "# HELP library_http_requests_in_flight Requests currently being served.",
+        "# TYPE library_http_requests_in_flight gauge",
+        f"library_http_requests_in_flight {total.in_flight}",
+        "# HELP library_db_connection_wait_seconds Time spent acquiring a database connection.",
+        "# TYPE library_db_connection_wait_seconds histogram",
+    ]
+    lines += _histogram_lines("library_db_connection_wait_seconds", DB_WAIT_BUCKETS, total.db_wait)
+
+    pool = db.pool_stats()
+    checkouts = pool["hits"] + pool["misses"]
+    lines += [
+        "# HELP library_db_pool_idle_connections Idle connections in the pool.",
+        "# TYPE library_db_pool_idle_connections gauge",
+        f"library_db_pool_idle_connections {pool['idle']}",
+        "# HELP library_db_pool_acquires_total Connections handed out, by whether one was reused.",
+        "# TYPE library_db_pool_acquires_total counter",
+        f'library_db_pool_acquires_total{{result="hit"}} {pool["hits"]}',
+        f'library_db_pool_acquires_total{{result="miss"}} {pool["misses"]}',
+        "# HELP library_db_pool_hit_ratio Share of acquires served by an already open connection.",
+        "# TYPE library_db_pool_hit_ratio gauge",
+        f"library_db_pool_hit_ratio {pool['hits'] / checkouts if checkouts else 0:.6f}",
+        "# HELP library_db_pool_recycled_total Connections discarded after an error.",
+        "# TYPE library_db_pool_recycled_total counter",
+        f"library_db_pool_recycled_total {pool['recycled']}",
+    ]
+
+    cache = search_cache.cache_stats()
+    lines += [
+        "# HELP library_search_cache_lookups_total Search cache lookups by result.",
+        "# TYPE library_search_cache_lookups_total counter",
+        f'library_search_cache_lookups_total{{result="hit"}} {cache["hits"]}',
+        f'library_search_cache_lookups_total{{result="miss"}} {cache["misses"]}',
+        "# HELP library_search_cache_evictions_total Entries evicted to stay within the size bound.",
+        "# TYPE library_search_cache_evictions_total counter",
+        f"library_search_cache_evictions_total {cache['evictions']}",
+        "# HELP library_search_cache_entries Queries currently cached.",
+        "# TYPE library_search_cache_entries gauge",
+        f"library_search_cache_entries {cache['entries']}",
+    ]
+
+    page_size, page_count, cache_bytes = _sqlite_settings()
+    lines += [
+        "# HELP library_sqlite_database_bytes Size of the main database (page_count * page_size).",
+        "# TYPE library_sqlite_database_bytes gauge",
+        f"library_sqlite_database_bytes {page_size * page_count}",
+        "# HELP library_sqlite_wal_bytes Size of the write-ahead log file.",
+        "# TYPE library_sqlite_wal_bytes gauge",
+        f"library_sqlite_wal_bytes {_file_size(str(db.DB_PATH) + '-wal')}",
+        "# HELP library_sqlite_page_cache_bytes Page cache budget per connection.",
+        "# TYPE library_sqlite_page_cache_bytes gauge",
+        f"library_sqlite_page_cache_bytes {cache_bytes}",
+    ]
+    return "\n".join(lines) + "\n"
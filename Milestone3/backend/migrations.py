@@ -0,0 +1,447 @@
+"""Versioned schema migrations, tracked with PRAGMA user_version.
+
+Each migration runs once, in order, inside its own transaction. Append new
+entries to MIGRATIONS; never edit one that has already shipped.
+"""
+from db import get_db
+
+
+class MigrationError(Exception):
+    """The database holds data a migration cannot apply to; repair it first."""
+
+
+# Every open loan of an ISBN that has more than one
+CONFLICTING_OPEN_LOANS_SQL = """
+SELECT bl.loan_id, bl.isbn, bl.card_id, bl.date_out
+FROM BOOK_LOANS bl
+WHERE bl.date_in IS NULL
+  AND bl.isbn IN (
+      SELECT isbn FROM BOOK_LOANS
+      WHERE date_in IS NULL
+      GROUP BY isbn
+      HAVING COUNT(*) > 1
+  )
+ORDER BY bl.isbn, bl.loan_id
+"""
+
+MIGRATIONS = [
+    (
+        1,
+        "Secondary indexes for loan, fine and author lookups",
+        """
+        -- Borrower eligibility: active loan count and fines by card
+        CREATE INDEX IF NOT EXISTS idx_book_loans_card
+            ON BOOK_LOANS (card_id, date_in);
+        -- Availability checks and search: open loan (and borrower) per ISBN
+        CREATE INDEX IF NOT EXISTS idx_book_loans_isbn
+            ON BOOK_LOANS (isbn, date_in, card_id);
+        -- Fines refresh: open loans past their due date
+        CREATE INDEX IF NOT EXISTS idx_book_loans_active_due
+            ON BOOK_LOANS (due_date) WHERE date_in IS NULL;
+        -- Unpaid fine lookups and listings
+        CREATE INDEX IF NOT EXISTS idx_fines_paid
+            ON FINES (paid, loan_id, fine_amt);
+        -- Author -> books
+        CREATE INDEX IF NOT EXISTS idx_book_authors_author
+            ON BOOK_AUTHORS (author_id, isbn_primary);
+        """,
+    ),
+    (
+        2,
+        "Fines refresh log and index on returned loans for incremental refresh",
+        """
+        CREATE TABLE IF NOT EXISTS FINES_REFRESH_LOG (
+            run_id    INTEGER PRIMARY KEY AUTOINCREMENT,
+            run_on    TEXT NOT NULL,
+            mode      TEXT NOT NULL,
+            refreshed INTEGER NOT NULL
+        );
+        -- Incremental refresh: loans returned since the last run
+        CREATE INDEX IF NOT EXISTS idx_book_loans_date_in
+            ON BOOK_LOANS (date_in) WHERE date_in IS NOT NULL;
+        """,
+    ),
+    (
+        3,
+        "Index for keyset pagination of the admin loans list",
+        """
+        CREATE INDEX IF NOT EXISTS idx_book_loans_date_out
+            ON BOOK_LOANS (date_out, loan_id);
+        """,
+    ),
+    (
+        4,
+        "BORROWER_SUMMARY table with per-borrower active loans and unpaid fines",
+        """
+        CREATE TABLE IF NOT EXISTS BORROWER_SUMMARY (
+            card_id      TEXT NOT NULL,
+            active_loans INTEGER NOT NULL DEFAULT 0,
+            unpaid_fines REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (card_id)
+        );
+
+        INSERT OR REPLACE INTO BORROWER_SUMMARY (card_id, active_loans, unpaid_fines)
+        SELECT
+            b.card_id,
+            (SELECT COUNT(*) FROM BOOK_LOANS bl
+             WHERE bl.card_id = b.card_id AND bl.date_in IS NULL),
+            (SELECT COALESCE(SUM(f.fine_amt), 0) FROM FINES f
+             JOIN BOOK_LOANS bl ON f.loan_id = bl.loan_id
+             WHERE bl.card_id = b.card_id AND f.paid = 0)
+        FROM BORROWER b;
+
+        CREATE TRIGGER IF NOT EXISTS trg_borrower_summary_borrower_ins
+        AFTER INSERT ON BORROWER
+        BEGIN
+            INSERT OR IGNORE INTO BORROWER_SUMMARY (card_id) VALUES (NEW.card_id);
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_borrower_summary_borrower_del
+        AFTER DELETE ON BORROWER
+        BEGIN
+            DELETE FROM BORROWER_SUMMARY WHERE card_id = OLD.card_id;
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_borrower_summary_loan_ins
+        AFTER INSERT ON BOOK_LOANS
+        WHEN NEW.date_in IS NULL
+        BEGIN
+            UPDATE BORROWER_SUMMARY SET active_loans = active_loans + 1
+            WHERE card_id = NEW.card_id;
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_borrower_summary_loan_upd
+        AFTER UPDATE OF date_in, card_id ON BOOK_LOANS
+        BEGIN
+            UPDATE BORROWER_SUMMARY SET active_loans = active_loans - 1
+            WHERE card_id = OLD.card_id AND OLD.date_in IS NULL;
+            UPDATE BORROWER_SUMMARY SET active_loans = active_loans + 1
+            WHERE card_id = NEW.card_id AND NEW.date_in IS NULL;
+            -- Unpaid fines follow the loan if it moves to another borrower
+            UPDATE BORROWER_SUMMARY SET unpaid_fines = unpaid_fines - (
+                SELECT COALESCE(SUM(fine_amt), 0) FROM FINES
+                WHERE loan_id = OLD.loan_id AND paid = 0)
+            WHERE card_id = OLD.card_id AND OLD.card_id <> NEW.card_id;
+            UPDATE BORROWER_SUMMARY SET unpaid_fines = unpaid_fines + (
+                SELECT COALESCE(SUM(fine_amt), 0) FROM FINES
+                WHERE loan_id = NEW.loan_id AND paid = 0)
+            WHERE card_id = NEW.card_id AND OLD.card_id <> NEW.card_id;
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_borrower_summary_loan_del
+        AFTER DELETE ON BOOK_LOANS
+        WHEN OLD.date_in IS NULL
+        BEGIN
+            UPDATE BORROWER_SUMMARY SET active_loans = active_loans - 1
+            WHERE card_id = OLD.card_id;
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_borrower_summary_fine_ins
+        AFTER INSERT ON FINES
+        WHEN NEW.paid = 0
+        BEGIN
+            UPDATE BORROWER_SUMMARY SET unpaid_fines = unpaid_fines + NEW.fine_amt
+            WHERE card_id = (SELECT card_id FROM BOOK_LOANS WHERE loan_id = NEW.loan_id);
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_borrower_summary_fine_upd
+        AFTER UPDATE OF fine_amt, paid, loan_id ON FINES
+        BEGIN
+            UPDATE BORROWER_SUMMARY SET unpaid_fines = unpaid_fines - OLD.fine_amt
+            WHERE OLD.paid = 0
+              AND card_id = (SELECT card_id FROM BOOK_LOANS WHERE loan_id = OLD.loan_id);
+            UPDATE BORROWER_SUMMARY SET unpaid_fines = unpaid_fines + NEW.fine_amt
+            WHERE NEW.paid = 0
+              AND card_id = (SELECT card_id FROM BOOK_LOANS WHERE loan_id = NEW.loan_id);
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_borrower_summary_fine_del
+        AFTER DELETE ON FINES
+        WHEN OLD.paid = 0
+        BEGIN
+            UPDATE BORROWER_SUMMARY SET unpaid_fines = unpaid_fines - OLD.fine_amt
+            WHERE card_id = (SELECT card_id FROM BOOK_LOANS WHERE loan_id = OLD.loan_id);
+        END;
+        """,
+    ),
+    (
+        5,
+        "BOOK_AUTHOR_NAMES table with each book's comma-joined author names",
+        """
+        CREATE TABLE IF NOT EXISTS BOOK_AUTHOR_NAMES (
+            isbn_primary TEXT NOT NULL,
+            authors      TEXT NOT NULL,
+            PRIMARY KEY (isbn_primary)
+        );
+
+        INSERT OR REPLACE INTO BOOK_AUTHOR_NAMES (isbn_primary, authors)
+        SELECT ba.isbn_primary, GROUP_CONCAT(a.name, ', ')
+        FROM BOOK_AUTHORS ba
+        JOIN AUTHORS a ON a.author_id = ba.author_id
+        GROUP BY ba.isbn_primary;
+
+        CREATE TRIGGER IF NOT EXISTS trg_book_author_names_link_ins
+        AFTER INSERT ON BOOK_AUTHORS
+        BEGIN
+            DELETE FROM BOOK_AUTHOR_NAMES WHERE isbn_primary = NEW.isbn_primary;
+            INSERT INTO BOOK_AUTHOR_NAMES (isbn_primary, authors)
+            SELECT ba.isbn_primary, GROUP_CONCAT(a.name, ', ')
+            FROM BOOK_AUTHORS ba
+            JOIN AUTHORS a ON a.author_id = ba.author_id
+            WHERE ba.isbn_primary = NEW.isbn_primary
+            GROUP BY ba.isbn_primary;
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_book_author_names_link_del
+        AFTER DELETE ON BOOK_AUTHORS
+        BEGIN
+            DELETE FROM BOOK_AUTHOR_NAMES WHERE isbn_primary = OLD.isbn_primary;
+            INSERT INTO BOOK_AUTHOR_NAMES (isbn_primary, authors)
+            SELECT ba.isbn_primary, GROUP_CONCAT(a.name, ', ')
+            FROM BOOK_AUTHORS ba
+            JOIN AUTHORS a ON a.author_id = ba.author_id
+            WHERE ba.isbn_primary = OLD.isbn_primary
+            GROUP BY ba.isbn_primary;
+        END;
+
+        -- Author inserts, renames and deletes touch every book they wrote
+        CREATE TRIGGER IF NOT EXISTS trg_book_author_names_author_ins
+        AFTER INSERT ON AUTHORS
+        BEGIN
+            INSERT OR REPLACE INTO BOOK_AUTHOR_NAMES (isbn_primary, authors)
+            SELECT ba.isbn_primary, GROUP_CONCAT(a.name, ', ')
+            FROM BOOK_AUTHORS ba
+            JOIN AUTHORS a ON a.author_id = ba.author_id
+            WHERE ba.isbn_primary IN (
+                SELECT isbn_primary FROM BOOK_AUTHORS WHERE author_id = NEW.author_id)
+            GROUP BY ba.isbn_primary;
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_book_author_names_author_upd
+        AFTER UPDATE OF name ON AUTHORS
+        BEGIN
+            INSERT OR REPLACE INTO BOOK_AUTHOR_NAMES (isbn_primary, authors)
+            SELECT ba.isbn_primary, GROUP_CONCAT(a.name, ', ')
+            FROM BOOK_AUTHORS ba
+            JOIN AUTHORS a ON a.author_id = ba.author_id
+            WHERE ba.isbn_primary IN (
+                SELECT isbn_primary FROM BOOK_AUTHORS WHERE author_id = NEW.author_id)
+            GROUP BY ba.isbn_primary;
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_book_author_names_author_del
+        AFTER DELETE ON AUTHORS
+        BEGIN
+            DELETE FROM BOOK_AUTHOR_NAMES WHERE isbn_primary IN (
+                SELECT isbn_primary FROM BOOK_AUTHORS WHERE author_id = OLD.author_id);
+            INSERT INTO BOOK_AUTHOR_NAMES (isbn_primary, authors)
+            SELECT ba.isbn_primary, GROUP_CONCAT(a.name, ', ')
+            FROM BOOK_AUTHORS ba
+            JOIN AUTHORS a ON a.author_id = ba.author_id
+            WHERE ba.isbn_primary IN (
+                SELECT isbn_primary FROM BOOK_AUTHORS WHERE author_id = OLD.author_id)
+            GROUP BY ba.isbn_primary;
+        END;
+        """,
+    ),
+    (
+        6,
+        "ISBN_LOOKUP table mapping every stored ISBN form to isbn_primary",
+        """
+        -- Keys are upper-cased (X check digit); isbn.py cleans queries the same way
+        CREATE TABLE IF NOT EXISTS ISBN_LOOKUP (
+            isbn         TEXT NOT NULL,
+            isbn_primary TEXT NOT NULL,
+            PRIMARY KEY (isbn)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS idx_isbn_lookup_primary
+            ON ISBN_LOOKUP (isbn_primary);
+
+        INSERT OR IGNORE INTO ISBN_LOOKUP (isbn, isbn_primary)
+        SELECT UPPER(isbn_primary), isbn_primary FROM BOOK
+        UNION ALL
+        SELECT UPPER(isbn10), isbn_primary FROM BOOK WHERE isbn10 <> ''
+        UNION ALL
+        SELECT UPPER(isbn13), isbn_primary FROM BOOK WHERE isbn13 <> '';
+
+        CREATE TRIGGER IF NOT EXISTS trg_isbn_lookup_ins
+        AFTER INSERT ON BOOK
+        BEGIN
+            INSERT OR IGNORE INTO ISBN_LOOKUP (isbn, isbn_primary)
+            SELECT UPPER(NEW.isbn_primary), NEW.isbn_primary
+            UNION ALL
+            SELECT UPPER(NEW.isbn10), NEW.isbn_primary WHERE NEW.isbn10 <> ''
+            UNION ALL
+            SELECT UPPER(NEW.isbn13), NEW.isbn_primary WHERE NEW.isbn13 <> '';
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_isbn_lookup_upd
+        AFTER UPDATE OF isbn_primary, isbn10, isbn13 ON BOOK
+        BEGIN
+            DELETE FROM ISBN_LOOKUP WHERE isbn_primary = OLD.isbn_primary;
+            INSERT OR IGNORE INTO ISBN_LOOKUP (isbn, isbn_primary)
+            SELECT UPPER(NEW.isbn_primary), NEW.isbn_primary
+            UNION ALL
+            SELECT UPPER(NEW.isbn10), NEW.isbn_primary WHERE NEW.isbn10 <> ''
+            UNION ALL
+            SELECT UPPER(NEW.isbn13), NEW.isbn_primary WHERE NEW.isbn13 <> '';
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_isbn_lookup_del
+        AFTER DELETE ON BOOK
+        BEGIN
+            DELETE FROM ISBN_LOOKUP WHERE isbn_primary = OLD.isbn_primary;
+        END;
+        """,
+    ),
+    (
+        7,
+        "Unique partial index: at most one open loan per ISBN",
+        """
+        -- Refused by check_one_open_loan while any ISBN still has two open
+        -- loans (left by a checkout race); see repair_db.py --keep.
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_book_loans_one_active
+            ON BOOK_LOANS (isbn) WHERE date_in IS NULL;
+        """,
+    ),
+    (
+        8,
+        "BORROWER_NAME_SEARCH full-text index of borrower names",
+        """
+        -- Word-prefix matching on names for /api/checkin/search. card_id is
+        -- indexed too so the triggers can find a borrower's row by MATCH.
+        CREATE VIRTUAL TABLE IF NOT EXISTS BORROWER_NAME_SEARCH USING fts5(
+            card_id,
+            bname,
+            tokenize = 'unicode61 remove_diacritics 2',
+            prefix = '2 3'
+        );
+
+        DELETE FROM BORROWER_NAME_SEARCH;
+        INSERT INTO BORROWER_NAME_SEARCH (card_id, bname)
+        SELECT card_id, bname FROM BORROWER;
+
+        CREATE TRIGGER IF NOT EXISTS trg_borrower_name_search_ins
+        AFTER INSERT ON BORROWER
+        BEGIN
+            INSERT INTO BORROWER_NAME_SEARCH (card_id, bname)
+            VALUES (NEW.card_id, NEW.bname);
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_borrower_name_search_upd
+        AFTER UPDATE OF card_id, bname ON BORROWER
+        BEGIN
+            DELETE FROM BORROWER_NAME_SEARCH
+            WHERE BORROWER_NAME_SEARCH MATCH 'card_id : "' || replace(OLD.card_id, '"', '""') || '"'
+              AND card_id = OLD.card_id;
+            INSERT INTO BORROWER_NAME_SEARCH (card_id, bname)
+            VALUES (NEW.card_id, NEW.bname);
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_borrower_name_search_del
+        AFTER DELETE ON BORROWER
+        BEGIN
+            DELETE FROM BORROWER_NAME_SEARCH
+            WHERE BORROWER_NAME_SEARCH MATCH 'card_id : "' || replace(OLD.card_id, '"', '""') || '"'
+              AND card_id = OLD.card_id;
+        END;
+        """,
+    ),
+    (
+        9,
+        "BOOK_SEARCH full-text index for databases created before it was in schema.sql",
+        """
+        -- Same definition as schema.sql; see search_index.rebuild_search_index
+        CREATE VIRTUAL TABLE IF NOT EXISTS BOOK_SEARCH USING fts5(
+            isbn_primary,
+            isbn10,
+            isbn13,
+            title,
+            authors,
+            tokenize = 'trigram'
+        );
+
+        -- Fill it only if it is empty, so an index built by data_import.py
+        -- is not rebuilt needlessly
+        INSERT INTO BOOK_SEARCH (isbn_primary, isbn10, isbn13, title, authors)
+        SELECT
+            b.isbn_primary,
+            COALESCE(b.isbn10, ''),
+            COALESCE(b.isbn13, ''),
+            b.title,
+            COALESCE(n.authors, '')
+        FROM BOOK b
+        LEFT JOIN BOOK_AUTHOR_NAMES n ON n.isbn_primary = b.isbn_primary
+        WHERE NOT EXISTS (SELECT 1 FROM BOOK_SEARCH);
+        """,
+    ),
+]
+
+
+def check_one_open_loan(conn):
+    """Refuse migration 7 while an ISBN has more than one open loan.
+
+    Which loan is real needs a person to decide, so nothing is changed here.
+    """
+    conflicts = {}
+    for row in conn.execute(CONFLICTING_OPEN_LOANS_SQL):
+        conflicts.setdefault(row["isbn"], []).append(str(row["loan_id"]))
+    if conflicts:
+        listing = "; ".join(f"{isbn}: loan_id {', '.join(ids)}" for isbn, ids in conflicts.items())
+        raise MigrationError(
+            f"{len(conflicts)} ISBN(s) have more than one open loan ({listing}). "
+            "Check in the wrong ones, or run python repair_db.py --keep <loan_id> "
+            "with the loan to keep for each ISBN, then migrate again."
+        )
+
+
+# Run before the migration of the same version; they raise MigrationError
+PRECHECKS = {
+    7: check_one_open_loan,
+}
+
+
+def get_schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def apply_migrations(conn):
+    """Apply every migration newer than the database's user_version.
+
+    Returns the list of versions that were applied.
+    """
+    applied = []
+    current = get_schema_version(conn)
+    for version, description, sql in MIGRATIONS:
+        if version <= current:
+            continue
+        precheck = PRECHECKS.get(version)
+        if precheck is not None:
+            precheck(conn)
+        conn.executescript(
+            f"BEGIN;\n{sql}\nPRAGMA user_version = {int(version)};\nCOMMIT;"
+        )
+        print(f"Applied migration {version}: {description}")
+        applied.append(version)
+    return applied
+
+
+def migrate_database():
+    """Bring library.db up to date; skipped if the schema has not been created yet."""
+    conn = get_db()
+    try:
+        cursor = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'BOOK_LOANS'"
+        )
+        if not cursor.fetchone():
+            return []
+        return apply_migrations(conn)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    # Run with: python migrations.py
+    applied = migrate_database()
+    if not applied:
+        print(f"Database already at schema version {MIGRATIONS[-1][0]}")
@@ -0,0 +1,236 @@
+"""Pre-fork production server: N worker processes sharing one listening socket.
+
+The master binds the socket, applies migrations (in a subprocess) and forks
+the workers; it never imports the app, so each worker imports it, and opens
+its SQLite connections, after the fork. Every worker runs asgi.application
+under uvicorn; the kernel spreads accepted connections across them, and
+with WAL mode their reads run in parallel on separate cores.
+
+Signals to the master (pid in server.pid):
+  SIGHUP          zero-downtime reload: start a new generation of workers
+                  (with freshly imported code), wait until each is serving,
+                  then drain and stop the old ones
+  SIGTERM/SIGINT  graceful shutdown: workers finish in-flight requests
+
+Workers that die are restarted. Per-worker health: GET /api/health/workers.
+
+Run with: python prefork.py [--workers N] [--threads N] [--host H] [--port P]
+"""
+import argparse
+import os
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import worker_status
+
+BASE_DIR = Path(__file__).resolve().parent
+PID_FILE = BASE_DIR / "server.pid"
+# Seconds a new generation gets to start serving before a reload is abandoned
+READY_TIMEOUT_SECONDS = 60
+# Matches asgi.GRACEFUL_SHUTDOWN_SECONDS, plus a margin before SIGKILL
+STOP_TIMEOUT_SECONDS = 35
+# A worker dying sooner than this after start is delayed before respawning
+MIN_WORKER_LIFETIME_SECONDS = 1
+
+
+def log(message):
+    print(f"[prefork {os.getpid()}] {message}", flush=True)
+
+
+def run_worker(sock, worker_id, generation, threads, status_dir):
+    """Body of a forked worker process; never returns."""
+    os.setpgid(0, 0)  # Terminal CTRL+C reaches the master only
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGCHLD):
+        signal.signal(signum, signal.SIG_DFL)
+    os.environ["LIBRARY_WORKER_ID"] = str(worker_id)
+    os.environ["LIBRARY_WORKER_GENERATION"] = str(generation)
+    os.environ["LIBRARY_WORKER_STATUS_DIR"] = status_dir
+    # worker_status was imported by the master before these were set
+    worker_status.WORKER_ID = str(worker_id)
+    worker_status.GENERATION = generation
+    worker_status.STATUS_DIR = status_dir
+    worker_status.STARTED = time.time()
+
+    code = 0
+    try:
+        import uvicorn
+        import asgi
+        import db
+        import metrics
+
+        asgi.application.threads = threads
+        server = uvicorn.Server(uvicorn.Config(
+            asgi.application,
+            lifespan="on",
+            log_level="warning",
+            timeout_graceful_shutdown=asgi.GRACEFUL_SHUTDOWN_SECONDS,
+        ))
+        worker_status.start_heartbeat(
+            lambda: server.started,
+            lambda: dict(metrics.request_summary(), db_pool=db.pool_stats()),
+        )
+        server.run(sockets=[sock])
+    except BaseException as e:
+        log(f"worker {worker_id} failed: {e!r}")
+        code = 1
+    finally:
+        try:
+            worker_status.status_path(status_dir, os.getpid()).unlink()
+        except OSError:
+            pass
+        os._exit(code)
+
+
+class Master:
+    def __init__(self, sock, workers, threads, status_dir):
+        self.sock = sock
+        self.size = workers
+        self.threads = threads
+        self.status_dir = status_dir
+        self.generation = 0
+        self.workers = {}  # pid -> (worker_id, generation, started)
+        self.reload_requested = False
+        self.stop_requested = False
+
+    def spawn(self, worker_id, generation):
+        pid = os.fork()
+        if pid == 0:
+            run_worker(self.sock, worker_id, generation, self.threads, self.status_dir)
+        self.workers[pid] = (worker_id, generation, time.monotonic())
+        return pid
+
+    def reap(self):
+        """Collect exited workers; restart current-generation ones that died."""
+        while self.workers:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            worker_id, generation, started = self.workers.pop(pid)
+            try:
+                worker_status.status_path(self.status_dir, pid).unlink()
+            except OSError:
+                pass
+            if self.stop_requested or generation != self.generation:
+                continue
+            log(f"worker {worker_id} (pid {pid}) exited with status {status}; restarting")
+            if time.monotonic() - started < MIN_WORKER_LIFETIME_SECONDS:
+                time.sleep(MIN_WORKER_LIFETIME_SECONDS)
+            self.spawn(worker_id, generation)
+
+    def ready(self, pids):
+        return all(worker_status.status_path(self.status_dir, pid).exists() for pid in pids)
+
+    def signal_workers(self, pids, signum):
+        for pid in pids:
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
+
+    def reload(self):
+        old = [pid for pid, (_, gen, _) in self.workers.items() if gen == self.generation]
+        previous = self.generation
+        self.generation += 1
+        log(f"reloading: starting generation {self.generation}")
+        new = [self.spawn(worker_id, self.generation) for worker_id in range(1, self.size + 1)]
+
+        deadline = time.monotonic() + READY_TIMEOUT_SECONDS
+        while time.monotonic() < deadline and not self.stop_requested:
+            self.reap()
+            if not all(pid in self.workers for pid in new):
+                break  # A new worker died during startup
+            if self.ready(new):
+                log(f"generation {self.generation} serving; stopping generation {previous}")
+                self.signal_workers(old, signal.SIGTERM)
+                return
+            time.sleep(0.1)
+
+        log(f"reload failed; keeping generation {previous}")
+        failed = self.generation
+        self.generation = previous
+        # Includes any replacements reap() started for crashed new workers
+        self.signal_workers([pid for pid, (_, gen, _) in self.workers.items() if gen == failed],
+                            signal.SIGTERM)
+
+    def stop(self):
+        log("shutting down")
+        self.signal_workers(list(self.workers), signal.SIGTERM)
+        deadline = time.monotonic() + STOP_TIMEOUT_SECONDS
+        while self.workers and time.monotonic() < deadline:
+            self.reap()
+            time.sleep(0.1)
+        self.signal_workers(list(self.workers), signal.SIGKILL)
+        while self.workers:
+            pid, _ = os.waitpid(-1, 0)
+            self.workers.pop(pid, None)
+
+    def run(self):
+        def request_reload(signum, frame):
+            self.reload_requested = True
+
+        def request_stop(signum, frame):
+            self.stop_requested = True
+
+        signal.signal(signal.SIGHUP, request_reload)
+        signal.signal(signal.SIGTERM, request_stop)
+        signal.signal(signal.SIGINT, request_stop)
+
+        self.generation = 1
+        for worker_id in range(1, self.size + 1):
+            self.spawn(worker_id, self.generation)
+        while not self.stop_requested:
+            self.reap()
+            if self.reload_requested:
+                self.reload_requested = False
+                self.reload()
+            time.sleep(0.2)
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the library API with pre-forked workers")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="worker processes (default: one per core, %(default)s)")
+    parser.add_argument("--threads", type=int, default=None,
+                        help="request threads per worker (default: LIBRARY_ASGI_THREADS or the DB pool size)")
+    args = parser.parse_args()
+
+    if not hasattr(os, "fork"):
+        sys.exit("prefork.py needs os.fork(); on Windows run python asgi.py instead")
+
+    # Run migrations in a child so the master never opens the database
+    subprocess.run([sys.executable, str(BASE_DIR / "migrations.py")], check=True)
+
+    threads = args.threads or int(os.environ.get(
+        "LIBRARY_ASGI_THREADS", os.environ.get("LIBRARY_DB_POOL_SIZE", "8")))
+    sock = socket.create_server((args.host, args.port), backlog=2048)
+    sock.set_inheritable(True)
+    status_dir = tempfile.mkdtemp(prefix="library-workers-")
+    PID_FILE.write_text(str(os.getpid()))
+    log(f"serving on http://{args.host}:{args.port} with {args.workers} workers x {threads} threads")
+    try:
+        Master(sock, args.workers, threads, status_dir).run()
+    finally:
+        sock.close()
+        shutil.rmtree(status_dir, ignore_errors=True)
+        try:
+            if PID_FILE.read_text() == str(os.getpid()):
+                PID_FILE.unlink()
+        except OSError:
+            pass
+
+
+if __name__ == "__main__":
+    main()
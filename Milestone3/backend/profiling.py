@@ -0,0 +1,266 @@
+"""Per-request SQL and JSON profiling.
+
+Pooled connections hand out ProfiledCursor objects, which add the time spent
+in execute/fetch calls to the profile of the request being served. app.py
+starts a profile before each request, reports it in a Server-Timing header
+and folds it into a rolling per-route window served by /api/admin/metrics.
+Streamed responses get no Server-Timing header (it is sent before the body
+is produced); their profile is recorded once the stream is closed.
+Statements slower than LIBRARY_SLOW_QUERY_MS are logged with their
+EXPLAIN QUERY PLAN.
+
+Set LIBRARY_PROFILING=0 to turn the instrumentation off.
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+
+ENABLED = os.environ.get("LIBRARY_PROFILING", "1") != "0"
+SLOW_QUERY_MS = float(os.environ.get("LIBRARY_SLOW_QUERY_MS", "100"))
+
+# Requests kept per route for the percentile window
+WINDOW_SIZE = 1000
+# Upper bounds (ms) of the latency histogram buckets
+BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+slow_log = logging.getLogger("library.slow_query")
+
+_current = ContextVar("request_profile", default=None)
+
+
+class RequestProfile:
+    """Counters for one request."""
+
+    __slots__ = ("route", "started", "statements", "db_seconds", "rows", "json_seconds")
+
+    def __init__(self, route):
+        self.route = route
+        self.started = time.perf_counter()
+        self.statements = 0
+        self.db_seconds = 0.0
+        self.rows = 0
+        self.json_seconds = 0.0
+
+    def server_timing(self, total_seconds):
+        return (
+            f'db;dur={self.db_seconds * 1000:.2f};desc="{self.statements} statements, {self.rows} rows", '
+            f"json;dur={self.json_seconds * 1000:.2f}, "
+            f"total;dur={total_seconds * 1000:.2f}"
+        )
+
+
+def _explain(conn, sql, parameters):
+    try:
+        # Base-class calls so the EXPLAIN itself is not profiled
+        cursor = sqlite3.Connection.execute(conn, f"EXPLAIN QUERY PLAN {sql}", parameters)
+        rows = sqlite3.Cursor.fetchall(cursor)
+        return "; ".join(row[3] for row in rows)
+    except sqlite3.Error as e:
+        return f"(no plan: {e})"
+
+
+def _record(cursor, seconds, rows=0, statement=False):
+    profile = _current.get()
+    if profile is not None:
+        profile.statements += statement
+        profile.db_seconds += seconds
+        profile.rows += rows
+    # Execute and fetch time both count towards the statement's duration
+    cursor.elapsed += seconds
+    if cursor.elapsed * 1000 >= SLOW_QUERY_MS and not cursor.logged:
+        cursor.logged = True
+        plan = _explain(cursor.connection, cursor.sql, cursor.parameters)
+        _metrics.add_slow_query(cursor.sql, cursor.elapsed, plan)
+        slow_log.warning("slow query (%.1f ms): %s | plan: %s",
+                         cursor.elapsed * 1000, " ".join(cursor.sql.split()), plan)
+
+
+class ProfiledCursor(sqlite3.Cursor):
+    """Cursor that times execute/fetch calls and iteration into the current request profile."""
+
+    sql = ""
+    parameters = ()
+    elapsed = 0.0
+    logged = False
+
+    def _start(self, sql, parameters):
+        self.sql = sql
+        self.parameters = parameters
+        self.elapsed = 0.0
+        self.logged = False
+        return time.perf_counter()
+
+    def execute(self, sql, parameters=()):
+        started = self._start(sql, parameters)
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            _record(self, time.perf_counter() - started, statement=True)
+
+    def executemany(self, sql, seq_of_parameters):
+        # Plan the slow-query EXPLAIN with the first parameter set when available
+        first = seq_of_parameters[0] if isinstance(seq_of_parameters, (list, tuple)) and seq_of_parameters else ()
+        started = self._start(sql, first)
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            _record(self, time.perf_counter() - started, statement=True)
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        _record(self, time.perf_counter() - started, 0 if row is None else 1)
+        return row
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        _record(self, time.perf_counter() - started, len(rows))
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        _record(self, time.perf_counter() - started, len(rows))
+        return rows
+
+    def __next__(self):
+        # Iterating the cursor (e.g. NDJSON streams) fetches row by row
+        started = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            _record(self, time.perf_counter() - started)
+            raise
+        _record(self, time.perf_counter() - started, 1)
+        return row
+
+
+def start_request(route):
+    """Begin profiling the current request; returns the profile or None."""
+    if not ENABLED:
+        return None
+    profile = RequestProfile(route)
+    _current.set(profile)
+    return profile
+
+
+def finish_request(profile):
+    """Stop profiling; records the request and returns its total seconds."""
+    _current.set(None)
+    total = time.perf_counter() - profile.started
+    _metrics.add_request(profile, total)
+    return total
+
+
+def add_json_time(seconds):
+    profile = _current.get()
+    if profile is not None:
+        profile.json_seconds += seconds
+
+
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    k = (len(sorted_values) - 1) * pct / 100.0
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+class RouteMetrics:
+    """Rolling window of the most recent requests for one route."""
+
+    def __init__(self):
+        self.count = 0
+        # (total_ms, db_ms, json_ms, statements, rows) per request
+        self.window = deque(maxlen=WINDOW_SIZE)
+        self.buckets = [0] * (len(BUCKETS_MS) + 1)
+
+    def add(self, total_ms, db_ms, json_ms, statements, rows):
+        self.count += 1
+        self.window.append((total_ms, db_ms, json_ms, statements, rows))
+        for i, bound in enumerate(BUCKETS_MS):
+            if total_ms <= bound:
+                self.buckets[i] += 1
+                break
+        else:
+            self.buckets[-1] += 1
+
+    def snapshot(self):
+        n = len(self.window)
+        totals = sorted(r[0] for r in self.window)
+
+        def avg(i):
+            return round(sum(r[i] for r in self.window) / n, 3) if n else None
+
+        bounds = list(BUCKETS_MS) + [None]
+        return {
+            "count": self.count,
+            "window": n,
+            "p50_ms": round(_percentile(totals, 50), 3) if n else None,
+            "p95_ms": round(_percentile(totals, 95), 3) if n else None,
+            "p99_ms": round(_percentile(totals, 99), 3) if n else None,
+            "avg_total_ms": avg(0),
+            "avg_db_ms": avg(1),
+            "avg_json_ms": avg(2),
+            "avg_statements": avg(3),
+            "avg_rows": avg(4),
+            "histogram": [{"le_ms": b, "count": c} for b, c in zip(bounds, self.buckets)],
+        }
+
+
+class Metrics:
+    """Process-wide per-route metrics and recent slow queries."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.routes = {}
+        self.slow_queries = deque(maxlen=50)
+
+    def add_request(self, profile, total_seconds):
+        with self._lock:
+            route = self.routes.get(profile.route)
+            if route is None:
+                route = self.routes[profile.route] = RouteMetrics()
+            route.add(total_seconds * 1000, profile.db_seconds * 1000,
+                      profile.json_seconds * 1000, profile.statements, profile.rows)
+
+    def add_slow_query(self, sql, seconds, plan):
+        with self._lock:
+            self.slow_queries.append({
+                "sql": " ".join(sql.split()),
+                "ms": round(seconds * 1000, 3),
+                "plan": plan,
+                "at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            })
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "enabled": ENABLED,
+                "slow_query_ms": SLOW_QUERY_MS,
+                "routes": {name: m.snapshot() for name, m in sorted(self.routes.items())},
+                "slow_queries": list(self.slow_queries),
+            }
+
+    def reset(self):
+        with self._lock:
+            self.routes.clear()
+            self.slow_queries.clear()
+
+
+_metrics = Metrics()
+
+
+def metrics_snapshot():
+    """Return per-route timing windows and recent slow queries."""
+    return _metrics.snapshot()
+
+
+def reset_metrics():
+    _metrics.reset()
@@ -1,9 +1,17 @@
 """Repair database integrity issues after manual deletions."""
+import argparse
 import sqlite3
 from db import get_db
+from borrower_summary import rebuild_borrower_summary
+from migrations import CONFLICTING_OPEN_LOANS_SQL
 
-def repair_database():
-    """Fix orphaned records and integrity issues."""
+def repair_database(keep=()):
+    """Fix orphaned records and integrity issues.
+
+    ISBNs with more than one open loan are only listed, unless keep holds
+    the loan_id to keep for that ISBN; its other open loans are then
+    marked returned the day they went out.
+    """
     try:
         conn = get_db()
     except sqlite3.DatabaseError as e:
@@ -107,7 +115,50 @@ def repair_database():
             """)
             print(f"  Deleted {len(orphaned_author_refs)} orphaned book_authors entries")
         
+        # Check for ISBNs with more than one open loan (checkout race).
+        # Which loan is real is not for this script to guess.
+        cursor.execute(CONFLICTING_OPEN_LOANS_SQL)
+        conflicts = {}
+        for loan in cursor.fetchall():
+            conflicts.setdefault(loan["isbn"], []).append(loan)
+        
+        if conflicts:
+            print(f"Found {len(conflicts)} ISBNs with more than one open loan")
+        unresolved = 0
+        for isbn, loans in conflicts.items():
+            kept = [loan for loan in loans if loan["loan_id"] in keep]
+            if len(kept) != 1:
+                unresolved += 1
+                print(f"  Book {isbn}:")
+                for loan in loans:
+                    print(f"    loan {loan['loan_id']}: borrower {loan['card_id']}, "
+                          f"out {loan['date_out']}")
+                continue
+            for loan in loans:
+                if loan is kept[0]:
+                    continue
+                cursor.execute(
+                    "UPDATE BOOK_LOANS SET date_in = date_out WHERE loan_id = ?",
+                    (loan["loan_id"],),
+                )
+                print(f"  Marked loan {loan['loan_id']} (book {isbn}, borrower "
+                      f"{loan['card_id']}, out {loan['date_out']}) returned; "
+                      f"kept loan {kept[0]['loan_id']}")
+        if unresolved:
+            print(f"  Left {unresolved} ISBN(s) unchanged: rerun with --keep <loan_id> "
+                  "for the loan to keep on each")
+        
         conn.commit()
+        
+        # Recompute per-borrower counts in case triggers were bypassed. Not
+        # migrated here: migration 7 can need the repairs above first.
+        cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'BORROWER_SUMMARY'"
+        )
+        if cursor.fetchone():
+            rebuild_borrower_summary(conn)
+        else:
+            print("BORROWER_SUMMARY not created yet; run python migrations.py to build it")
         print("\nDatabase repair completed successfully!")
         
         # Verify integrity
@@ -126,6 +177,11 @@ def repair_database():
         conn.close()
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--keep", type=int, action="append", default=[], metavar="LOAN_ID",
+                        help="open loan to keep for its ISBN; the ISBN's other open "
+                             "loans are marked returned (repeat for each ISBN)")
+    args = parser.parse_args()
     print("Repairing database...")
-    repair_database()
+    repair_database(keep=set(args.keep))
 
@@ -1,252 +1,325 @@
-from flask import Blueprint, jsonify, request
-from db import get_db
+import json
+from flask import Blueprint, Response, jsonify, request
+from db import get_db, get_read_db
+from profiling import metrics_snapshot, reset_metrics
+from search_cache import cache_stats
+from write_queue import queue_stats
+from circulation import circulation_stats, mark_fined
 
 bp = Blueprint("admin", __name__, url_prefix="/api/admin")
 
+# Upper bound for ?limit=N on the list endpoints
+MAX_PAGE_SIZE = 1000
 
-@bp.route("/borrowers", methods=["GET"])
-def get_all_borrowers():
-    """Get all borrowers with loan and fine counts."""
-    conn = get_db()
+
+def parse_page_args(key_parts):
+    """Read ?after=<key>&limit=N&stream=ndjson for a keyset-paginated list.
+
+    key_parts is the number of "|"-separated values in the keyset cursor.
+    Returns (after, limit, stream); after is a tuple or None, limit an int or
+    None. Raises ValueError on malformed input.
+    """
+    raw_limit = request.args.get("limit", "").strip()
+    limit = None
+    if raw_limit:
+        limit = int(raw_limit)
+        if limit < 1:
+            raise ValueError("limit must be a positive integer")
+        limit = min(limit, MAX_PAGE_SIZE)
+
+    raw_after = request.args.get("after", "").strip()
+    after = None
+    if raw_after:
+        after = tuple(raw_after.split("|"))
+        if len(after) != key_parts:
+            raise ValueError("after is not a valid cursor for this list")
+
+    stream = request.args.get("stream", "").lower() == "ndjson"
+    return after, limit, stream
+
+
+def consistent_read():
+    """?consistent=1 reads library.db itself instead of the read snapshot."""
+    return request.args.get("consistent") == "1"
+
+
+def stream_rows(sql, params, serialize, consistent=False):
+    """Stream query results as NDJSON, one row per line, straight from the cursor."""
+    def generate():
+        conn = get_read_db(consistent)
+        try:
+            cursor = conn.cursor()
+            cursor.execute(sql, params)
+            for row in cursor:
+                yield json.dumps(serialize(row)) + "\n"
+        finally:
+            conn.close()
+
+    return Response(generate(), mimetype="application/x-ndjson")
+
+
+def list_response(sql, params, serialize, key_of, limit, stream):
+    """Run a list query and return it as a JSON array (or NDJSON stream).
+
+    When the page is full, the cursor for the next page is returned in the
+    X-Next-After header.
+    """
+    if limit is not None:
+        sql += "\nLIMIT ?"
+        params = list(params) + [limit]
+
+    if stream:
+        return stream_rows(sql, params, serialize, consistent_read())
+
+    conn = get_read_db(consistent_read())
     try:
         cursor = conn.cursor()
-        search = request.args.get("search", "").strip()
-        
-        # Build query
-        if search:
-            sql = """
-                SELECT 
-                    b.card_id,
-                    b.ssn,
-                    b.bname,
-                    b.address,
-                    b.phone,
-                    COALESCE(loan_counts.active_loans, 0) as active_loans,
-                    COALESCE(fine_totals.unpaid_fines, 0) as unpaid_fines
-                FROM BORROWER b
-                LEFT JOIN (
-                    SELECT card_id, COUNT(*) as active_loans
-                    FROM BOOK_LOANS
-                    WHERE date_in IS NULL
-                    GROUP BY card_id
-                ) loan_counts ON b.card_id = loan_counts.card_id
-                LEFT JOIN (
-                    SELECT bl.card_id, SUM(f.fine_amt) as unpaid_fines
-                    FROM FINES f
-                    JOIN BOOK_LOANS bl ON f.loan_id = bl.loan_id
-                    WHERE f.paid = 0
-                    GROUP BY bl.card_id
-                ) fine_totals ON b.card_id = fine_totals.card_id
-                WHERE 
-                    LOWER(b.card_id) LIKE LOWER(?) OR
-                    LOWER(b.bname) LIKE LOWER(?) OR
-                    LOWER(b.ssn) LIKE LOWER(?)
-                ORDER BY b.card_id
-            """
-            search_term = f"%{search}%"
-            cursor.execute(sql, (search_term, search_term, search_term))
-        else:
-            sql = """
-                SELECT 
-                    b.card_id,
-                    b.ssn,
-                    b.bname,
-                    b.address,
-                    b.phone,
-                    COALESCE(loan_counts.active_loans, 0) as active_loans,
-                    COALESCE(fine_totals.unpaid_fines, 0) as unpaid_fines
-                FROM BORROWER b
-                LEFT JOIN (
-                    SELECT card_id, COUNT(*) as active_loans
-                    FROM BOOK_LOANS
-                    WHERE date_in IS NULL
-                    GROUP BY card_id
-                ) loan_counts ON b.card_id = loan_counts.card_id
-                LEFT JOIN (
-                    SELECT bl.card_id, SUM(f.fine_amt) as unpaid_fines
-                    FROM FINES f
-                    JOIN BOOK_LOANS bl ON f.loan_id = bl.loan_id
-                    WHERE f.paid = 0
-                    GROUP BY bl.card_id
-                ) fine_totals ON b.card_id = fine_totals.card_id
-                ORDER BY b.card_id
-            """
-            cursor.execute(sql)
-        
+        cursor.execute(sql, params)
         rows = cursor.fetchall()
-        results = []
-        for row in rows:
-            results.append({
-                "card_id": row["card_id"],
-                "ssn": row["ssn"],
-                "bname": row["bname"],
-                "address": row["address"],
-                "phone": row["phone"],
-                "active_loans": row["active_loans"],
-                "unpaid_fines": round(row["unpaid_fines"], 2)
-            })
-        
-        return jsonify(results), 200
-        
+        response = jsonify([serialize(row) for row in rows])
+        if limit is not None and len(rows) == limit:
+            response.headers["X-Next-After"] = "|".join(str(part) for part in key_of(rows[-1]))
+        return response, 200
     except Exception as e:
         return jsonify({"error": "Database error", "details": str(e)}), 500
     finally:
         conn.close()
 
 
+def serialize_borrower(row):
+    return {
+        "card_id": row["card_id"],
+        "ssn": row["ssn"],
+        "bname": row["bname"],
+        "address": row["address"],
+        "phone": row["phone"],
+        "active_loans": row["active_loans"],
+        "unpaid_fines": round(row["unpaid_fines"], 2)
+    }
+
+
+def serialize_loan(row):
+    return {
+        "loan_id": row["loan_id"],
+        "isbn": row["isbn"],
+        "card_id": row["card_id"],
+        "borrower_name": row["borrower_name"],
+        "title": row["title"],
+        "date_out": row["date_out"],
+        "due_date": row["due_date"],
+        "date_in": row["date_in"]
+    }
+
+
+def serialize_fine(row):
+    return {
+        "loan_id": row["loan_id"],
+        "card_id": row["card_id"],
+        "borrower_name": row["borrower_name"],
+        "isbn": row["isbn"],
+        "title": row["title"],
+        "due_date": row["due_date"],
+        "date_in": row["date_in"],
+        "days_late": max(0, row["days_late"] or 0),
+        "fine_amt": round(row["fine_amt"], 2),
+        "paid": bool(row["paid"])
+    }
+
+
+@bp.route("/borrowers", methods=["GET"])
+def get_all_borrowers():
+    """Get all borrowers with loan and fine counts (from BORROWER_SUMMARY).
+
+    Keyset-paginated by card_id: ?after=<card_id>&limit=N.
+    """
+    search = request.args.get("search", "").strip()
+    try:
+        after, limit, stream = parse_page_args(1)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    # Build conditions
+    conditions = []
+    params = []
+
+    if search:
+        conditions.append("""
+            (LOWER(b.card_id) LIKE LOWER(?) OR
+             LOWER(b.bname) LIKE LOWER(?) OR
+             LOWER(b.ssn) LIKE LOWER(?))
+        """)
+        search_term = f"%{search}%"
+        params.extend([search_term, search_term, search_term])
+
+    if after:
+        conditions.append("b.card_id > ?")
+        params.append(after[0])
+
+    where_clause = " AND ".join(conditions) if conditions else "1=1"
+
+    sql = f"""
+        SELECT 
+            b.card_id,
+            b.ssn,
+            b.bname,
+            b.address,
+            b.phone,
+            COALESCE(s.active_loans, 0) as active_loans,
+            COALESCE(s.unpaid_fines, 0) as unpaid_fines
+        FROM BORROWER b
+        LEFT JOIN BORROWER_SUMMARY s ON s.card_id = b.card_id
+        WHERE {where_clause}
+        ORDER BY b.card_id
+    """
+
+    return list_response(
+        sql, params, serialize_borrower,
+        lambda row: (row["card_id"],), limit, stream,
+    )
+
+
 @bp.route("/loans", methods=["GET"])
 def get_all_loans():
-    """Get all loans with optional filtering."""
-    conn = get_db()
+    """Get all loans with optional filtering.
+
+    Keyset-paginated newest first: ?after=<date_out>|<loan_id>&limit=N.
+    """
+    filter_type = request.args.get("filter", "all")
+    search = request.args.get("search", "").strip()
     try:
-        cursor = conn.cursor()
-        filter_type = request.args.get("filter", "all")
-        search = request.args.get("search", "").strip()
-        
-        # Build conditions
-        conditions = []
-        params = []
-        
-        if filter_type == "active":
-            conditions.append("bl.date_in IS NULL")
-        elif filter_type == "returned":
-            conditions.append("bl.date_in IS NOT NULL")
-        
-        if search:
-            conditions.append("""
-                (LOWER(bl.isbn) LIKE LOWER(?) OR
-                 LOWER(bl.card_id) LIKE LOWER(?) OR
-                 LOWER(b.bname) LIKE LOWER(?))
-            """)
-            search_term = f"%{search}%"
-            params.extend([search_term, search_term, search_term])
-        
-        where_clause = " AND ".join(conditions) if conditions else "1=1"
-        
-        sql = f"""
-            SELECT 
-                bl.loan_id,
-                bl.isbn,
-                bl.card_id,
-                bl.date_out,
-                bl.due_date,
-                bl.date_in,
-                b.bname as borrower_name,
-                book.title
-            FROM BOOK_LOANS bl
-            JOIN BORROWER b ON bl.card_id = b.card_id
-            LEFT JOIN BOOK book ON bl.isbn = book.isbn_primary
-            WHERE {where_clause}
-            ORDER BY bl.date_out DESC
-        """
-        
-        cursor.execute(sql, params)
-        rows = cursor.fetchall()
-        
-        results = []
-        for row in rows:
-            results.append({
-                "loan_id": row["loan_id"],
-                "isbn": row["isbn"],
-                "card_id": row["card_id"],
-                "borrower_name": row["borrower_name"],
-                "title": row["title"],
-                "date_out": row["date_out"],
-                "due_date": row["due_date"],
-                "date_in": row["date_in"]
-            })
-        
-        return jsonify(results), 200
-        
-    except Exception as e:
-        return jsonify({"error": "Database error", "details": str(e)}), 500
-    finally:
-        conn.close()
+        after, limit, stream = parse_page_args(2)
+        if after:
+            after = (after[0], int(after[1]))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    # Build conditions
+    conditions = []
+    params = []
+
+    if filter_type == "active":
+        conditions.append("bl.date_in IS NULL")
+    elif filter_type == "returned":
+        conditions.append("bl.date_in IS NOT NULL")
+
+    if search:
+        conditions.append("""
+            (LOWER(bl.isbn) LIKE LOWER(?) OR
+             LOWER(bl.card_id) LIKE LOWER(?) OR
+             LOWER(b.bname) LIKE LOWER(?))
+        """)
+        search_term = f"%{search}%"
+        params.extend([search_term, search_term, search_term])
+
+    if after:
+        conditions.append("(bl.date_out, bl.loan_id) < (?, ?)")
+        params.extend(after)
+
+    where_clause = " AND ".join(conditions) if conditions else "1=1"
+
+    sql = f"""
+        SELECT 
+            bl.loan_id,
+            bl.isbn,
+            bl.card_id,
+            bl.date_out,
+            bl.due_date,
+            bl.date_in,
+            b.bname as borrower_name,
+            book.title
+        FROM BOOK_LOANS bl
+        JOIN BORROWER b ON bl.card_id = b.card_id
+        LEFT JOIN BOOK book ON bl.isbn = book.isbn_primary
+        WHERE {where_clause}
+        ORDER BY bl.date_out DESC, bl.loan_id DESC
+    """
+
+    return list_response(
+        sql, params, serialize_loan,
+        lambda row: (row["date_out"], row["loan_id"]), limit, stream,
+    )
 
 
 @bp.route("/fines", methods=["GET"])
 def get_all_fines():
-    """Get all fines with detailed information."""
-    conn = get_db()
+    """Get all fines with detailed information.
+
+    Keyset-paginated unpaid first, latest due date first:
+    ?after=<paid>|<due_date>|<loan_id>&limit=N.
+    """
+    filter_type = request.args.get("filter", "unpaid")
+    search = request.args.get("search", "").strip()
     try:
-        cursor = conn.cursor()
-        filter_type = request.args.get("filter", "unpaid")
-        search = request.args.get("search", "").strip()
-        
-        # Build conditions
-        conditions = []
-        params = []
-        
-        if filter_type == "unpaid":
-            conditions.append("f.paid = 0")
-        elif filter_type == "paid":
-            conditions.append("f.paid = 1")
-        
-        if search:
-            conditions.append("""
-                (LOWER(bl.card_id) LIKE LOWER(?) OR
-                 LOWER(b.bname) LIKE LOWER(?))
-            """)
-            search_term = f"%{search}%"
-            params.extend([search_term, search_term])
-        
-        where_clause = " AND ".join(conditions) if conditions else "1=1"
-        
-        sql = f"""
-            SELECT 
-                f.loan_id,
-                f.fine_amt,
-                f.paid,
-                bl.card_id,
-                bl.isbn,
-                bl.due_date,
-                bl.date_in,
-                b.bname as borrower_name,
-                book.title,
-                CASE
-                    WHEN bl.date_in IS NOT NULL THEN
-                        CAST((julianday(bl.date_in) - julianday(bl.due_date)) AS INTEGER)
-                    ELSE
-                        CAST((julianday('now') - julianday(bl.due_date)) AS INTEGER)
-                END as days_late
-            FROM FINES f
-            JOIN BOOK_LOANS bl ON f.loan_id = bl.loan_id
-            JOIN BORROWER b ON bl.card_id = b.card_id
-            LEFT JOIN BOOK book ON bl.isbn = book.isbn_primary
-            WHERE {where_clause}
-            ORDER BY f.paid, bl.due_date DESC
-        """
-        
-        cursor.execute(sql, params)
-        rows = cursor.fetchall()
-        
-        results = []
-        for row in rows:
-            results.append({
-                "loan_id": row["loan_id"],
-                "card_id": row["card_id"],
-                "borrower_name": row["borrower_name"],
-                "isbn": row["isbn"],
-                "title": row["title"],
-                "due_date": row["due_date"],
-                "date_in": row["date_in"],
-                "days_late": max(0, row["days_late"] or 0),
-                "fine_amt": round(row["fine_amt"], 2),
-                "paid": bool(row["paid"])
-            })
-        
-        return jsonify(results), 200
-        
-    except Exception as e:
-        return jsonify({"error": "Database error", "details": str(e)}), 500
-    finally:
-        conn.close()
+        after, limit, stream = parse_page_args(3)
+        if after:
+            after = (int(after[0]), after[1], int(after[2]))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    # Build conditions
+    conditions = []
+    params = []
+
+    if filter_type == "unpaid":
+        conditions.append("f.paid = 0")
+    elif filter_type == "paid":
+        conditions.append("f.paid = 1")
+
+    if search:
+        conditions.append("""
+            (LOWER(bl.card_id) LIKE LOWER(?) OR
+             LOWER(b.bname) LIKE LOWER(?))
+        """)
+        search_term = f"%{search}%"
+        params.extend([search_term, search_term])
+
+    if after:
+        # ORDER BY mixes ASC and DESC, so spell out the row comparison
+        paid, due_date, loan_id = after
+        conditions.append("""
+            (f.paid > ? OR
+             (f.paid = ? AND (bl.due_date < ? OR
+                              (bl.due_date = ? AND f.loan_id < ?))))
+        """)
+        params.extend([paid, paid, due_date, due_date, loan_id])
+
+    where_clause = " AND ".join(conditions) if conditions else "1=1"
+
+    sql = f"""
+        SELECT 
+            f.loan_id,
+            f.fine_amt,
+            f.paid,
+            bl.card_id,
+            bl.isbn,
+            bl.due_date,
+            bl.date_in,
+            b.bname as borrower_name,
+            book.title,
+            CASE
+                WHEN bl.date_in IS NOT NULL THEN
+                    CAST((julianday(bl.date_in) - julianday(bl.due_date)) AS INTEGER)
+                ELSE
+                    CAST((julianday('now') - julianday(bl.due_date)) AS INTEGER)
+            END as days_late
+        FROM FINES f
+        JOIN BOOK_LOANS bl ON f.loan_id = bl.loan_id
+        JOIN BORROWER b ON bl.card_id = b.card_id
+        LEFT JOIN BOOK book ON bl.isbn = book.isbn_primary
+        WHERE {where_clause}
+        ORDER BY f.paid, bl.due_date DESC, f.loan_id DESC
+    """
+
+    return list_response(
+        sql, params, serialize_fine,
+        lambda row: (row["paid"], row["due_date"], row["loan_id"]), limit, stream,
+    )
 
 
 @bp.route("/stats", methods=["GET"])
 def get_stats():
     """Get system statistics."""
-    conn = get_db()
+    conn = get_read_db(consistent_read())
     try:
         cursor = conn.cursor()
         
@@ -264,6 +337,18 @@ def get_stats():
         conn.close()
 
 
+@bp.route("/metrics", methods=["GET"])
+def get_metrics():
+    """Per-route request timings and recent slow queries (?reset=true clears them)."""
+    snapshot = metrics_snapshot()
+    snapshot["search_cache"] = cache_stats()
+    snapshot["write_queue"] = queue_stats()
+    snapshot["circulation"] = circulation_stats()
+    if request.args.get("reset", "").lower() == "true":
+        reset_metrics()
+    return jsonify(snapshot), 200
+
+
 @bp.route("/fines/apply", methods=["POST"])
 def apply_fine():
     """Manually apply a fine to a loan (for testing purposes)."""
@@ -337,6 +422,7 @@ def apply_fine():
             action = "created"
         
         conn.commit()
+        mark_fined(loan["card_id"])
         
         return jsonify({
             "success": True,
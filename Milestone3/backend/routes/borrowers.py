@@ -1,5 +1,6 @@
 from flask import Blueprint, jsonify, request
 from db import get_db
+import circulation
 import re
 
 bp = Blueprint("borrowers", __name__, url_prefix="/api")
@@ -138,6 +139,7 @@ def delete_borrower(card_id):
         cursor.execute("DELETE FROM BORROWER WHERE card_id = ?", (card_id,))
         
         conn.commit()
+        circulation.forget_borrower(card_id)
         
         return jsonify({
             "message": "Borrower deleted successfully",
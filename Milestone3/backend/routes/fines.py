@@ -1,69 +1,103 @@
 from flask import Blueprint, jsonify, request
 from db import get_db
+import circulation
 from datetime import date
 
 bp = Blueprint("fines", __name__, url_prefix="/api")
 
 
+# Upsert a fine for every late loan in one statement. Paid fines are left
+# untouched by the conflict clause. {late} selects the loans to consider.
+REFRESH_FINES_SQL = """
+    INSERT INTO FINES (loan_id, fine_amt, paid)
+    SELECT
+        loan_id,
+        CAST(julianday(COALESCE(date_in, :today)) - julianday(due_date) AS INTEGER) * 0.25,
+        0
+    FROM BOOK_LOANS
+    WHERE {late}
+    ON CONFLICT(loan_id) DO UPDATE SET fine_amt = excluded.fine_amt
+    WHERE FINES.paid = 0
+"""
+
+# Still out and past due, or returned after the due date
+LATE_LOANS = "(date_in IS NULL AND due_date < :today) OR (date_in IS NOT NULL AND date_in > due_date)"
+
+# Incremental: open late loans (their fines grow daily) plus loans returned
+# since the last run; fines on older returned loans are already final.
+LATE_LOANS_SINCE = (
+    "(date_in IS NULL AND due_date < :today) OR "
+    "(date_in IS NOT NULL AND date_in >= :since AND date_in > due_date)"
+)
+
+
+def refresh_fines(cursor, today, since=None):
+    """Create or update unpaid fines for late loans; returns rows changed.
+
+    With since (YYYY-MM-DD), returned loans are only considered if they came
+    back on or after that date.
+    """
+    if since is None:
+        sql = REFRESH_FINES_SQL.format(late=LATE_LOANS)
+        params = {"today": today}
+    else:
+        sql = REFRESH_FINES_SQL.format(late=LATE_LOANS_SINCE)
+        params = {"today": today, "since": since}
+    cursor.execute(sql, params)
+    return cursor.rowcount
+
+
+def refresh_loan_fines(cursor, today, loan_ids):
+    """Create or update unpaid fines for the late loans among loan_ids.
+
+    Returns {loan_id: (fine_amt, paid)} for those that have a fine.
+    """
+    fines = {}
+    # Stay well under SQLite's host parameter limit
+    for start in range(0, len(loan_ids), 500):
+        chunk = loan_ids[start:start + 500]
+        params = {f"l{i}": loan_id for i, loan_id in enumerate(chunk)}
+        placeholders = ",".join(f":{name}" for name in params)
+        late = f"loan_id IN ({placeholders}) AND COALESCE(date_in, :today) > due_date"
+        cursor.execute(REFRESH_FINES_SQL.format(late=late), dict(params, today=today))
+        cursor.execute(f"SELECT loan_id, fine_amt, paid FROM FINES WHERE loan_id IN ({placeholders})", params)
+        for row in cursor.fetchall():
+            fines[row["loan_id"]] = (row["fine_amt"], row["paid"])
+    return fines
+
+
+def last_refresh_date(cursor):
+    """Date of the most recent fines refresh, or None if it never ran."""
+    cursor.execute("SELECT MAX(run_on) AS run_on FROM FINES_REFRESH_LOG")
+    row = cursor.fetchone()
+    return row["run_on"] if row else None
+
+
 @bp.post("/fines/refresh")
 def fines_refresh():
-    """Refresh fines for all late books."""
+    """Refresh fines for all late books.
+
+    ?incremental=true skips returned loans whose fines were settled by an
+    earlier run; the first run is always a full refresh.
+    """
+    incremental = request.args.get("incremental", "false").lower() == "true"
     conn = get_db()
     try:
         cursor = conn.cursor()
         today = date.today().isoformat()
-        refreshed_count = 0
-        
-        # Get all loans that are late (due_date < today or (date_in > due_date))
+
+        since = last_refresh_date(cursor) if incremental else None
+        mode = "incremental" if since else "full"
+        refreshed_count = refresh_fines(cursor, today, since)
+
         cursor.execute("""
-            SELECT loan_id, due_date, date_in
-            FROM BOOK_LOANS
-            WHERE (date_in IS NULL AND due_date < ?) OR (date_in IS NOT NULL AND date_in > due_date)
-        """, (today,))
-        
-        loans = cursor.fetchall()
-        
-        for loan in loans:
-            loan_id = loan["loan_id"]
-            due_date = loan["due_date"]
-            date_in = loan["date_in"]
-            
-            # Calculate days late
-            if date_in:
-                # Book has been returned - calculate from date_in
-                due = date.fromisoformat(due_date)
-                returned = date.fromisoformat(date_in)
-                days_late = (returned - due).days
-            else:
-                # Book still out - calculate from today
-                due = date.fromisoformat(due_date)
-                today_date = date.today()
-                days_late = (today_date - due).days
-            
-            if days_late > 0:
-                fine_amt = days_late * 0.25
-                
-                # Check if fine already exists
-                cursor.execute("SELECT paid FROM FINES WHERE loan_id = ?", (loan_id,))
-                existing = cursor.fetchone()
-                
-                if existing:
-                    # Fine exists - only update if not paid
-                    if existing["paid"] == 0:
-                        cursor.execute("""
-                            UPDATE FINES SET fine_amt = ? WHERE loan_id = ?
-                        """, (fine_amt, loan_id))
-                        refreshed_count += 1
-                else:
-                    # Create new fine
-                    cursor.execute("""
-                        INSERT INTO FINES (loan_id, fine_amt, paid)
-                        VALUES (?, ?, 0)
-                    """, (loan_id, fine_amt))
-                    refreshed_count += 1
-        
+            INSERT INTO FINES_REFRESH_LOG (run_on, mode, refreshed)
+            VALUES (?, ?, ?)
+        """, (today, mode, refreshed_count))
+
         conn.commit()
-        return jsonify({"refreshed": refreshed_count}), 200
+        circulation.mark_fines_refreshed()
+        return jsonify({"refreshed": refreshed_count, "mode": mode}), 200
         
     except Exception as e:
         conn.rollback()
@@ -184,6 +218,7 @@ def fines_pay():
         
         paid_count = cursor.rowcount
         conn.commit()
+        circulation.mark_fines_paid(card_no)
         
         return jsonify({"paid": paid_count}), 200
         
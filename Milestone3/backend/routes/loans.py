@@ -1,9 +1,46 @@
+import sqlite3
 from datetime import date, timedelta
 from flask import Blueprint, jsonify, request
 from db import get_db
+from isbn import clean_isbn, isbn_forms
+from routes.fines import refresh_loan_fines
+from search_index import fts_prefix_terms
+import circulation
+import write_queue
 
 bp = Blueprint("loans", __name__, url_prefix="/api")
 
+# Maximum active loans per borrower
+MAX_ACTIVE_LOANS = 3
+# Maximum loan IDs plus ISBNs in one batch checkin
+MAX_CHECKIN_BATCH = 1000
+# Loans returned by /checkin/search (?limit=)
+DEFAULT_CHECKIN_RESULTS = 50
+MAX_CHECKIN_RESULTS = 500
+
+# Checkout as one statement: the loan is inserted only if every rule holds.
+# Runs inside the writer's BEGIN IMMEDIATE transaction, and the unique
+# partial index idx_book_loans_one_active rejects a second open loan for
+# the same ISBN even from another process.
+CHECKOUT_SQL = f"""
+INSERT INTO BOOK_LOANS (isbn, card_id, date_out, due_date, date_in)
+SELECT :isbn, :card_id, :date_out, :due_date, NULL
+WHERE EXISTS (SELECT 1 FROM BOOK WHERE isbn_primary = :isbn)
+  AND EXISTS (SELECT 1 FROM BORROWER WHERE card_id = :card_id)
+  AND NOT EXISTS (
+      SELECT 1 FROM FINES f
+      JOIN BOOK_LOANS bl ON f.loan_id = bl.loan_id
+      WHERE bl.card_id = :card_id AND f.paid = 0
+  )
+  AND (
+      SELECT COUNT(*) FROM BOOK_LOANS
+      WHERE card_id = :card_id AND date_in IS NULL
+  ) < {MAX_ACTIVE_LOANS}
+  AND NOT EXISTS (
+      SELECT 1 FROM BOOK_LOANS WHERE isbn = :isbn AND date_in IS NULL
+  )
+"""
+
 
 def has_unpaid_fines(cursor, card_id):
     """Check if borrower has any unpaid fines."""
@@ -28,15 +65,221 @@ def get_active_loan_count(cursor, card_id):
     return result["count"] if result else 0
 
 
-def is_book_checked_out(cursor, isbn):
-    """Check if a book is currently checked out."""
-    cursor.execute("""
-        SELECT COUNT(*) as count
-        FROM BOOK_LOANS
-        WHERE isbn = ? AND date_in IS NULL
-    """, (isbn,))
-    result = cursor.fetchone()
-    return result["count"] > 0 if result else False
+def missing_refusal(cursor, isbn, card_id):
+    """(payload, status) if the book (unless isbn is None) or borrower does not exist, else None."""
+    # Verify book exists
+    if isbn is not None:
+        cursor.execute("SELECT isbn_primary FROM BOOK WHERE isbn_primary = ?", (isbn,))
+        if not cursor.fetchone():
+            return {"error": "Book not found"}, 404
+    
+    # Verify borrower exists
+    cursor.execute("SELECT card_id FROM BORROWER WHERE card_id = ?", (card_id,))
+    if not cursor.fetchone():
+        return {"error": "Borrower not found"}, 404
+    
+    return None
+
+
+def checkout_refusal(cursor, isbn, card_id):
+    """Explain why CHECKOUT_SQL inserted nothing, as (payload, status)."""
+    missing = missing_refusal(cursor, isbn, card_id)
+    if missing is not None:
+        return missing
+    
+    if has_unpaid_fines(cursor, card_id):
+        return {"error": "Borrower has unpaid fines and cannot checkout books"}, 400
+    
+    if get_active_loan_count(cursor, card_id) >= MAX_ACTIVE_LOANS:
+        return {"error": f"Borrower has reached maximum of {MAX_ACTIVE_LOANS} active loans"}, 400
+    
+    return {"error": "Book is already checked out"}, 400
+
+
+def get_book_availability(cursor, isbns):
+    """Map each existing ISBN in isbns to whether it is currently checked out.
+
+    ISBNs that are not in BOOK are absent from the result.
+    """
+    availability = {}
+    unique = list(dict.fromkeys(isbns))
+    # Stay well under SQLite's host parameter limit
+    for start in range(0, len(unique), 500):
+        chunk = unique[start:start + 500]
+        placeholders = ",".join(["?"] * len(chunk))
+        cursor.execute(f"""
+            SELECT
+                b.isbn_primary AS isbn,
+                EXISTS (
+                    SELECT 1 FROM BOOK_LOANS bl
+                    WHERE bl.isbn = b.isbn_primary AND bl.date_in IS NULL
+                ) AS checked_out
+            FROM BOOK b
+            WHERE b.isbn_primary IN ({placeholders})
+        """, chunk)
+        for row in cursor.fetchall():
+            availability[row["isbn"]] = bool(row["checked_out"])
+    return availability
+
+
+# Open loans for scanned ISBNs in any stored spelling: ISBN_LOOKUP's primary
+# key, then idx_book_loans_one_active
+OPEN_LOANS_BY_ISBN_SQL = """
+SELECT l.isbn AS scanned, bl.loan_id, bl.isbn, bl.card_id
+FROM ISBN_LOOKUP l
+JOIN BOOK_LOANS bl ON bl.isbn = l.isbn_primary AND bl.date_in IS NULL
+WHERE l.isbn IN ({placeholders})
+"""
+
+
+def get_loans(cursor, loan_ids):
+    """Map each existing loan_id in loan_ids to its BOOK_LOANS row."""
+    loans = {}
+    unique = list(dict.fromkeys(loan_ids))
+    for start in range(0, len(unique), 500):
+        chunk = unique[start:start + 500]
+        placeholders = ",".join(["?"] * len(chunk))
+        cursor.execute(f"""
+            SELECT loan_id, isbn, card_id, date_in
+            FROM BOOK_LOANS
+            WHERE loan_id IN ({placeholders})
+        """, chunk)
+        for row in cursor.fetchall():
+            loans[row["loan_id"]] = row
+    return loans
+
+
+def get_open_loans_by_isbn(cursor, forms):
+    """Map each ISBN spelling in forms to the open loan on that book."""
+    loans = {}
+    unique = list(dict.fromkeys(forms))
+    for start in range(0, len(unique), 500):
+        chunk = unique[start:start + 500]
+        cursor.execute(OPEN_LOANS_BY_ISBN_SQL.format(placeholders=",".join(["?"] * len(chunk))), chunk)
+        for row in cursor.fetchall():
+            loans[row["scanned"]] = row
+    return loans
+
+
+def prefix_bounds(prefix):
+    """(lo, hi) such that lo <= value < hi holds exactly for values starting with prefix."""
+    return prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def indexed_conditions(isbn, card_no, borrower_name):
+    """WHERE conditions on BOOK_LOANS bl that can all use an index.
+
+    Returns (conditions, params), or (None, None) if an input can't match.
+    """
+    conditions, params = [], []
+    if isbn:
+        forms = isbn_forms(isbn)
+        cleaned = clean_isbn(isbn)
+        if forms:
+            # A whole ISBN, in any stored spelling
+            conditions.append(f"""bl.isbn IN (
+                SELECT isbn_primary FROM ISBN_LOOKUP
+                WHERE isbn IN ({",".join(["?"] * len(forms))}))""")
+            params.extend(forms)
+        elif cleaned:
+            conditions.append("bl.isbn >= ? AND bl.isbn < ?")
+            params.extend(prefix_bounds(cleaned))
+        else:
+            return None, None
+    if card_no:
+        card = card_no.upper()
+        # isdigit() alone accepts Unicode digits such as "²" that int() rejects
+        if card.isascii() and card.isdigit():
+            # Just the number, as printed on the card
+            conditions.append("bl.card_id = ?")
+            params.append(f"ID{int(card):06d}")
+        else:
+            conditions.append("bl.card_id >= ? AND bl.card_id < ?")
+            params.extend(prefix_bounds(card))
+    if borrower_name:
+        terms = fts_prefix_terms(borrower_name)
+        if not terms:
+            return None, None
+        conditions.append("""bl.card_id IN (
+            SELECT card_id FROM BORROWER_NAME_SEARCH
+            WHERE BORROWER_NAME_SEARCH MATCH ?)""")
+        params.append(f"bname : ({terms})")
+    return conditions, params
+
+
+def substring_conditions(isbn, card_no, borrower_name):
+    """The original substring conditions; these scan every open loan."""
+    conditions, params = [], []
+    if isbn:
+        conditions.append("bl.isbn LIKE ?")
+        params.append(f"%{isbn}%")
+    if card_no:
+        conditions.append("bl.card_id LIKE ?")
+        params.append(f"%{card_no}%")
+    if borrower_name:
+        conditions.append("LOWER(b.bname) LIKE LOWER(?)")
+        params.append(f"%{borrower_name}%")
+    return conditions, params
+
+
+def confirm_refusal(refusal, isbn, card_id):
+    """Return refusal unless the book or borrower is missing.
+
+    Keeps checkout_refusal's order, so a refusal known from memory never
+    hides "Book not found" or "Borrower not found". Two primary key reads
+    on a pooled connection; nothing is queued on the writer.
+    """
+    conn = get_db()
+    try:
+        return missing_refusal(conn.cursor(), isbn, card_id) or refusal
+    finally:
+        conn.close()
+
+
+def known_refusal(isbn, card_id):
+    """Refuse a checkout from circulation state, as (payload, status).
+
+    Returns None when the state allows it (CHECKOUT_SQL still decides) or
+    holds nothing for card_id, so unknown card numbers get the database's
+    answer. State from other processes can be up to a second old.
+    """
+    state = circulation.card_state(card_id)
+    if state is None:
+        return None
+    loans, fined = state
+    if fined:
+        refusal = {"error": "Borrower has unpaid fines and cannot checkout books"}, 400
+    elif loans >= MAX_ACTIVE_LOANS:
+        refusal = {"error": f"Borrower has reached maximum of {MAX_ACTIVE_LOANS} active loans"}, 400
+    elif circulation.holder(isbn) is not None:
+        refusal = {"error": "Book is already checked out"}, 400
+    else:
+        return None
+    return confirm_refusal(refusal, isbn, card_id)
+
+
+def after_checkouts(card_id):
+    """after_commit callback recording a committed checkout or batch in circulation."""
+    def record(result):
+        payload, status = result
+        if status == 201:
+            circulation.mark_checked_out(payload["isbn"], card_id, payload["loan_id"])
+        elif status == 200:
+            for item in payload:
+                if item["status"] == "ok":
+                    circulation.mark_checked_out(item["isbn"], card_id, item["loan_id"])
+    return record
+
+
+def submit_write(apply, after_commit=None):
+    """Run apply(cursor) -> (payload, status) on the writer thread and respond."""
+    try:
+        payload, status = write_queue.submit(apply, after_commit)
+    except write_queue.WriteTimeout as e:
+        return jsonify({"error": "Service unavailable", "details": str(e)}), 503
+    except Exception as e:
+        return jsonify({"error": "Database error", "details": str(e)}), 500
+    return jsonify(payload), status
 
 
 @bp.post("/checkout")
@@ -49,63 +292,48 @@ def checkout():
     if not isbn or not borrower_card_no:
         return jsonify({"error": "ISBN and borrower_card_no are required"}), 400
     
-    conn = get_db()
     try:
-        cursor = conn.cursor()
-        
-        # Verify book exists
-        cursor.execute("SELECT isbn_primary FROM BOOK WHERE isbn_primary = ?", (isbn,))
-        if not cursor.fetchone():
-            return jsonify({"error": "Book not found"}), 404
-        
-        # Verify borrower exists
-        cursor.execute("SELECT card_id FROM BORROWER WHERE card_id = ?", (borrower_card_no,))
-        if not cursor.fetchone():
-            return jsonify({"error": "Borrower not found"}), 404
-        
-        # Check if borrower has unpaid fines
-        if has_unpaid_fines(cursor, borrower_card_no):
-            return jsonify({"error": "Borrower has unpaid fines and cannot checkout books"}), 400
-        
-        # Check active loan count (max 3)
-        active_count = get_active_loan_count(cursor, borrower_card_no)
-        if active_count >= 3:
-            return jsonify({"error": "Borrower has reached maximum of 3 active loans"}), 400
-        
-        # Check if book is already checked out
-        if is_book_checked_out(cursor, isbn):
-            return jsonify({"error": "Book is already checked out"}), 400
-        
-        # Create loan
+        refusal = known_refusal(isbn, borrower_card_no)
+    except Exception as e:
+        return jsonify({"error": "Database error", "details": str(e)}), 500
+    if refusal is not None:
+        payload, status = refusal
+        return jsonify(payload), status
+    
+    def apply(cursor):
         today = date.today().isoformat()
         due_date = (date.today() + timedelta(days=14)).isoformat()
         
-        cursor.execute("""
-            INSERT INTO BOOK_LOANS (isbn, card_id, date_out, due_date, date_in)
-            VALUES (?, ?, ?, ?, NULL)
-        """, (isbn, borrower_card_no, today, due_date))
-        
-        loan_id = cursor.lastrowid
-        conn.commit()
+        try:
+            cursor.execute(CHECKOUT_SQL, {
+                "isbn": isbn,
+                "card_id": borrower_card_no,
+                "date_out": today,
+                "due_date": due_date,
+            })
+        except sqlite3.IntegrityError:
+            return {"error": "Book is already checked out"}, 400
+        if cursor.rowcount == 0:
+            return checkout_refusal(cursor, isbn, borrower_card_no)
         
-        return jsonify({
-            "loan_id": loan_id,
+        return {
+            "loan_id": cursor.lastrowid,
             "isbn": isbn,
             "card_no": borrower_card_no,
             "date_out": today,
             "due_date": due_date
-        }), 201
-        
-    except Exception as e:
-        conn.rollback()
-        return jsonify({"error": "Database error", "details": str(e)}), 500
-    finally:
-        conn.close()
+        }, 201
+    
+    return submit_write(apply, after_checkouts(borrower_card_no))
 
 
 @bp.post("/checkout/batch")
 def checkout_batch():
-    """Checkout multiple books."""
+    """Checkout multiple books in one transaction.
+
+    Every ISBN is validated with a single query, the borrower's remaining
+    capacity is computed once, and all accepted loans are inserted together.
+    """
     data = request.get_json(silent=True) or {}
     isbns = data.get("isbns", [])
     borrower_card_no = (data.get("borrower_card_no") or data.get("card_id") or "").strip()
@@ -116,74 +344,77 @@ def checkout_batch():
     if not isbns or not isinstance(isbns, list):
         return jsonify({"error": "isbns must be a non-empty array"}), 400
     
-    results = []
-    conn = get_db()
+    isbns = [str(isbn).strip() for isbn in isbns]
+    
+    # Unpaid fines refuse the whole batch; answer from memory when known
     try:
-        cursor = conn.cursor()
-        
+        state = circulation.card_state(borrower_card_no)
+        refusal = None
+        if state is not None and state[1]:
+            refusal = confirm_refusal(
+                ({"error": "Borrower has unpaid fines and cannot checkout books"}, 400),
+                None, borrower_card_no,
+            )
+    except Exception as e:
+        return jsonify({"error": "Database error", "details": str(e)}), 500
+    if refusal is not None:
+        payload, status = refusal
+        return jsonify(payload), status
+    
+    def apply(cursor):
         # Verify borrower exists
         cursor.execute("SELECT card_id FROM BORROWER WHERE card_id = ?", (borrower_card_no,))
         if not cursor.fetchone():
-            return jsonify({"error": "Borrower not found"}), 404
+            return {"error": "Borrower not found"}, 404
         
         # Check if borrower has unpaid fines (once for the batch)
         if has_unpaid_fines(cursor, borrower_card_no):
-            return jsonify({"error": "Borrower has unpaid fines and cannot checkout books"}), 400
+            return {"error": "Borrower has unpaid fines and cannot checkout books"}, 400
+        
+        active_count = get_active_loan_count(cursor, borrower_card_no)
+        availability = get_book_availability(cursor, [isbn for isbn in isbns if isbn])
         
-        # Process each ISBN
+        # Decide each ISBN in request order, as if they were checked out one by one
+        results = []
+        accepted = []
         for isbn in isbns:
-            isbn = str(isbn).strip()
             if not isbn:
                 results.append({"isbn": isbn, "status": "error", "error": "Empty ISBN"})
-                continue
-            
-            try:
-                # Verify book exists
-                cursor.execute("SELECT isbn_primary FROM BOOK WHERE isbn_primary = ?", (isbn,))
-                if not cursor.fetchone():
-                    results.append({"isbn": isbn, "status": "error", "error": "Book not found"})
-                    continue
-                
-                # Check active loan count
-                active_count = get_active_loan_count(cursor, borrower_card_no)
-                if active_count >= 3:
-                    results.append({"isbn": isbn, "status": "error", "error": "Maximum active loans reached"})
-                    continue
-                
-                # Check if book is already checked out
-                if is_book_checked_out(cursor, isbn):
-                    results.append({"isbn": isbn, "status": "error", "error": "Book already checked out"})
-                    continue
-                
-                # Create loan
-                today = date.today().isoformat()
-                due_date = (date.today() + timedelta(days=14)).isoformat()
-                
-                cursor.execute("""
-                    INSERT INTO BOOK_LOANS (isbn, card_id, date_out, due_date, date_in)
-                    VALUES (?, ?, ?, ?, NULL)
-                """, (isbn, borrower_card_no, today, due_date))
-                
-                loan_id = cursor.lastrowid
-                conn.commit()
-                
-                results.append({
-                    "isbn": isbn,
-                    "status": "ok",
-                    "loan_id": loan_id
-                })
-                
-            except Exception as e:
-                conn.rollback()
-                results.append({"isbn": isbn, "status": "error", "error": str(e)})
+            elif isbn not in availability:
+                results.append({"isbn": isbn, "status": "error", "error": "Book not found"})
+            elif active_count >= MAX_ACTIVE_LOANS:
+                results.append({"isbn": isbn, "status": "error", "error": "Maximum active loans reached"})
+            elif availability[isbn]:
+                results.append({"isbn": isbn, "status": "error", "error": "Book already checked out"})
+            else:
+                availability[isbn] = True
+                active_count += 1
+                accepted.append(isbn)
+                results.append({"isbn": isbn, "status": "ok"})
         
-        return jsonify(results), 200
+        if accepted:
+            today = date.today().isoformat()
+            due_date = (date.today() + timedelta(days=14)).isoformat()
+            cursor.executemany("""
+                INSERT INTO BOOK_LOANS (isbn, card_id, date_out, due_date, date_in)
+                VALUES (?, ?, ?, ?, NULL)
+            """, [(isbn, borrower_card_no, today, due_date) for isbn in accepted])
+            
+            # Each accepted ISBN now has exactly one open loan: the one just made
+            placeholders = ",".join(["?"] * len(accepted))
+            cursor.execute(f"""
+                SELECT isbn, loan_id
+                FROM BOOK_LOANS
+                WHERE isbn IN ({placeholders}) AND date_in IS NULL
+            """, accepted)
+            loan_ids = {row["isbn"]: row["loan_id"] for row in cursor.fetchall()}
+            for result in results:
+                if result["status"] == "ok":
+                    result["loan_id"] = loan_ids[result["isbn"]]
         
-    except Exception as e:
-        conn.rollback()
-        return jsonify({"error": "Database error", "details": str(e)}), 500
-    finally:
-        conn.close()
+        return results, 200
+    
+    return submit_write(apply, after_checkouts(borrower_card_no))
 
 
 @bp.post("/checkin")
@@ -200,69 +431,171 @@ def checkin():
     except (ValueError, TypeError):
         return jsonify({"error": "loan_id must be a number"}), 400
     
-    conn = get_db()
-    try:
-        cursor = conn.cursor()
-        
+    returned = {}
+    
+    def apply(cursor):
         # Verify loan exists and is not already checked in
         cursor.execute("""
-            SELECT loan_id, date_in FROM BOOK_LOANS WHERE loan_id = ?
+            SELECT loan_id, isbn, date_in FROM BOOK_LOANS WHERE loan_id = ?
         """, (loan_id,))
         loan = cursor.fetchone()
         
         if not loan:
-            return jsonify({"error": "Loan not found"}), 404
+            return {"error": "Loan not found"}, 404
         
         if loan["date_in"] is not None:
-            return jsonify({"error": "Book is already checked in"}), 400
+            return {"error": "Book is already checked in"}, 400
         
         # Update loan with checkin date
         today = date.today().isoformat()
         cursor.execute("""
             UPDATE BOOK_LOANS SET date_in = ? WHERE loan_id = ?
         """, (today, loan_id))
+        returned["isbn"] = loan["isbn"]
         
-        conn.commit()
-        
-        return jsonify({
+        return {
             "loan_id": loan_id,
             "date_in": today
-        }), 200
+        }, 200
+    
+    def after_commit(result):
+        if "isbn" in returned:
+            circulation.mark_checked_in(returned["isbn"])
+    
+    return submit_write(apply, after_commit)
+
+
+@bp.post("/checkin/batch")
+def checkin_batch():
+    """Check in many books in one transaction, by loan_id and/or scanned ISBN.
+
+    Scanned ISBNs (either length, hyphens allowed) are resolved to open
+    loans with one indexed query. With compute_fines, fines for the late
+    returns are created in the same transaction.
+    """
+    data = request.get_json(silent=True) or {}
+    loan_ids = data.get("loan_ids") or []
+    isbns = data.get("isbns") or []
+    compute_fines = data.get("compute_fines") is True
+    
+    if not isinstance(loan_ids, list) or not isinstance(isbns, list):
+        return jsonify({"error": "loan_ids and isbns must be arrays"}), 400
+    
+    if not loan_ids and not isbns:
+        return jsonify({"error": "loan_ids or isbns is required"}), 400
+    
+    if len(loan_ids) + len(isbns) > MAX_CHECKIN_BATCH:
+        return jsonify({"error": f"At most {MAX_CHECKIN_BATCH} items per batch"}), 400
+    
+    # (result, ISBN spellings) per requested item, in request order: loan
+    # IDs, then ISBNs; results that already carry a status are final
+    items = []
+    for raw in loan_ids:
+        try:
+            items.append(({"loan_id": int(raw)}, None))
+        except (ValueError, TypeError):
+            items.append(({"loan_id": raw, "status": "error", "error": "loan_id must be a number"}, None))
+    for raw in isbns:
+        scanned = str(raw).strip()
+        if not scanned:
+            items.append(({"isbn": scanned, "status": "error", "error": "Empty ISBN"}, None))
+        else:
+            items.append(({"isbn": scanned}, isbn_forms(scanned) or [scanned.upper()]))
+    
+    returned = []
+    
+    def apply(cursor):
+        today = date.today().isoformat()
+        by_id = get_loans(cursor, [item["loan_id"] for item, forms in items
+                                   if forms is None and "status" not in item])
+        by_isbn = get_open_loans_by_isbn(cursor, [form for _, forms in items for form in forms or ()])
         
-    except Exception as e:
-        conn.rollback()
-        return jsonify({"error": "Database error", "details": str(e)}), 500
-    finally:
-        conn.close()
+        results = []
+        checked_in = {}  # loan_id -> BOOK_LOANS row
+        for item, forms in items:
+            if "status" in item:
+                results.append(item)
+                continue
+            if forms is not None:
+                loan = next((by_isbn[form] for form in forms if form in by_isbn), None)
+                if loan is None:
+                    results.append(dict(item, status="error", error="No open loan for this ISBN"))
+                    continue
+            else:
+                loan = by_id.get(item["loan_id"])
+                if loan is None:
+                    results.append(dict(item, status="error", error="Loan not found"))
+                    continue
+                if loan["date_in"] is not None:
+                    results.append(dict(item, status="error", error="Book is already checked in"))
+                    continue
+            if loan["loan_id"] in checked_in:
+                # Scanned twice, or listed by both loan_id and ISBN
+                results.append(dict(item, status="error", error="Book is already checked in"))
+                continue
+            checked_in[loan["loan_id"]] = loan
+            results.append(dict(item, loan_id=loan["loan_id"], isbn=loan["isbn"],
+                                card_id=loan["card_id"], status="ok", date_in=today))
+        
+        if checked_in:
+            cursor.executemany("""
+                UPDATE BOOK_LOANS SET date_in = ? WHERE loan_id = ?
+            """, [(today, loan_id) for loan_id in checked_in])
+            fines = refresh_loan_fines(cursor, today, list(checked_in)) if compute_fines else {}
+            if compute_fines:
+                for result in results:
+                    if result["status"] == "ok":
+                        result["fine_amt"] = round(fines.get(result["loan_id"], (0, 0))[0], 2)
+            returned[:] = [
+                (loan["isbn"], loan["card_id"], loan_id in fines and not fines[loan_id][1])
+                for loan_id, loan in checked_in.items()
+            ]
+        
+        return results, 200
+    
+    def after_commit(result):
+        for isbn, card_id, fined in returned:
+            circulation.mark_checked_in(isbn)
+            if fined:
+                circulation.mark_fined(card_id)
+    
+    return submit_write(apply, after_commit)
 
 
 @bp.get("/checkin/search")
 def checkin_search():
-    """Search for loans to check in by ISBN, card_no, or borrower name."""
+    """Search open loans to check in by ISBN, card_no, and/or borrower name.
+
+    ISBNs and card numbers match exactly or by prefix, names by word
+    prefix, all through indexes; ?match=substring restores the old
+    (table-scanning) substring match. At most ?limit= loans are returned.
+    """
     isbn = request.args.get("isbn", "").strip()
     card_no = request.args.get("card_no", "").strip()
     borrower_name = request.args.get("borrower_name", "").strip()
+    substring = request.args.get("match") == "substring"
+    
+    try:
+        limit = int(request.args.get("limit", DEFAULT_CHECKIN_RESULTS))
+    except ValueError:
+        return jsonify({"error": "limit must be a number"}), 400
+    if not 1 <= limit <= MAX_CHECKIN_RESULTS:
+        return jsonify({"error": f"limit must be between 1 and {MAX_CHECKIN_RESULTS}"}), 400
+    
+    if substring:
+        conditions, params = substring_conditions(isbn, card_no, borrower_name)
+    else:
+        conditions, params = indexed_conditions(isbn, card_no, borrower_name)
+        if conditions is None:
+            return jsonify([]), 200
     
     conn = get_db()
     try:
         cursor = conn.cursor()
         
-        # Build dynamic query
-        conditions = ["bl.date_in IS NULL"]  # Only show active loans
-        params = []
-        
-        if isbn:
-            conditions.append("bl.isbn LIKE ?")
-            params.append(f"%{isbn}%")
-        
-        if card_no:
-            conditions.append("bl.card_id LIKE ?")
-            params.append(f"%{card_no}%")
-        
-        if borrower_name:
-            conditions.append("LOWER(b.bname) LIKE LOWER(?)")
-            params.append(f"%{borrower_name}%")
-        
+        # Cap the matches before joining, keeping the loans due soonest.
+        # Unfiltered, they come straight from idx_book_loans_active_due.
+        where = " AND ".join(["bl.date_in IS NULL"] + conditions)
         sql = f"""
             SELECT 
                 bl.loan_id,
@@ -272,18 +605,24 @@ def checkin_search():
                 bl.due_date,
                 b.bname as borrower_name,
                 book.title
-            FROM BOOK_LOANS bl
+            FROM (
+                SELECT bl.loan_id, bl.isbn, bl.card_id, bl.date_out, bl.due_date
+                FROM BOOK_LOANS bl
+                {"JOIN BORROWER b ON bl.card_id = b.card_id" if substring else ""}
+                WHERE {where}
+                ORDER BY bl.due_date, bl.loan_id
+                LIMIT ?
+            ) bl
             JOIN BORROWER b ON bl.card_id = b.card_id
             JOIN BOOK book ON bl.isbn = book.isbn_primary
-            WHERE {' AND '.join(conditions)}
-            ORDER BY bl.due_date
+            ORDER BY bl.due_date, bl.loan_id
         """
         
-        cursor.execute(sql, params)
+        cursor.execute(sql, params + [limit + 1])
         rows = cursor.fetchall()
         
         results = []
-        for row in rows:
+        for row in rows[:limit]:
             results.append({
                 "loan_id": row["loan_id"],
                 "isbn": row["isbn"],
@@ -294,7 +633,10 @@ def checkin_search():
                 "due_date": row["due_date"]
             })
         
-        return jsonify(results), 200
+        response = jsonify(results)
+        if len(rows) > limit:
+            response.headers["X-Truncated"] = "true"
+        return response, 200
         
     except Exception as e:
         return jsonify({"error": "Database error", "details": str(e)}), 500
@@ -1,80 +1,232 @@
 from flask import Blueprint, jsonify, request
-from db import get_db
+from db import get_read_db
+from isbn import isbn_forms
+from search_index import MIN_FTS_QUERY_LENGTH, fts_phrase
+import circulation
+import search_cache
+import suggest_index
 
 bp = Blueprint("search", __name__, url_prefix="/api")
 
+# Upper bound for ?limit=N
+MAX_PAGE_SIZE = 1000
+# Totals above this are reported as a lower bound (X-Total-Count-Estimated)
+COUNT_CAP = 10000
+
+# Relevance tiers: exact ISBN match, then title prefix, then any other match
+RELEVANCE_TIER = """
+    CASE
+        WHEN LOWER(:q) IN (LOWER(b.isbn_primary), LOWER(b.isbn10), LOWER(b.isbn13)) THEN 0
+        WHEN SUBSTR(LOWER(b.title), 1, LENGTH(:q)) = LOWER(:q) THEN 1
+        ELSE 2
+    END
+"""
+
+# Full-text match against BOOK_SEARCH. Availability is not selected here:
+# it is overlaid from circulation after the (cached) lookup.
+FTS_MATCH = """
+FROM BOOK_SEARCH s
+JOIN BOOK b ON b.isbn_primary = s.isbn_primary
+WHERE BOOK_SEARCH MATCH :match
+"""
+
+# Substring scan used for queries too short for the trigram index. Author
+# names come from the pre-aggregated BOOK_AUTHOR_NAMES, one row per book.
+LIKE_MATCH = """
+FROM BOOK b
+LEFT JOIN BOOK_AUTHOR_NAMES n ON n.isbn_primary = b.isbn_primary
+WHERE
+    LOWER(b.isbn_primary) LIKE LOWER(:like) OR
+    LOWER(b.isbn10) LIKE LOWER(:like) OR
+    LOWER(b.isbn13) LIKE LOWER(:like) OR
+    LOWER(b.title) LIKE LOWER(:like) OR
+    LOWER(n.authors) LIKE LOWER(:like)
+"""
+
+# Within a tier, full-text matches keep bm25 order; both fall back to title
+FTS_SEARCH_SQL = f"""
+SELECT b.isbn_primary AS isbn, b.title AS title, s.authors AS authors, {RELEVANCE_TIER} AS tier
+{FTS_MATCH}
+ORDER BY tier, s.rank, b.title
+"""
+
+LIKE_SEARCH_SQL = f"""
+SELECT b.isbn_primary AS isbn, b.title AS title, n.authors AS authors, {RELEVANCE_TIER} AS tier
+{LIKE_MATCH}
+ORDER BY tier, b.title
+"""
+
+# Exact ISBN lookup: one primary-key probe per spelling of the scanned ISBN
+ISBN_LOOKUP_SQL = """
+SELECT DISTINCT b.isbn_primary AS isbn, b.title AS title, n.authors AS authors
+FROM ISBN_LOOKUP l
+JOIN BOOK b ON b.isbn_primary = l.isbn_primary
+LEFT JOIN BOOK_AUTHOR_NAMES n ON n.isbn_primary = b.isbn_primary
+WHERE l.isbn IN ({placeholders})
+ORDER BY b.isbn_primary
+"""
+
+FTS_COUNT_SQL = f"SELECT COUNT(*) AS total FROM (SELECT 1 {FTS_MATCH} LIMIT :cap)"
+LIKE_COUNT_SQL = f"SELECT COUNT(*) AS total FROM (SELECT 1 {LIKE_MATCH} LIMIT :cap)"
+
+
+def parse_search_page_args():
+    """Read ?limit=N&cursor=<offset>; returns (limit or None, offset)."""
+    raw_limit = request.args.get("limit", "").strip()
+    limit = None
+    if raw_limit:
+        if not raw_limit.isdigit() or int(raw_limit) < 1:
+            raise ValueError("limit must be a positive integer")
+        limit = min(int(raw_limit), MAX_PAGE_SIZE)
+
+    raw_cursor = request.args.get("cursor", "").strip()
+    if raw_cursor and not raw_cursor.isdigit():
+        raise ValueError("cursor is not a valid search cursor")
+    return limit, int(raw_cursor or 0)
+
+
+def fetch_catalog_page(q, limit, offset, consistent=False):
+    """Run the search SQL for one page.
+
+    Returns (catalog, total, estimated, more): catalog rows are (isbn, title,
+    authors) tuples; total is exact unless estimated is True, in which case
+    it is a lower bound; more is True if another page follows. ORDER BY ...
+    LIMIT lets SQLite keep only the top offset + limit rows while sorting
+    instead of the whole result set.
+    """
+    if len(q) >= MIN_FTS_QUERY_LENGTH:
+        sql, count_sql = FTS_SEARCH_SQL, FTS_COUNT_SQL
+    else:
+        sql, count_sql = LIKE_SEARCH_SQL, LIKE_COUNT_SQL
+    params = {"q": q, "match": fts_phrase(q), "like": f"%{q}%"}
+
+    conn = get_read_db(consistent)
+    try:
+        cursor = conn.cursor()
+        if limit is None:
+            cursor.execute(sql, params)
+        else:
+            # One extra row tells us whether another page follows
+            cursor.execute(sql + "\nLIMIT :limit OFFSET :offset",
+                           dict(params, limit=limit + 1, offset=offset))
+        rows = cursor.fetchall()
+
+        more = limit is not None and len(rows) > limit
+        rows = rows[:limit] if more else rows
+        if not more:
+            total, estimated = offset + len(rows), False
+        else:
+            cursor.execute(count_sql, dict(params, cap=COUNT_CAP + 1))
+            total = cursor.fetchone()["total"]
+            estimated = total > COUNT_CAP
+            if estimated:
+                total = max(COUNT_CAP, offset + len(rows) + 1)
+    finally:
+        conn.close()
+
+    return to_catalog(rows), total, estimated, more
+
+
+def to_catalog(rows):
+    return [
+        (row["isbn"], row["title"], tuple(row["authors"].split(", ")) if row["authors"] else ())
+        for row in rows
+    ]
+
+
+def fetch_isbn_page(forms, limit, offset, consistent=False):
+    """Exact-match lookup through ISBN_LOOKUP; None if no book has that ISBN."""
+    conn = get_read_db(consistent)
+    try:
+        sql = ISBN_LOOKUP_SQL.format(placeholders=", ".join("?" * len(forms)))
+        rows = conn.execute(sql, forms).fetchall()
+    finally:
+        conn.close()
+    if not rows:
+        return None
+    end = len(rows) if limit is None else offset + limit
+    return to_catalog(rows[offset:end]), len(rows), False, end < len(rows)
+
 
 @bp.get("/search")
 def search():
+    """Search books; ?limit=N&cursor=C pages through relevance-ordered results.
+
+    Paged responses carry X-Total-Count (a lower bound when
+    X-Total-Count-Estimated is true) and, if more results follow,
+    X-Next-Cursor.
+    """
     # Get query parameter
     q = request.args.get("q", "").strip()
     
     if not q:
         return jsonify({"error": "No search query provided"}), 400
 
-    conn = get_db()
     try:
-        cursor = conn.cursor()
+        limit, offset = parse_search_page_args()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    # ?consistent=1 skips the read snapshot and the cache
+    consistent = request.args.get("consistent") == "1"
 
-        # SQLite query
-        sql = """
-        SELECT
-            b.isbn_primary AS isbn,
-            b.title AS title,
-            (
-                SELECT GROUP_CONCAT(a.name, ', ')
-                FROM AUTHORS a
-                JOIN BOOK_AUTHORS ba ON ba.author_id = a.author_id
-                WHERE ba.isbn_primary = b.isbn_primary
-            ) AS authors,
-            CASE
-                WHEN EXISTS (
-                    SELECT 1 FROM BOOK_LOANS bl
-                    WHERE bl.isbn = b.isbn_primary AND bl.date_in IS NULL
-                )
-                THEN 1
-                ELSE 0
-            END AS checked_out,
-            (
-                SELECT bl.card_id
-                FROM BOOK_LOANS bl
-                WHERE bl.isbn = b.isbn_primary AND bl.date_in IS NULL
-                LIMIT 1
-            ) AS borrower_id
-        FROM BOOK b
-        WHERE
-            LOWER(b.isbn_primary) LIKE LOWER(?) OR
-            LOWER(b.isbn10) LIKE LOWER(?) OR
-            LOWER(b.isbn13) LIKE LOWER(?) OR
-            LOWER(b.title) LIKE LOWER(?) OR
-            EXISTS (
-                SELECT 1
-                FROM AUTHORS a
-                JOIN BOOK_AUTHORS ba ON ba.author_id = a.author_id
-                WHERE ba.isbn_primary = b.isbn_primary AND LOWER(a.name) LIKE LOWER(?)
-            )
-        ORDER BY b.title
-        """
-
-        # Prepare search term
-        like_q = f"%{q}%"
-        cursor.execute(sql, (like_q, like_q, like_q, like_q, like_q))
-        rows = cursor.fetchall()
+    # Scanner input: answer exact ISBNs (either length) from the lookup
+    # table, uncached so one-off barcode lookups don't churn the LRU
+    page = None
+    forms = isbn_forms(q)
+    if forms:
+        try:
+            page = fetch_isbn_page(forms, limit, offset, consistent)
+        except Exception as e:
+            return jsonify({"error": "Database error", "details": str(e)}), 500
 
-        # Convert authors string to array
-        results = []
-        for row in rows:
-            authors_list = row["authors"].split(", ") if row["authors"] else []
-            results.append({
-                "isbn": row["isbn"],
-                "title": row["title"],
-                "authors": authors_list,
-                "checked_out": bool(row["checked_out"]),
-                "borrower_id": row["borrower_id"]
-            })
-
-        return jsonify(results)
+    if page is None and not consistent:
+        page = search_cache.get(q, offset, limit)
+    if page is None:
+        try:
+            page = fetch_catalog_page(q, limit, offset, consistent)
+        except Exception as e:
+            return jsonify({"error": "Database error", "details": str(e)}), 500
+        # Cache only the catalog part; availability changes with every loan
+        search_cache.put(q, offset, limit, page)
+    catalog, total, estimated, more = page
+
+    try:
+        borrowers = circulation.borrowers_for(isbn for isbn, _, _ in catalog)
+    except Exception as e:
+        return jsonify({"error": "Database error", "details": str(e)}), 500
+
+    results = []
+    for isbn, title, authors in catalog:
+        borrower_id = borrowers[isbn]
+        results.append({
+            "isbn": isbn,
+            "title": title,
+            "authors": list(authors),
+            "checked_out": borrower_id is not None,
+            "borrower_id": borrower_id
+        })
+
+    response = jsonify(results)
+    if limit is not None:
+        response.headers["X-Total-Count"] = str(total)
+        if estimated:
+            response.headers["X-Total-Count-Estimated"] = "true"
+        if more:
+            response.headers["X-Next-Cursor"] = str(offset + len(catalog))
+    return response
+
+
+@bp.get("/search/suggest")
+def search_suggest():
+    """Typeahead completions for titles and authors, served from memory."""
+    prefix = request.args.get("prefix", "")
+    try:
+        limit = int(request.args.get("limit", "10"))
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+    limit = max(1, min(limit, suggest_index.MAX_SUGGESTIONS))
+
+    try:
+        return jsonify(suggest_index.suggest(prefix, limit))
     except Exception as e:
         return jsonify({"error": "Database error", "details": str(e)}), 500
-    finally:
-        conn.close()
\ No newline at end of file
@@ -50,3 +50,15 @@ CREATE TABLE IF NOT EXISTS FINES (
     PRIMARY KEY (loan_id),
     FOREIGN KEY (loan_id) REFERENCES BOOK_LOANS(loan_id)
 );
+
+-- Full-text index backing /api/search. Rebuilt from BOOK/AUTHORS/BOOK_AUTHORS
+-- by search_index.rebuild_search_index() whenever data_import.py runs.
+-- The trigram tokenizer keeps the old case-insensitive substring semantics.
+CREATE VIRTUAL TABLE IF NOT EXISTS BOOK_SEARCH USING fts5(
+    isbn_primary,
+    isbn10,
+    isbn13,
+    title,
+    authors,
+    tokenize = 'trigram'
+);
@@ -0,0 +1,97 @@
+"""Bounded LRU cache for the catalog part of /api/search results.
+
+Entries hold one page of (isbn, title, authors) tuples plus its total
+count, keyed on the lower-cased query and the page; availability is overlaid
+per request from circulation, so checkouts and checkins never invalidate
+the cache. Entries expire after TTL_SECONDS so catalog imports show up.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# Number of distinct queries kept; 0 disables the cache
+CACHE_SIZE = int(os.environ.get("LIBRARY_SEARCH_CACHE_SIZE", "1024"))
+TTL_SECONDS = 300
+# Larger result sets are not cached so one broad query can't pin the catalog
+MAX_CACHED_ROWS = 10000
+
+
+class SearchCache:
+    def __init__(self, size, ttl=TTL_SECONDS):
+        self.size = size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            stored_at, page = entry
+            if time.monotonic() - stored_at >= self.ttl:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return page
+
+    def put(self, key, page):
+        if self.size <= 0 or len(page[0]) > MAX_CACHED_ROWS:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic(), page)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": self.size,
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+_cache = SearchCache(CACHE_SIZE)
+
+
+def cache_key(q, offset, limit):
+    """Search is case-insensitive, so queries differing only in case share an entry."""
+    return (q.lower(), offset, limit)
+
+
+def get(q, offset=0, limit=None):
+    """Return the cached (catalog, total, estimated, more) page, or None."""
+    return _cache.get(cache_key(q, offset, limit))
+
+
+def put(q, offset, limit, page):
+    _cache.put(cache_key(q, offset, limit), page)
+
+
+def clear():
+    _cache.clear()
+
+
+def cache_stats():
+    return _cache.stats()
@@ -0,0 +1,90 @@
+"""Maintain the full-text indexes: BOOK_SEARCH (/api/search) and BORROWER_NAME_SEARCH (/api/checkin/search)."""
+import re
+
+from db import get_db
+
+# FTS5 trigram queries only match terms of at least this many characters
+MIN_FTS_QUERY_LENGTH = 3
+
+
+def rebuild_author_names(conn):
+    """Repopulate BOOK_AUTHOR_NAMES (normally kept current by triggers)."""
+    with conn:
+        conn.execute("DELETE FROM BOOK_AUTHOR_NAMES")
+        conn.execute("""
+            INSERT INTO BOOK_AUTHOR_NAMES (isbn_primary, authors)
+            SELECT ba.isbn_primary, GROUP_CONCAT(a.name, ', ')
+            FROM BOOK_AUTHORS ba
+            JOIN AUTHORS a ON a.author_id = ba.author_id
+            GROUP BY ba.isbn_primary
+        """)
+
+
+def rebuild_isbn_lookup(conn):
+    """Repopulate ISBN_LOOKUP (normally kept current by triggers)."""
+    with conn:
+        conn.execute("DELETE FROM ISBN_LOOKUP")
+        conn.execute("""
+            INSERT OR IGNORE INTO ISBN_LOOKUP (isbn, isbn_primary)
+            SELECT UPPER(isbn_primary), isbn_primary FROM BOOK
+            UNION ALL
+            SELECT UPPER(isbn10), isbn_primary FROM BOOK WHERE isbn10 <> ''
+            UNION ALL
+            SELECT UPPER(isbn13), isbn_primary FROM BOOK WHERE isbn13 <> ''
+        """)
+
+
+def rebuild_borrower_names(conn):
+    """Repopulate BORROWER_NAME_SEARCH (normally kept current by triggers)."""
+    with conn:
+        conn.execute("DELETE FROM BORROWER_NAME_SEARCH")
+        conn.execute("""
+            INSERT INTO BORROWER_NAME_SEARCH (card_id, bname)
+            SELECT card_id, bname FROM BORROWER
+        """)
+        conn.execute("INSERT INTO BORROWER_NAME_SEARCH (BORROWER_NAME_SEARCH) VALUES ('optimize')")
+
+
+def rebuild_search_index(conn):
+    """Repopulate BOOK_SEARCH (plus BOOK_AUTHOR_NAMES, ISBN_LOOKUP and BORROWER_NAME_SEARCH)."""
+    rebuild_author_names(conn)
+    rebuild_isbn_lookup(conn)
+    rebuild_borrower_names(conn)
+    with conn:
+        conn.execute("DELETE FROM BOOK_SEARCH")
+        conn.execute("""
+            INSERT INTO BOOK_SEARCH (isbn_primary, isbn10, isbn13, title, authors)
+            SELECT
+                b.isbn_primary,
+                COALESCE(b.isbn10, ''),
+                COALESCE(b.isbn13, ''),
+                b.title,
+                COALESCE(n.authors, '')
+            FROM BOOK b
+            LEFT JOIN BOOK_AUTHOR_NAMES n ON n.isbn_primary = b.isbn_primary
+        """)
+        conn.execute("INSERT INTO BOOK_SEARCH (BOOK_SEARCH) VALUES ('optimize')")
+    count = conn.execute("SELECT COUNT(*) FROM BOOK_SEARCH").fetchone()[0]
+    print(f"Indexed {count} books into BOOK_SEARCH")
+    return count
+
+
+def fts_phrase(q):
+    """Quote user input as a single FTS5 phrase (substring match under trigram)."""
+    return '"' + q.replace('"', '""') + '"'
+
+
+def fts_prefix_terms(q):
+    """Each word of q as an FTS5 prefix term ("smi"* "jo"*); "" if q has no words."""
+    return " ".join('"' + word + '"*' for word in re.findall(r"\w+", q))
+
+
+if __name__ == "__main__":
+    # Run with: python search_index.py  (rebuilds the index for an existing library.db)
+    from migrations import migrate_database
+    migrate_database()  # Creates the index tables on a database that predates them
+    conn = get_db()
+    try:
+        rebuild_search_index(conn)
+    finally:
+        conn.close()
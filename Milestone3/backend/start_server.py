@@ -1,14 +1,33 @@
 #!/usr/bin/env python3
 """
-Simple script to start the Flask server.
-Kills any existing Python processes on port 5000 first.
+Simple script to start the server.
+On Linux/Mac this runs prefork.py (one worker process per core; extra
+arguments such as --workers N are passed through), after stopping the
+server recorded in server.pid. --asgi runs the single-process ASGI server
+and --dev Flask's development server; on Windows, which has no fork(),
+those are the only modes and existing Python processes are killed first.
 """
+import signal
 import subprocess
 import sys
 import time
 import os
 from pathlib import Path
 
+def stop_previous_server(pid_file):
+    """Gracefully stop the prefork.py master recorded in pid_file, if running."""
+    try:
+        pid = int(pid_file.read_text())
+        os.kill(pid, signal.SIGTERM)
+    except (OSError, ValueError):
+        return
+    print(f"Stopping previous server (pid {pid})...")
+    for _ in range(400):
+        if not pid_file.exists():
+            break
+        time.sleep(0.1)
+    print("✓ Previous server stopped")
+
 def kill_existing_servers():
     """Kill any Python processes that might be using port 5000."""
     try:
@@ -18,7 +37,7 @@ def kill_existing_servers():
                          capture_output=True, check=False)
         else:
             # Unix/Linux/Mac
-            subprocess.run(["pkill", "-f", "python.*app.py"], 
+            subprocess.run(["pkill", "-f", "python.*(app|asgi).py"], 
                          capture_output=True, check=False)
         time.sleep(2)  # Wait for processes to die
         print("✓ Killed existing Python processes")
@@ -36,8 +55,12 @@ def main():
     print("=" * 60)
     print()
     
-    # Kill existing servers
-    kill_existing_servers()
+    use_prefork = hasattr(os, "fork") and not {"--asgi", "--dev"} & set(sys.argv[1:])
+    if use_prefork:
+        stop_previous_server(backend_dir / "server.pid")
+    else:
+        # Kill existing servers
+        kill_existing_servers()
     
     # Check if database exists
     db_file = backend_dir / "library.db"
@@ -47,15 +70,23 @@ def main():
         print()
     
     # Start server
-    print("Starting Flask server on http://127.0.0.1:5000")
+    print("Starting server on http://127.0.0.1:5000")
     print("Press CTRL+C to stop the server")
     print("=" * 60)
     print()
     
     try:
-        # Import and run the app
-        from app import app
-        app.run(host="127.0.0.1", port=5000, debug=False)
+        if use_prefork:
+            import prefork
+            prefork.main()
+        elif "--asgi" in sys.argv:
+            import asgi
+            sys.argv = [sys.argv[0]]
+            asgi.main()
+        else:
+            # Import and run the app
+            from app import app
+            app.run(host="127.0.0.1", port=5000, debug=False)
     except KeyboardInterrupt:
         print("\n\nServer stopped by user.")
     except Exception as e:
@@ -0,0 +1,189 @@
+"""In-memory prefix index behind /api/search/suggest.
+
+Every title and author name is indexed under each of its word starts
+("harry potter" is found by "har" and by "pot") in one sorted key array,
+and ranked by how often the books were borrowed. The top completions for
+every prefix of up to PRECOMPUTED_PREFIX_LEN characters are precomputed, so
+short prefixes (most typeahead traffic) are a single dict lookup; longer
+prefixes bisect the key array.
+
+The index is built on first use (app.py warms it at server start) and
+checked for new BOOK/AUTHORS rows every REFRESH_CHECK_SECONDS, so rows added
+by data_import.py are merged in without a restart. Loan counts are re-read
+in full every POPULARITY_REFRESH_SECONDS. Refreshes run in a background
+thread and swap in a new immutable snapshot.
+"""
+import heapq
+import threading
+import time
+from bisect import bisect_left
+
+from db import get_db
+
+PRECOMPUTED_PREFIX_LEN = 3
+MAX_SUGGESTIONS = 50
+REFRESH_CHECK_SECONDS = 30
+POPULARITY_REFRESH_SECONDS = 3600
+
+TITLE_POPULARITY_SQL = """
+SELECT b.title AS text, COUNT(bl.loan_id) AS loans
+FROM BOOK b
+LEFT JOIN BOOK_LOANS bl ON bl.isbn = b.isbn_primary
+WHERE b.rowid > ?
+GROUP BY b.isbn_primary
+"""
+
+AUTHOR_POPULARITY_SQL = """
+SELECT a.name AS text, COUNT(bl.loan_id) AS loans
+FROM AUTHORS a
+LEFT JOIN BOOK_AUTHORS ba ON ba.author_id = a.author_id
+LEFT JOIN BOOK_LOANS bl ON bl.isbn = ba.isbn_primary
+WHERE a.author_id > ?
+GROUP BY a.author_id
+"""
+
+WATERMARK_SQL = """
+SELECT (SELECT COALESCE(MAX(rowid), 0) FROM BOOK) AS books,
+       (SELECT COALESCE(MAX(author_id), 0) FROM AUTHORS) AS authors
+"""
+
+
+def word_keys(text):
+    """Lower-cased suffixes of text starting at each word."""
+    words = text.lower().split()
+    return {" ".join(words[i:]) for i in range(len(words))}
+
+
+class SuggestSnapshot:
+    """Immutable sorted-key index over (text, type) -> loan count."""
+
+    def __init__(self, popularity, book_watermark, author_watermark, loans_read_at=None):
+        self.popularity = popularity
+        self.book_watermark = book_watermark
+        self.author_watermark = author_watermark
+        # When loan counts were last read in full (incremental merges keep it)
+        self.loans_read_at = time.monotonic() if loans_read_at is None else loans_read_at
+
+        # Entries sorted by rank: most borrowed first, then alphabetically
+        self.entries = sorted(popularity, key=lambda e: (-popularity[e], e[0].lower(), e[1]))
+        pairs = []
+        for entry_id, (text, _) in enumerate(self.entries):
+            for key in word_keys(text):
+                pairs.append((key, entry_id))
+        pairs.sort()
+        self.keys = [key for key, _ in pairs]
+        self.ids = [entry_id for _, entry_id in pairs]
+
+        # Entry ids are already in rank order, so the first MAX_SUGGESTIONS
+        # distinct ids seen per prefix (walking ids in rank order) are its top list
+        self.top = {}
+        by_rank = sorted(range(len(pairs)), key=lambda i: self.ids[i])
+        for i in by_rank:
+            key, entry_id = self.keys[i], self.ids[i]
+            for n in range(1, min(len(key), PRECOMPUTED_PREFIX_LEN) + 1):
+                top = self.top.setdefault(key[:n], [])
+                if len(top) < MAX_SUGGESTIONS and (not top or top[-1] != entry_id):
+                    top.append(entry_id)
+
+    def suggest(self, prefix, limit):
+        prefix = " ".join(prefix.lower().split())
+        if not prefix:
+            return []
+        if len(prefix) <= PRECOMPUTED_PREFIX_LEN:
+            ids = self.top.get(prefix, [])[:limit]
+        else:
+            lo = bisect_left(self.keys, prefix)
+            hi = bisect_left(self.keys, prefix + "\uffff", lo)
+            ids = heapq.nsmallest(limit, set(self.ids[lo:hi]))
+        return [
+            {"text": text, "type": kind, "loans": self.popularity[(text, kind)]}
+            for text, kind in (self.entries[i] for i in ids)
+        ]
+
+
+def load_popularity(conn, book_watermark=0, author_watermark=0):
+    """Return {(text, type): loans} for BOOK/AUTHORS rows above the watermarks."""
+    popularity = {}
+    for sql, kind, watermark in (
+        (TITLE_POPULARITY_SQL, "title", book_watermark),
+        (AUTHOR_POPULARITY_SQL, "author", author_watermark),
+    ):
+        for row in conn.execute(sql, (watermark,)):
+            text = (row["text"] or "").strip()
+            if text:
+                key = (text, kind)
+                popularity[key] = popularity.get(key, 0) + row["loans"]
+    return popularity
+
+
+def build_snapshot(previous=None):
+    """Build a full snapshot, or merge rows added since previous into a copy of it."""
+    conn = get_db()
+    try:
+        marks = conn.execute(WATERMARK_SQL).fetchone()
+        if previous is not None and (
+            marks["books"] < previous.book_watermark
+            or marks["authors"] < previous.author_watermark
+        ):
+            previous = None  # Tables were cleared and reloaded
+        if previous is None:
+            popularity = load_popularity(conn)
+        else:
+            if (marks["books"], marks["authors"]) == (
+                previous.book_watermark, previous.author_watermark
+            ):
+                return previous
+            popularity = dict(previous.popularity)
+            added = load_popularity(conn, previous.book_watermark, previous.author_watermark)
+            for key, loans in added.items():
+                popularity[key] = popularity.get(key, 0) + loans
+    finally:
+        conn.close()
+    loans_read_at = previous.loans_read_at if previous is not None else None
+    return SuggestSnapshot(popularity, marks["books"], marks["authors"], loans_read_at)
+
+
+_snapshot = None
+_lock = threading.Lock()
+_checked_at = 0.0
+_refreshing = False
+
+
+def _refresh(full):
+    global _snapshot, _refreshing
+    try:
+        snapshot = build_snapshot(None if full else _snapshot)
+        _snapshot = snapshot
+    finally:
+        _refreshing = False
+
+
+def get_snapshot():
+    """Return the current snapshot, building it if needed and refreshing when due."""
+    global _snapshot, _checked_at, _refreshing
+    if _snapshot is None:
+        with _lock:
+            if _snapshot is None:
+                _snapshot = build_snapshot()
+                _checked_at = time.monotonic()
+        return _snapshot
+
+    now = time.monotonic()
+    if now - _checked_at >= REFRESH_CHECK_SECONDS and not _refreshing:
+        with _lock:
+            if not _refreshing:
+                _refreshing = True
+                _checked_at = now
+                full = now - _snapshot.loans_read_at >= POPULARITY_REFRESH_SECONDS
+                threading.Thread(target=_refresh, args=(full,), daemon=True).start()
+    return _snapshot
+
+
+def suggest(prefix, limit=10):
+    """Top completions for prefix as [{"text", "type", "loans"}]."""
+    return get_snapshot().suggest(prefix, limit)
+
+
+def warm_up():
+    """Build the index in the background so the first keystroke doesn't wait."""
+    threading.Thread(target=get_snapshot, daemon=True).start()
@@ -0,0 +1,82 @@
+"""Per-worker heartbeat files for the pre-fork server (prefork.py).
+
+Each worker writes worker-<pid>.json into LIBRARY_WORKER_STATUS_DIR every
+HEARTBEAT_SECONDS once it is accepting requests. The launcher uses the first
+heartbeat as the readiness signal during reloads, and /api/health/workers
+reports every worker's last heartbeat. Standard library only, so the
+launcher can use it without importing the app.
+"""
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+HEARTBEAT_SECONDS = 5
+# A worker that hasn't written for this long is reported unhealthy
+STALE_SECONDS = 3 * HEARTBEAT_SECONDS
+
+STATUS_DIR = os.environ.get("LIBRARY_WORKER_STATUS_DIR")
+WORKER_ID = os.environ.get("LIBRARY_WORKER_ID")
+GENERATION = int(os.environ.get("LIBRARY_WORKER_GENERATION", "0"))
+STARTED = time.time()
+
+
+def status_path(status_dir, pid):
+    return Path(status_dir) / f"worker-{pid}.json"
+
+
+def current_worker():
+    """Identity of this process; worker_id is None outside the launcher."""
+    return {
+        "pid": os.getpid(),
+        "worker_id": int(WORKER_ID) if WORKER_ID is not None else None,
+        "generation": GENERATION,
+        "started": round(STARTED, 3),
+    }
+
+
+def write_status(status_dir, details):
+    status = dict(current_worker(), heartbeat=round(time.time(), 3), **details)
+    path = status_path(status_dir, os.getpid())
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(status))
+    os.replace(tmp, path)
+
+
+def start_heartbeat(ready, details):
+    """Write heartbeats from a daemon thread once ready() is true.
+
+    details() returns extra fields (request counts, pool stats) per beat.
+    Does nothing when not running under the launcher.
+    """
+    if not STATUS_DIR:
+        return
+
+    def beat():
+        while not ready():
+            time.sleep(0.05)
+        while True:
+            try:
+                write_status(STATUS_DIR, details())
+            except OSError:
+                pass  # Status dir removed: the launcher is shutting down
+            time.sleep(HEARTBEAT_SECONDS)
+
+    threading.Thread(target=beat, name="worker-heartbeat", daemon=True).start()
+
+
+def read_statuses(status_dir):
+    """Every worker's last heartbeat with its age and a healthy flag, by worker_id."""
+    now = time.time()
+    statuses = []
+    for path in Path(status_dir).glob("worker-*.json"):
+        try:
+            status = json.loads(path.read_text())
+        except (OSError, ValueError):
+            continue  # Removed or replaced mid-read
+        status["age_seconds"] = round(now - status["heartbeat"], 3)
+        status["healthy"] = status["age_seconds"] < STALE_SECONDS
+        statuses.append(status)
+    statuses.sort(key=lambda s: (s["worker_id"] is None, s["worker_id"], s["generation"]))
+    return statuses
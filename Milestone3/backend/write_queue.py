@@ -0,0 +1,201 @@
+"""Single writer thread applying loan mutations in group-commit batches.
+
+Routes validate their input, then submit() a mutation: a function that
+takes a cursor, runs its checks and writes, and returns the route's result.
+The writer takes whatever is queued, up to MAX_BATCH mutations, and runs
+them in one BEGIN IMMEDIATE
+transaction, each inside its own savepoint so one failure only undoes that
+mutation. While the previous batch held more than one mutation (i.e. under
+load) it also waits up to MAX_WAIT_MS for more to arrive; a lone checkout
+on an idle server is applied immediately. One commit (and one WAL append)
+then covers the whole batch, and request threads never compete for
+SQLite's write lock.
+
+Each caller gets back its own return value or exception. after_commit
+callbacks (in-memory state updates) run only once the batch has committed;
+one that raises is logged and counted, and the caller still gets the
+committed result.
+A caller waits at most SUBMIT_TIMEOUT_SECONDS (LIBRARY_WRITE_TIMEOUT_SECONDS)
+and then gets WriteTimeout; a mutation still queued at that point is
+dropped, never applied.
+
+Every server worker process has its own writer; across processes writes
+still serialize on the database lock (waiting up to the connection's busy
+timeout).
+"""
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+from db import get_db
+
+MAX_BATCH = 64
+MAX_WAIT_MS = 2
+SUBMIT_TIMEOUT_SECONDS = float(os.environ.get("LIBRARY_WRITE_TIMEOUT_SECONDS", "30"))
+
+_queue = queue.Queue()
+_lock = threading.Lock()
+_writer = None
+_stats = {"batches": 0, "mutations": 0, "largest_batch": 0, "after_commit_errors": 0}
+_last_batch_size = 0
+
+logger = logging.getLogger("library.write_queue")
+
+
+class WriteTimeout(Exception):
+    """submit() gave up waiting; applied says whether the write may still land."""
+
+    def __init__(self, applied):
+        self.applied = applied
+        if applied:
+            message = "Timed out waiting for the write to finish; it may still be applied"
+        else:
+            message = "Write queue is busy; the change was not applied"
+        super().__init__(message)
+
+
+class _Mutation:
+    __slots__ = ("apply", "future", "result", "error", "after_commit")
+
+    def __init__(self, apply, after_commit):
+        self.apply = apply
+        self.future = Future()
+        self.result = None
+        self.error = None
+        self.after_commit = after_commit
+
+
+def _collect(first):
+    batch = [first]
+    wait_ms = MAX_WAIT_MS if _last_batch_size > 1 else 0
+    deadline = time.monotonic() + wait_ms / 1000
+    while len(batch) < MAX_BATCH:
+        remaining = deadline - time.monotonic()
+        try:
+            item = _queue.get(timeout=remaining) if remaining > 0 else _queue.get_nowait()
+        except queue.Empty:
+            break
+        if item is None:
+            _queue.put(None)  # Re-queue the stop marker for the main loop
+            break
+        batch.append(item)
+    return batch
+
+
+def _apply_batch(batch):
+    # Skip mutations whose caller already timed out
+    batch = [mutation for mutation in batch if mutation.future.set_running_or_notify_cancel()]
+    if not batch:
+        return
+    conn = None
+    try:
+        conn = get_db()
+        cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        for i, mutation in enumerate(batch):
+            cursor.execute(f"SAVEPOINT m{i}")
+            try:
+                mutation.result = mutation.apply(cursor)
+                cursor.execute(f"RELEASE m{i}")
+            except Exception as e:
+                cursor.execute(f"ROLLBACK TO m{i}")
+                cursor.execute(f"RELEASE m{i}")
+                mutation.error = e
+        conn.commit()
+    except Exception as e:
+        if conn is not None:
+            try:
+                conn.rollback()
+            except Exception:
+                pass
+        for mutation in batch:
+            mutation.future.set_exception(e)
+        return
+    finally:
+        if conn is not None:
+            conn.close()
+
+    with _lock:
+        _stats["batches"] += 1
+        _stats["mutations"] += len(batch)
+        _stats["largest_batch"] = max(_stats["largest_batch"], len(batch))
+    for mutation in batch:
+        if mutation.error is not None:
+            mutation.future.set_exception(mutation.error)
+            continue
+        if mutation.after_commit is not None:
+            try:
+                mutation.after_commit(mutation.result)
+            except Exception:
+                # The write is committed: failing the caller now would make a
+                # retry look like a duplicate. Memory catches up on its next sync.
+                logger.exception("after_commit callback failed for a committed write")
+                with _lock:
+                    _stats["after_commit_errors"] += 1
+        mutation.future.set_result(mutation.result)
+
+
+def _run():
+    global _last_batch_size
+    while True:
+        first = _queue.get()
+        if first is None:
+            return
+        batch = _collect(first)
+        _last_batch_size = len(batch)
+        try:
+            _apply_batch(batch)
+        except Exception as e:
+            # Never let one bad batch stop the writer or strand its callers
+            for mutation in batch:
+                if not mutation.future.done():
+                    mutation.future.set_exception(e)
+
+
+def _ensure_writer():
+    global _writer
+    if _writer is None or not _writer.is_alive():
+        with _lock:
+            if _writer is None or not _writer.is_alive():
+                _writer = threading.Thread(target=_run, name="loan-writer", daemon=True)
+                _writer.start()
+
+
+def submit(apply, after_commit=None, timeout=SUBMIT_TIMEOUT_SECONDS):
+    """Run apply(cursor) in the next write batch and return its result.
+
+    after_commit(result) is called once the batch has committed. Exceptions
+    raised by apply (or by the commit) are re-raised here; WriteTimeout if
+    no result arrives within timeout seconds.
+    """
+    _ensure_writer()
+    mutation = _Mutation(apply, after_commit)
+    _queue.put(mutation)
+    try:
+        return mutation.future.result(timeout=timeout)
+    except FutureTimeout:
+        if mutation.future.cancel():
+            raise WriteTimeout(applied=False) from None
+        raise WriteTimeout(applied=True) from None
+
+
+def stop():
+    """Apply everything already queued, then stop the writer thread."""
+    global _writer
+    with _lock:
+        writer = _writer
+    if writer is not None and writer.is_alive():
+        _queue.put(None)
+        writer.join()
+    _writer = None
+
+
+def queue_stats():
+    with _lock:
+        stats = dict(_stats)
+    stats["queued"] = _queue.qsize()
+    stats["average_batch"] = round(stats["mutations"] / stats["batches"], 2) if stats["batches"] else 0.0
+    return stats
@@ -18,6 +18,23 @@
     async searchBooks(query) {
       return realFetch(`/search?q=${encodeURIComponent(query)}`);
     },
+    async searchBooksPage(query, limit, cursor = '') {
+      const params = new URLSearchParams({ q: query, limit: String(limit) });
+      if (cursor) params.append('cursor', cursor);
+      const res = await fetch(`${config.apiBase}/search?${params.toString()}`, {
+        headers: { 'Content-Type': 'application/json' },
+      });
+      const data = await res.json();
+      if (!res.ok) {
+        throw new Error(data?.error || 'Request failed');
+      }
+      return {
+        rows: data,
+        total: Number(res.headers.get('X-Total-Count') || data.length),
+        estimated: res.headers.get('X-Total-Count-Estimated') === 'true',
+        nextCursor: res.headers.get('X-Next-Cursor') || '',
+      };
+    },
     async checkout(isbn, card_no) {
       return realFetch('/checkout', { method: 'POST', body: JSON.stringify({ isbn, borrower_card_no: card_no }) });
     },
@@ -44,7 +61,18 @@
       if (isbn) params.append('isbn', isbn);
       if (card_no) params.append('card_no', card_no);
       if (borrower_name) params.append('borrower_name', borrower_name);
-      return realFetch(`/checkin/search?${params.toString()}`);
+      const res = await fetch(`${config.apiBase}/checkin/search?${params.toString()}`, {
+        headers: { 'Content-Type': 'application/json' },
+      });
+      const data = await res.json();
+      if (!res.ok) {
+        throw new Error(data?.error || 'Request failed');
+      }
+      // The server returns at most 50 loans (due soonest first)
+      return {
+        rows: data,
+        truncated: res.headers.get('X-Truncated') === 'true',
+      };
     },
     async payFines(card_no) {
       return realFetch('/fines/pay', { method: 'POST', body: JSON.stringify({ card_no }) });
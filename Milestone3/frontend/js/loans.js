@@ -71,9 +71,14 @@
     
     setStatus('Searching...', 'primary');
     try {
-      const loans = await api.searchCheckinLoans(isbn, card, name);
+      const { rows: loans, truncated } = await api.searchCheckinLoans(isbn, card, name);
       renderCheckinResults(loans);
-      setStatus(`Found ${loans.length} active loan(s).`, 'success');
+      document.getElementById('checkinTruncatedNotice').style.display = truncated ? 'block' : 'none';
+      if (truncated) {
+        setStatus(`Showing the first ${loans.length} active loans (due soonest); more match. Refine the search to see the rest.`, 'warning');
+      } else {
+        setStatus(`Found ${loans.length} active loan(s).`, 'success');
+      }
     } catch (err) {
       setStatus(`Error: ${err.message}`, 'danger');
     }
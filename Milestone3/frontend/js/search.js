@@ -1,7 +1,9 @@
 (() => {
   const api = window.demoApi;
+  const PAGE_SIZE = 100;
   let selectedIsbns = new Set();
   let currentResults = [];
+  let nextCursor = '';
 
   function updateCheckoutSection() {
     const section = document.getElementById('checkoutSection');
@@ -12,11 +14,11 @@
     }
   }
 
-  function renderResults(rows) {
-    currentResults = rows;
+  function renderResults(rows, append = false) {
+    currentResults = append ? currentResults.concat(rows) : rows;
     const tbody = document.getElementById('resultsBody');
-    tbody.innerHTML = '';
-    if (!rows.length) {
+    if (!append) tbody.innerHTML = '';
+    if (!currentResults.length) {
       tbody.innerHTML = '<tr><td colspan="6" class="text-center text-muted">No results.</td></tr>';
       selectedIsbns.clear();
       updateCheckoutSection();
@@ -42,36 +44,59 @@
       tbody.appendChild(tr);
     });
     
-    // Add event listeners to checkboxes
-    document.querySelectorAll('.book-checkbox').forEach(cb => {
-      cb.addEventListener('change', function() {
-        const isbn = this.getAttribute('data-isbn');
-        if (this.checked) {
-          selectedIsbns.add(isbn);
-        } else {
-          selectedIsbns.delete(isbn);
-        }
-        updateCheckoutSection();
-      });
-    });
-    
     updateCheckoutSection();
   }
 
+  // One listener on the table body covers every row, including appended pages
+  function handleCheckboxChange(e) {
+    const cb = e.target;
+    if (!cb.classList.contains('book-checkbox')) return;
+    const isbn = cb.getAttribute('data-isbn');
+    if (cb.checked) {
+      selectedIsbns.add(isbn);
+    } else {
+      selectedIsbns.delete(isbn);
+    }
+    updateCheckoutSection();
+  }
+
+  function updateStatus(total, estimated) {
+    const status = document.getElementById('searchStatus');
+    const totalText = estimated ? `${total}+` : `${total}`;
+    status.textContent = currentResults.length < total || estimated
+      ? `Showing ${currentResults.length} of ${totalText} result(s).`
+      : `${total} result(s).`;
+    document.getElementById('loadMoreBtn').style.display = nextCursor ? 'inline-block' : 'none';
+  }
+
   async function doSearch() {
     const q = document.getElementById('searchInput').value || '';
     const status = document.getElementById('searchStatus');
     status.textContent = 'Searching...';
     try {
-      const rows = await api.searchBooks(q);
+      const page = await api.searchBooksPage(q, PAGE_SIZE);
       selectedIsbns.clear();
-      renderResults(rows);
-      status.textContent = `${rows.length} result(s).`;
+      nextCursor = page.nextCursor;
+      renderResults(page.rows);
+      updateStatus(page.total, page.estimated);
     } catch (err) {
       status.textContent = `Error: ${err.message}`;
     }
   }
 
+  async function loadMore() {
+    const q = document.getElementById('searchInput').value || '';
+    if (!nextCursor) return;
+    try {
+      const page = await api.searchBooksPage(q, PAGE_SIZE, nextCursor);
+      nextCursor = page.nextCursor;
+      renderResults(page.rows, true);
+      updateStatus(page.total, page.estimated);
+    } catch (err) {
+      document.getElementById('searchStatus').textContent = `Error: ${err.message}`;
+    }
+  }
+
   async function handleCheckoutSelected() {
     const card = document.getElementById('checkoutCardFromSearch').value.trim();
     if (!card) {
@@ -126,6 +151,8 @@
     document.getElementById('searchInput').addEventListener('keypress', (e) => {
       if (e.key === 'Enter') doSearch();
     });
+    document.getElementById('loadMoreBtn').addEventListener('click', loadMore);
+    document.getElementById('resultsBody').addEventListener('change', handleCheckboxChange);
     document.getElementById('checkoutSelectedBtn').addEventListener('click', handleCheckoutSelected);
     document.getElementById('clearSelectionBtn').addEventListener('click', handleClearSelection);
   });